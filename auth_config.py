@@ -20,21 +20,47 @@ AUTH_CONFIG = {
     'password_min_length': 8,
     'require_email_verification': True,
     
+    # JWT 設置；密鑰必須由環境變數提供，未設置時 AuthenticationSystem 啟動即報錯
+    'jwt_secret': os.environ.get('JWT_SECRET'),
+    'jwt_algorithm': 'HS256',
+    'jwt_expiry': timedelta(hours=24),
+    # 已驗證 Token 的本地緩存條目上限（0 表示停用）
+    'jwt_cache_size': 10000,
+    
     # OAuth2 提供者設置
     'oauth2_providers': {
         'google': {
             'enabled': True,
-            'scopes': ['email', 'profile']
+            'scopes': ['email', 'profile'],
+            'token_url': 'https://oauth2.googleapis.com/token',
+            'userinfo_url': 'https://www.googleapis.com/oauth2/v2/userinfo'
         },
         'line': {
             'enabled': True,
-            'scopes': ['profile', 'openid', 'email']
+            'scopes': ['profile', 'openid', 'email'],
+            'token_url': 'https://api.line.me/oauth2/v2.1/token',
+            'profile_url': 'https://api.line.me/v2/profile'
         },
         'telegram': {
             'enabled': True
         }
     },
     
+    # 進程內會話緩存：TTL（秒）、條目上限及撤銷通知頻道
+    'session_cache': {
+        'ttl': 5,
+        'max_size': 10000,
+        'invalidation_channel': 'session:revoked'
+    },
+    
+    # OAuth 請求共用的 HTTP 連接池與超時（秒）
+    'http_client': {
+        'pool_limit': 100,
+        'pool_limit_per_host': 20,
+        'timeout': 10,
+        'connect_timeout': 5
+    },
+    
     # 安全設置
     'security': {
         'enable_2fa': True,
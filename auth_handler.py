@@ -1,18 +1,170 @@
 from fastapi import FastAPI, Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2AuthorizationCodeBearer
 from datetime import datetime
+from collections import OrderedDict
+import hashlib
+import time
+import asyncio
 import jwt
-from typing import Optional
+from typing import Optional, Tuple
+import aiohttp
 import redis
-from auth_config import AUTH_CONFIG
+from auth_config import AUTH_CONFIG, DB_CONFIG, REDIS_CONFIG
 from database_handler import DatabaseManager
-import requests
+from instrumentation import timed, incr
+
+def token_digest(token: str) -> bytes:
+    return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+class VerifiedTokenCache:
+    """已驗證 JWT 的有界 LRU 緩存，以 Token 摘要為鍵，條目在 Token 的 exp 時失效"""
+    
+    def __init__(self, max_size: int = 10000):
+        self.max_size = max_size
+        self._entries: 'OrderedDict[bytes, tuple]' = OrderedDict()
+    
+    def get(self, token: str) -> Optional[dict]:
+        key = token_digest(token)
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        payload, expires_at = entry
+        if expires_at <= time.time():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return dict(payload)
+    
+    def put(self, token: str, payload: dict):
+        expires_at = payload.get('exp')
+        if expires_at is None:
+            return
+        key = token_digest(token)
+        self._entries[key] = (dict(payload), float(expires_at))
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+    
+    def evict(self, token: str):
+        self._entries.pop(token_digest(token), None)
+    
+    def clear(self):
+        self._entries.clear()
+    
+    def __len__(self) -> int:
+        return len(self._entries)
+
+class RevokedTokens:
+    """已撤銷但尚未過期的 Token 摘要，與驗證緩存無關，每次驗證都會檢查
+    
+    撤銷只在當前進程內生效；多個 worker 部署時需在每個進程撤銷，
+    或改用 CloudAuthSystem 以 Redis 保存並經 pub/sub 撤銷的會話。
+    """
+    
+    def __init__(self, prune_threshold: int = 10000):
+        self.prune_threshold = prune_threshold
+        self._revoked: dict = {}
+    
+    def is_revoked(self, token: str) -> bool:
+        if not self._revoked:
+            return False
+        key = token_digest(token)
+        expires_at = self._revoked.get(key)
+        if expires_at is None:
+            return False
+        if expires_at <= time.time():
+            del self._revoked[key]
+            return False
+        return True
+    
+    def revoke(self, token: str, expires_at: Optional[float] = None):
+        """記錄至 Token 過期為止；沒有 exp 的 Token 永久撤銷"""
+        self._revoked[token_digest(token)] = float(expires_at) if expires_at is not None else float('inf')
+        # 順便清理已過期的撤銷記錄
+        if len(self._revoked) > self.prune_threshold:
+            now = time.time()
+            self._revoked = {k: v for k, v in self._revoked.items() if v > now}
+    
+    def __len__(self) -> int:
+        return len(self._revoked)
 
 class AuthenticationSystem:
-    def __init__(self):
-        self.db = DatabaseManager()
-        self.redis_client = redis.from_url(AUTH_CONFIG['session_config']['redis_url'])
+    def __init__(self, jwt_cache_size: Optional[int] = None, db: Optional[DatabaseManager] = None,
+                 redis_client=None, http_session: Optional[aiohttp.ClientSession] = None):
+        # 不使用公開的默認密鑰簽發 Token
+        if not AUTH_CONFIG.get('jwt_secret'):
+            raise RuntimeError("JWT_SECRET environment variable is not set")
+        
+        # 數據庫、Redis 與 HTTP 客戶端可由外部注入共用，否則在首次使用時建立
+        self._db = db
+        self._redis_client = redis_client
+        self._http_session = http_session
+        
+        cache_size = AUTH_CONFIG.get('jwt_cache_size', 10000) if jwt_cache_size is None else jwt_cache_size
+        self.token_cache = VerifiedTokenCache(cache_size) if cache_size > 0 else None
+        self.revoked_tokens = RevokedTokens()
+        
+    @property
+    def db(self) -> DatabaseManager:
+        if self._db is None:
+            self._db = DatabaseManager(DB_CONFIG['url'])
+        return self._db
+    
+    @property
+    def redis_client(self):
+        if self._redis_client is None:
+            self._redis_client = redis.from_url(
+                REDIS_CONFIG['url'],
+                max_connections=REDIS_CONFIG['max_connections'],
+                socket_timeout=REDIS_CONFIG['socket_timeout'],
+                socket_connect_timeout=REDIS_CONFIG['socket_connect_timeout'],
+                retry_on_timeout=REDIS_CONFIG['retry_on_timeout']
+            )
+        return self._redis_client
+    
+    def _get_http_session(self) -> aiohttp.ClientSession:
+        """取得共用的 OAuth HTTP 連接池"""
+        if self._http_session is None or self._http_session.closed:
+            http_config = AUTH_CONFIG['http_client']
+            self._http_session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(
+                    limit=http_config['pool_limit'],
+                    limit_per_host=http_config['pool_limit_per_host'],
+                    ttl_dns_cache=300
+                ),
+                timeout=aiohttp.ClientTimeout(
+                    total=http_config['timeout'],
+                    connect=http_config['connect_timeout']
+                )
+            )
+        return self._http_session
+    
+    async def _request_json(self, method: str, url: str, **kwargs) -> Tuple[int, Optional[dict]]:
+        """經共用連接池發送請求，返回狀態碼與 JSON 內容
         
+        連線錯誤、逾時與 200 但內容不是 JSON 物件的回應都視為提供者不可用（503）。
+        """
+        try:
+            async with self._get_http_session().request(method, url, **kwargs) as response:
+                if response.status != 200:
+                    return response.status, None
+                body = await response.json(content_type=None)
+                if not isinstance(body, dict):
+                    raise ValueError(f"Unexpected response body: {type(body).__name__}")
+                return response.status, body
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError):
+            raise HTTPException(
+                status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+                detail="OAuth provider unavailable"
+            )
+    
+    async def close(self):
+        """關閉 HTTP 連接池與數據庫連接"""
+        if self._http_session is not None and not self._http_session.closed:
+            await self._http_session.close()
+        if self._db is not None:
+            self._db.close()
+    
     async def create_jwt_token(self, user_data: dict) -> str:
         """創建 JWT Token"""
         payload = {
@@ -26,14 +178,28 @@ class AuthenticationSystem:
             algorithm=AUTH_CONFIG['jwt_algorithm']
         )
     
+    @timed('auth_verify_seconds')
     async def verify_jwt_token(self, token: str) -> Optional[dict]:
         """驗證 JWT Token"""
+        if self.revoked_tokens.is_revoked(token):
+            raise HTTPException(
+                status_code=status.HTTP_401_UNAUTHORIZED,
+                detail="Token has been revoked"
+            )
+        if self.token_cache is not None:
+            payload = self.token_cache.get(token)
+            if payload is not None:
+                incr('auth_token_cache_hits_total')
+                return payload
+        
         try:
             payload = jwt.decode(
                 token,
                 AUTH_CONFIG['jwt_secret'],
                 algorithms=[AUTH_CONFIG['jwt_algorithm']]
             )
+            if self.token_cache is not None:
+                self.token_cache.put(token, payload)
             return payload
         except jwt.ExpiredSignatureError:
             raise HTTPException(
@@ -46,12 +212,21 @@ class AuthenticationSystem:
                 detail="Invalid token"
             )
     
+    async def revoke_jwt_token(self, token: str):
+        """撤銷 JWT Token（僅限當前進程，見 RevokedTokens）並從本地驗證緩存中移除"""
+        try:
+            expires_at = jwt.decode(token, options={'verify_signature': False}).get('exp')
+        except Exception:
+            expires_at = None
+        self.revoked_tokens.revoke(token, expires_at)
+        if self.token_cache is not None:
+            self.token_cache.evict(token)
+    
     async def oauth2_google_login(self, code: str):
         """Google OAuth2 登入"""
         google_config = AUTH_CONFIG['oauth2_providers']['google']
         
         # 獲取訪問令牌
-        token_url = "https://oauth2.googleapis.com/token"
         token_data = {
             'code': code,
             'client_id': google_config['client_id'],
@@ -60,22 +235,22 @@ class AuthenticationSystem:
             'grant_type': 'authorization_code'
         }
         
-        token_response = requests.post(token_url, data=token_data)
-        if token_response.status_code != 200:
+        token_status, token_response = await self._request_json(
+            'POST', google_config['token_url'], data=token_data
+        )
+        if token_status != 200:
             raise HTTPException(status_code=400, detail="Failed to get access token")
             
-        access_token = token_response.json()['access_token']
+        access_token = token_response['access_token']
         
         # 獲取用戶信息
-        user_info_response = requests.get(
-            'https://www.googleapis.com/oauth2/v2/userinfo',
+        user_info_status, user_info = await self._request_json(
+            'GET', google_config['userinfo_url'],
             headers={'Authorization': f'Bearer {access_token}'}
         )
         
-        if user_info_response.status_code != 200:
+        if user_info_status != 200:
             raise HTTPException(status_code=400, detail="Failed to get user info")
-            
-        user_info = user_info_response.json()
         
         # 創建或更新用戶
         user_data = await self.db.create_or_update_user({
@@ -94,8 +269,8 @@ class AuthenticationSystem:
         line_config = AUTH_CONFIG['oauth2_providers']['line']
         
         # 獲取訪問令牌
-        token_response = requests.post(
-            'https://api.line.me/oauth2/v2.1/token',
+        token_status, token_response = await self._request_json(
+            'POST', line_config['token_url'],
             data={
                 'grant_type': 'authorization_code',
                 'code': code,
@@ -105,21 +280,19 @@ class AuthenticationSystem:
             }
         )
         
-        if token_response.status_code != 200:
+        if token_status != 200:
             raise HTTPException(status_code=400, detail="Failed to get LINE access token")
             
-        access_token = token_response.json()['access_token']
+        access_token = token_response['access_token']
         
         # 獲取用戶信息
-        profile_response = requests.get(
-            'https://api.line.me/v2/profile',
+        profile_status, profile = await self._request_json(
+            'GET', line_config['profile_url'],
             headers={'Authorization': f'Bearer {access_token}'}
         )
         
-        if profile_response.status_code != 200:
+        if profile_status != 200:
             raise HTTPException(status_code=400, detail="Failed to get LINE profile")
-            
-        profile = profile_response.json()
         
         # 創建或更新用戶
         user_data = await self.db.create_or_update_user({
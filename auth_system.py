@@ -6,10 +6,39 @@ import logging
 from typing import Optional, Dict, Any
 from auth_config import FIREBASE_CONFIG, AUTH_CONFIG
 import aioredis
+import asyncio
+import copy
 import json
+import time
+from collections import OrderedDict
+from rate_limiter import KeyedRateLimiter
+
+# 令牌桶限流：讀取、補充、扣減與設置過期在同一次往返內原子完成
+RATE_LIMIT_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local ttl = tonumber(ARGV[4])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1])
+local ts = tonumber(bucket[2])
+if tokens == nil then
+    tokens = capacity
+    ts = now
+end
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+local allowed = 0
+if tokens >= 1 then
+    tokens = tokens - 1
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 'tokens', tokens, 'ts', now)
+redis.call('PEXPIRE', KEYS[1], ttl)
+return allowed
+"""
 
 class CloudAuthSystem:
-    def __init__(self):
+    def __init__(self, redis_client=None):
         # 初始化 Firebase
         try:
             cred = credentials.Certificate(FIREBASE_CONFIG)
@@ -18,12 +47,71 @@ class CloudAuthSystem:
             self.firebase_app = firebase_admin.get_app()
             
         # 初始化 Redis 連接
-        self.redis = aioredis.from_url(
+        self.redis = redis_client or aioredis.from_url(
             AUTH_CONFIG.get('redis_url', 'redis://localhost:6379/0')
         )
         
         # 設置日誌
         self.logger = logging.getLogger(__name__)
+        
+        # 進程內會話緩存（短 TTL），撤銷時經 Redis pub/sub 通知所有進程失效
+        cache_config = AUTH_CONFIG['session_cache']
+        self.session_cache_ttl = cache_config['ttl']
+        self.session_cache_size = cache_config['max_size']
+        self.invalidation_channel = cache_config['invalidation_channel']
+        self._session_cache: 'OrderedDict[str, tuple]' = OrderedDict()
+        self._invalidation_task: Optional[asyncio.Task] = None
+        
+        # 原子限流腳本，Redis 不可用時退回進程內令牌桶
+        rate_limit = AUTH_CONFIG['security']['rate_limit']
+        self.rate_limit_capacity = rate_limit['max_attempts']
+        self.rate_limit_window = rate_limit['window'].total_seconds()
+        self._rate_limit_script = self.redis.register_script(RATE_LIMIT_SCRIPT)
+        self._local_rate_limiter = KeyedRateLimiter(
+            self.rate_limit_capacity / self.rate_limit_window,
+            self.rate_limit_capacity
+        )
+    
+    def _cache_get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        entry = self._session_cache.get(session_id)
+        if entry is None:
+            return None
+        cached_until, session = entry
+        if cached_until <= time.monotonic():
+            del self._session_cache[session_id]
+            return None
+        return session
+    
+    def _cache_put(self, session_id: str, session: Dict[str, Any]):
+        self._session_cache[session_id] = (time.monotonic() + self.session_cache_ttl, session)
+        self._session_cache.move_to_end(session_id)
+        if len(self._session_cache) > self.session_cache_size:
+            self._session_cache.popitem(last=False)
+    
+    def _ensure_invalidation_listener(self):
+        if self._invalidation_task is None or self._invalidation_task.done():
+            self._invalidation_task = asyncio.create_task(self._listen_for_invalidations())
+    
+    async def _listen_for_invalidations(self):
+        """訂閱會話撤銷頻道，從進程內緩存移除已撤銷的會話"""
+        while True:
+            try:
+                pubsub = self.redis.pubsub()
+                await pubsub.subscribe(self.invalidation_channel)
+                async for message in pubsub.listen():
+                    if message['type'] != 'message':
+                        continue
+                    session_id = message['data']
+                    if isinstance(session_id, bytes):
+                        session_id = session_id.decode()
+                    self._session_cache.pop(session_id, None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # 訂閱中斷期間可能錯過撤銷通知，清空緩存後重連
+                self.logger.error(f"Session invalidation listener failed: {str(e)}")
+                self._session_cache.clear()
+                await asyncio.sleep(1)
     
     async def handle_social_login(self, provider: str) -> Optional[Dict[str, Any]]:
         """處理社交媒體登入"""
@@ -54,16 +142,23 @@ class CloudAuthSystem:
     async def verify_session(self, session_id: str) -> Optional[Dict[str, Any]]:
         """驗證會話"""
         try:
-            session_data = await self.redis.get(f"session:{session_id}")
-            if not session_data:
-                return None
-                
-            session = json.loads(session_data)
+            self._ensure_invalidation_listener()
+            
+            session = self._cache_get(session_id)
+            if session is None:
+                session_data = await self.redis.get(f"session:{session_id}")
+                if not session_data:
+                    return None
+                session = json.loads(session_data)
+                self._cache_put(session_id, session)
+            
             if datetime.fromisoformat(session['expires']) < datetime.now():
+                self._session_cache.pop(session_id, None)
                 await self.redis.delete(f"session:{session_id}")
                 return None
                 
-            return session
+            # 返回副本，調用方修改時不影響緩存
+            return copy.deepcopy(session)
             
         except Exception as e:
             self.logger.error(f"Session verification failed: {str(e)}")
@@ -93,6 +188,8 @@ class CloudAuthSystem:
                 json.dumps(session_data),
                 ex=int(AUTH_CONFIG['session_lifetime'].total_seconds())
             )
+            self._ensure_invalidation_listener()
+            self._cache_put(session_id, session_data)
             
             return session_id
             
@@ -102,8 +199,10 @@ class CloudAuthSystem:
     
     async def revoke_session(self, session_id: str) -> bool:
         """撤銷會話"""
+        self._session_cache.pop(session_id, None)
         try:
             await self.redis.delete(f"session:{session_id}")
+            await self.redis.publish(self.invalidation_channel, session_id)
             return True
         except Exception as e:
             self.logger.error(f"Session revocation failed: {str(e)}")
@@ -111,24 +210,28 @@ class CloudAuthSystem:
     
     async def check_rate_limit(self, user_id: str, action: str) -> bool:
         """檢查速率限制"""
+        key = f"rate_limit:{action}:{user_id}"
         try:
-            key = f"rate_limit:{action}:{user_id}"
-            count = await self.redis.incr(key)
-            
-            if count == 1:
-                await self.redis.expire(
-                    key,
-                    int(AUTH_CONFIG['security']['rate_limit']['window'].total_seconds())
-                )
-            
-            return count <= AUTH_CONFIG['security']['rate_limit']['max_attempts']
+            window_ms = self.rate_limit_window * 1000
+            allowed = await self._rate_limit_script(
+                keys=[key],
+                args=[
+                    self.rate_limit_capacity,
+                    self.rate_limit_capacity / window_ms,
+                    int(time.time() * 1000),
+                    int(window_ms)
+                ]
+            )
+            return bool(int(allowed))
             
         except Exception as e:
-            self.logger.error(f"Rate limit check failed: {str(e)}")
-            return False
+            self.logger.warning(f"Rate limit check fell back to local limiter: {str(e)}")
+            return self._local_rate_limiter.try_acquire(key) == 0
     
     def close(self):
         """關閉連接"""
+        if self._invalidation_task is not None:
+            self._invalidation_task.cancel()
         try:
             self.redis.close()
         except Exception as e:
@@ -0,0 +1,198 @@
+import hashlib
+import inspect
+import json
+import os
+import pickle
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+import pandas as pd
+
+from config import CONFIG
+
+OHLCV_COLUMNS = ['Open', 'High', 'Low', 'Close', 'Volume']
+
+def data_fingerprint(data: pd.DataFrame) -> str:
+    """K線數據的內容摘要（含時間索引），數據有任何修訂都會改變"""
+    columns = [column for column in OHLCV_COLUMNS if column in data.columns]
+    hashed = pd.util.hash_pandas_object(data[columns], index=True).to_numpy()
+    return hashlib.sha256(hashed.tobytes()).hexdigest()
+
+def strategy_fingerprint(engine, strategy, params: Optional[Dict[str, Any]] = None) -> str:
+    """策略代碼與參數的摘要：修改回測、信號、倉位或出場邏輯及其配置後舊結果自動失效"""
+    import bracket_orders
+    import risk_analytics
+    import risk_engine
+
+    sources = []
+    # 引擎與機器人類，以及它們委託的括號單、倉位計算與波動率模組
+    for component in (type(engine), type(engine.trading_bot), bracket_orders, risk_engine, risk_analytics):
+        try:
+            sources.append(inspect.getsource(component))
+        except (OSError, TypeError):
+            sources.append(getattr(component, '__qualname__', component.__name__))
+    payload = json.dumps({
+        'strategy': strategy,
+        'params': params or {},
+        'initial_capital': engine.initial_capital,
+        'brackets': getattr(engine, 'brackets', None),
+        'risk': CONFIG['risk'],
+        'risk_per_trade': engine.trading_bot.risk_per_trade,
+        'ml_min_train_rows': CONFIG['trading'].get('ml_min_train_rows'),
+        'sources': sources
+    }, sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+def _filter_range(data: pd.DataFrame, start_date=None, end_date=None) -> pd.DataFrame:
+    if start_date:
+        data = data[data.index >= start_date]
+    if end_date:
+        data = data[data.index <= end_date]
+    return data
+
+class BacktestResultCache:
+    """以內容尋址的回測結果磁碟緩存
+
+    鍵值 = 輸入K線摘要 + 策略代碼/參數摘要 + 日期範圍。每個條目保存績效指標、
+    交易記錄、權益曲線與結束時的引擎狀態；總大小超出上限時淘汰最久未使用的條目。
+    延長 end_date 時，若已有條目的K線是新數據的前綴，則從其引擎狀態續跑新增的K線。
+    """
+
+    def __init__(self, cache_dir: Optional[str] = None, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir or CONFIG['backtest']['cache_dir']
+        self.max_bytes = max_bytes or CONFIG['backtest']['cache_max_bytes']
+        os.makedirs(self.cache_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        # key -> 元數據，按最近使用排序
+        self._entries: 'OrderedDict[str, Dict[str, Any]]' = OrderedDict()
+        self._total_bytes = 0
+        self._load_index()
+
+    def _path(self, key: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.{suffix}")
+
+    def _load_index(self):
+        """從磁碟上的元數據文件重建索引，以修改時間近似最近使用順序"""
+        metas = []
+        for name in os.listdir(self.cache_dir):
+            if not name.endswith('.json'):
+                continue
+            path = os.path.join(self.cache_dir, name)
+            try:
+                with open(path) as f:
+                    meta = json.load(f)
+                metas.append((os.path.getmtime(path), meta))
+            except (OSError, ValueError):
+                continue
+        for _, meta in sorted(metas, key=lambda item: item[0]):
+            self._entries[meta['key']] = meta
+            self._total_bytes += meta['size']
+
+    def _touch(self, key: str):
+        self._entries.move_to_end(key)
+        try:
+            os.utime(self._path(key, 'json'))
+        except OSError:
+            pass
+
+    def _evict(self):
+        while self._total_bytes > self.max_bytes and len(self._entries) > 1:
+            key, meta = self._entries.popitem(last=False)
+            self._total_bytes -= meta['size']
+            for suffix in ('pkl', 'json'):
+                try:
+                    os.remove(self._path(key, suffix))
+                except OSError:
+                    pass
+
+    def _load(self, key: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._path(key, 'pkl'), 'rb') as f:
+                return pickle.load(f)
+        except (OSError, pickle.UnpicklingError, EOFError):
+            meta = self._entries.pop(key, None)
+            if meta is not None:
+                self._total_bytes -= meta['size']
+            return None
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            entry = self._load(key)
+            if entry is not None:
+                self._touch(key)
+            return entry
+
+    def put(self, key: str, meta: Dict[str, Any], entry: Dict[str, Any]):
+        payload = pickle.dumps(entry, protocol=pickle.HIGHEST_PROTOCOL)
+        meta = {**meta, 'key': key, 'size': len(payload)}
+        with self._lock:
+            # 先寫臨時文件再替換，避免並行讀取到半寫入的條目
+            tmp_path = self._path(key, 'pkl.tmp')
+            with open(tmp_path, 'wb') as f:
+                f.write(payload)
+            os.replace(tmp_path, self._path(key, 'pkl'))
+            with open(self._path(key, 'json'), 'w') as f:
+                json.dump(meta, f)
+
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self._total_bytes -= previous['size']
+            self._entries[key] = meta
+            self._total_bytes += meta['size']
+            self._evict()
+
+    def _find_prefix(self, strategy_fp: str, start_date, data: pd.DataFrame) -> Optional[Dict[str, Any]]:
+        """尋找同策略、同起始日、K線為當前數據前綴的最長緩存條目"""
+        with self._lock:
+            candidates = [
+                meta for meta in self._entries.values()
+                if meta['strategy'] == strategy_fp and meta['start_date'] == str(start_date)
+                and meta['last_timestamp'] is not None
+            ]
+        candidates.sort(key=lambda meta: meta['n_bars'], reverse=True)
+        for meta in candidates:
+            if meta['n_bars'] >= len(data):
+                continue
+            prefix = data.iloc[:meta['n_bars']]
+            if str(prefix.index[-1]) != meta['last_timestamp']:
+                continue
+            if data_fingerprint(prefix) == meta['data']:
+                entry = self.get(meta['key'])
+                if entry is not None:
+                    return entry
+        return None
+
+    async def run(self, engine, strategy, data: pd.DataFrame, start_date=None, end_date=None,
+                  params: Optional[Dict[str, Any]] = None, **run_kwargs) -> Dict[str, Any]:
+        """執行回測並緩存結果；命中時直接恢復引擎狀態並返回績效指標"""
+        data = _filter_range(data, start_date, end_date)
+        strategy_fp = strategy_fingerprint(engine, strategy, params)
+        data_fp = data_fingerprint(data)
+        key = hashlib.sha256(
+            f"{data_fp}:{strategy_fp}:{start_date}:{end_date}".encode()
+        ).hexdigest()
+
+        entry = self.get(key)
+        if entry is None:
+            prefix_entry = self._find_prefix(strategy_fp, start_date, data)
+            resume_state = prefix_entry['state'] if prefix_entry is not None else None
+            metrics = await engine.run_backtest(
+                strategy, data, resume_state=resume_state, **run_kwargs
+            )
+            entry = {'metrics': metrics, 'state': engine.get_state()}
+            self.put(key, {
+                'strategy': strategy_fp,
+                'data': data_fp,
+                'start_date': str(start_date),
+                'end_date': str(end_date),
+                'n_bars': len(data),
+                'last_timestamp': str(data.index[-1]) if len(data) else None
+            }, entry)
+            return metrics
+
+        engine.set_state(entry['state'])
+        engine.performance_metrics = entry['metrics']
+        return entry['metrics']
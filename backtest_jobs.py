@@ -0,0 +1,194 @@
+import asyncio
+import hashlib
+import json
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from config import CONFIG
+from database_handler import DatabaseManager
+
+# 推送到界面的權益曲線最多保留的點數
+MAX_CURVE_POINTS = 500
+
+def job_key(strategy: str, symbols: List[str], start_date, end_date,
+            params: Optional[Dict[str, Any]] = None) -> str:
+    """相同 (策略, 標的, 日期範圍, 參數) 的回測得到相同鍵值"""
+    payload = {
+        'strategy': strategy,
+        'symbols': sorted(symbols),
+        'start_date': str(start_date),
+        'end_date': str(end_date),
+        'params': params or {}
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+def _thin_curve(curve) -> List[list]:
+    """將權益曲線抽樣為最多 MAX_CURVE_POINTS 個點，保留最後一點"""
+    step = max(1, len(curve) // MAX_CURVE_POINTS)
+    points = curve[::step]
+    if curve and points[-1] is not curve[-1]:
+        points = points + [curve[-1]]
+    return [[str(timestamp), float(equity)] for timestamp, equity in points]
+
+async def _run_job_async(job_id: int, db_url: str, strategy: str, symbols: List[str],
+                         start_date, end_date, params: Dict[str, Any], fetcher=None):
+    from backtester import BacktestEngine
+    from backtest_cache import BacktestResultCache
+    from checkpoint import CheckpointManager
+    from seo_optimizer import AdvancedMarketDataFetcher
+
+    db = DatabaseManager(db_url)
+    try:
+        await db.update_backtest_job(job_id, {'status': 'RUNNING', 'started_at': datetime.utcnow()})
+
+        fetcher = fetcher or AdvancedMarketDataFetcher()
+        cache = BacktestResultCache()
+        # 以任務參數鍵值命名檢查點，重新提交中斷的任務時可從中斷處續跑
+        checkpoints = CheckpointManager()
+        key = job_key(strategy, symbols, start_date, end_date, params)
+        capital_per_symbol = params.get('initial_capital', CONFIG['trading']['initial_capital']) / len(symbols)
+        lookback = (datetime.now() - pd.Timestamp(start_date).to_pydatetime()).days + 1
+        results = {}
+        curves = {}
+        last_update = 0.0
+
+        for index, symbol in enumerate(symbols):
+            data = await fetcher.get_historical_data(symbol, '1d', limit=lookback, start=start_date)
+            if data is None or data.empty:
+                results[symbol] = {'error': 'no data'}
+                continue
+
+            engine = BacktestEngine(capital_per_symbol, brackets=params.get('brackets'))
+
+            async def report(done, total, curve, index=index, symbol=symbol):
+                # 進度寫入數據庫，界面輪詢讀取；按時間節流避免頻繁提交
+                nonlocal last_update
+                now = time.monotonic()
+                if done != total and now - last_update < 0.5:
+                    return
+                last_update = now
+                curves[symbol] = _thin_curve(curve)
+                await db.update_backtest_job(job_id, {
+                    'progress': (index + done / total) / len(symbols),
+                    'equity_curve': dict(curves)
+                })
+
+            # 相同數據與策略直接取緩存；延長結束日期時只模擬新增的K線
+            metrics = await cache.run(
+                engine, strategy, data, start_date, end_date, params,
+                progress_callback=report,
+                checkpoint_manager=checkpoints,
+                checkpoint_name=f"backtest-{key[:16]}-{re.sub(r'[^A-Za-z0-9]', '_', symbol)}"
+            )
+            curves[symbol] = _thin_curve(engine.equity_curve)
+            results[symbol] = json.loads(json.dumps(metrics, default=str))
+
+        await db.update_backtest_job(job_id, {
+            'status': 'COMPLETED',
+            'progress': 1.0,
+            'results': results,
+            'equity_curve': curves,
+            'finished_at': datetime.utcnow()
+        })
+    except Exception as e:
+        await db.update_backtest_job(job_id, {
+            'status': 'FAILED',
+            'error': f"{type(e).__name__}: {str(e)}",
+            'finished_at': datetime.utcnow()
+        })
+    finally:
+        db.close()
+
+def _run_job(*args):
+    """工作進程入口"""
+    asyncio.run(_run_job_async(*args))
+
+class BacktestJobManager:
+    """將回測提交到進程池執行，任務狀態與結果持久化於數據庫"""
+
+    def __init__(self, max_workers: Optional[int] = None, db_url: Optional[str] = None, fetcher=None):
+        """fetcher 為可序列化的行情接口（提供 get_historical_data），默認為 AdvancedMarketDataFetcher"""
+        self.db_url = db_url or CONFIG['database']['url']
+        self.fetcher = fetcher
+        self.db = DatabaseManager(self.db_url)
+        self.executor = ProcessPoolExecutor(max_workers=max_workers or CONFIG['backtest']['max_workers'])
+        # 本進程池中尚未結束的任務；其他 RUNNING 記錄來自已中止的進程
+        self._active = set()
+        # 數據庫會話不可跨執行緒並用（Streamlit 每個會話一個執行緒、各自的事件循環）
+        self._lock = threading.Lock()
+
+    def _locked(self, coroutine):
+        """在持鎖的執行緒中以獨立事件循環執行數據庫操作（其中不會掛起）"""
+        with self._lock:
+            return asyncio.run(coroutine)
+
+    async def _run_locked(self, coroutine):
+        # 等待鎖與數據庫 I/O 都在執行緒中進行，不阻塞調用方的事件循環
+        return await asyncio.to_thread(self._locked, coroutine)
+
+    async def submit(self, strategy: str, symbols: List[str], start_date, end_date,
+                     params: Optional[Dict[str, Any]] = None) -> Optional[int]:
+        """提交回測；相同參數的任務已完成或執行中時直接返回該任務"""
+        params = params or {}
+        key = job_key(strategy, symbols, start_date, end_date, params)
+        return await self._run_locked(self._submit(key, strategy, symbols, start_date, end_date, params))
+
+    async def _submit(self, key, strategy, symbols, start_date, end_date, params):
+        existing = await self.db.find_backtest_job(key, ['COMPLETED', 'RUNNING', 'QUEUED'])
+        if existing is not None:
+            if existing.status == 'COMPLETED' or existing.id in self._active:
+                return existing.id
+            await self.db.update_backtest_job(existing.id, {
+                'status': 'FAILED',
+                'error': 'interrupted',
+                'finished_at': datetime.utcnow()
+            })
+
+        job_id = await self.db.create_backtest_job({
+            'job_key': key,
+            'status': 'QUEUED',
+            'progress': 0.0,
+            'params': {
+                'strategy': strategy,
+                'symbols': symbols,
+                'start_date': str(start_date),
+                'end_date': str(end_date),
+                **params
+            }
+        })
+        if job_id is not None:
+            future = self.executor.submit(
+                _run_job, job_id, self.db_url, strategy, symbols,
+                str(start_date), str(end_date), params, self.fetcher
+            )
+            self._active.add(job_id)
+            future.add_done_callback(lambda _: self._active.discard(job_id))
+        return job_id
+
+    async def get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        """返回任務的狀態、進度、部分權益曲線及結果"""
+        return await self._run_locked(self._get_job(job_id))
+
+    async def _get_job(self, job_id: int) -> Optional[Dict[str, Any]]:
+        job = await self.db.get_backtest_job(job_id)
+        if job is None:
+            return None
+        return {
+            'id': job.id,
+            'status': job.status,
+            'progress': job.progress or 0.0,
+            'params': job.params,
+            'results': job.results,
+            'equity_curve': job.equity_curve or {},
+            'error': job.error
+        }
+
+    def shutdown(self, wait: bool = False):
+        self.executor.shutdown(wait=wait, cancel_futures=True)
+        self.db.close()
@@ -1,24 +1,63 @@
+import asyncio
+import copy
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import matplotlib.pyplot as plt
-from concurrent.futures import ThreadPoolExecutor
 from seo_optimizer import AdvancedTradingBot
+from bracket_orders import BRACKET_KEYS, normalize_brackets, brackets_enabled, find_bracket_exit
+from config import CONFIG
+from instrumentation import timer, timed, incr, profile_run
 
 class BacktestEngine:
-    def __init__(self, initial_capital=100000):
+    def __init__(self, initial_capital=100000, brackets=None):
+        """brackets 為默認的止損/止盈/移動止損設定（見 bracket_orders），信號中的同名欄位優先"""
         self.initial_capital = initial_capital
         self.current_capital = initial_capital
         self.positions = {}
         self.trade_history = []
+        self.equity_curve = []
         self.performance_metrics = {}
         self.trading_bot = AdvancedTradingBot(initial_capital)
+        self.brackets = normalize_brackets(
+            brackets if brackets is not None else CONFIG['backtest']['brackets']
+        )
+        # 當前回測的K線數組與已排程的括號單出場 {時間戳: [(持倉鍵, 出場價, 原因)]}
+        self._bars = None
+        self._scheduled_exits = {}
         
-    async def run_backtest(self, strategy, data, start_date=None, end_date=None):
-        """執行回測"""
-        self.current_capital = self.initial_capital
-        self.positions = {}
-        self.trade_history = []
+    async def run_backtest(self, strategy, data, start_date=None, end_date=None,
+                           progress_callback=None, progress_interval=50, resume_state=None,
+                           checkpoint_manager=None, checkpoint_name='backtest', checkpoint_interval=None,
+                           profile=None):
+        """執行回測
+
+        progress_callback(已處理K線數, 總K線數, 權益曲線) 每 progress_interval 根K線調用一次，
+        可為同步函數或協程函數。
+        resume_state 為 get_state() 的結果時，從該狀態最後一根K線之後繼續模擬。
+        指定 checkpoint_manager 時每 checkpoint_interval 根K線保存一次狀態，
+        重新執行時自動從 checkpoint_name 的最新檢查點續跑，完成後清除檢查點。
+        profile 為 True 時以 cProfile 剖析整次回測（預設依 CONFIG['instrumentation']）。
+        """
+        with profile_run('backtest', profile):
+            return await self._run_backtest(
+                strategy, data, start_date, end_date, progress_callback, progress_interval,
+                resume_state, checkpoint_manager, checkpoint_name, checkpoint_interval
+            )
+    
+    async def _run_backtest(self, strategy, data, start_date, end_date, progress_callback,
+                            progress_interval, resume_state, checkpoint_manager, checkpoint_name,
+                            checkpoint_interval):
+        if resume_state is None and checkpoint_manager is not None:
+            resume_state = await checkpoint_manager.load_latest(checkpoint_name)
+        checkpoint_interval = checkpoint_interval or CONFIG['checkpoint']['backtest_interval']
+        
+        if resume_state is not None:
+            self.set_state(resume_state)
+        else:
+            self.current_capital = self.initial_capital
+            self.positions = {}
+            self.trade_history = []
+            self.equity_curve = []
         
         # 篩選日期範圍
         if start_date:
@@ -28,16 +67,123 @@ class BacktestEngine:
             
         # 計算技術指標
         data = self.trading_bot.calculate_technical_indicators(data)
+        self._prepare_exits(data)
         
-        # 執行策略
-        for timestamp, row in data.iterrows():
-            signals = self.trading_bot.generate_advanced_signals(data.loc[:timestamp])
-            await self._execute_signals(signals, row, timestamp)
+        # 執行策略（續跑時跳過已模擬的K線；指標只依賴歷史數據，前綴結果不變）
+        total_bars = len(data)
+        start_pos = 0
+        if self.equity_curve:
+            start_pos = data.index.searchsorted(self.equity_curve[-1][0], side='right')
+        for i, (timestamp, row) in enumerate(data.iloc[start_pos:].iterrows(), start_pos + 1):
+            with timer('backtest_bar_seconds'):
+                # 括號單在K線內觸發，先於收盤價產生的信號執行
+                if timestamp in self._scheduled_exits:
+                    self._execute_exits(timestamp)
+                signals = self.trading_bot.generate_advanced_signals(data.loc[:timestamp])
+                await self._execute_signals(signals, row, timestamp)
+                self.equity_curve.append((timestamp, self._current_equity(row['Close'])))
+            incr('backtest_bars_total')
+            
+            if progress_callback is not None and (i % progress_interval == 0 or i == total_bars):
+                result = progress_callback(i, total_bars, self.equity_curve)
+                if asyncio.iscoroutine(result):
+                    await result
+            
+            if checkpoint_manager is not None and i % checkpoint_interval == 0 and i < total_bars:
+                await checkpoint_manager.save(checkpoint_name, self.get_state())
+            
+        if checkpoint_manager is not None:
+            await checkpoint_manager.clear(checkpoint_name)
             
         # 計算績效指標
         self._calculate_performance_metrics()
         return self.performance_metrics
     
+    def get_state(self):
+        """返回可序列化的引擎狀態（資金、持倉、交易記錄、權益曲線及交易機器人狀態）
+
+        技術指標由K線向量化重算且只依賴歷史數據，因此以權益曲線最後的時間戳記錄進度即可。
+        """
+        return copy.deepcopy({
+            'initial_capital': self.initial_capital,
+            'current_capital': self.current_capital,
+            'positions': self.positions,
+            'trade_history': self.trade_history,
+            'equity_curve': self.equity_curve,
+            'bot': self.trading_bot.get_state()
+        })
+    
+    def set_state(self, state):
+        """從 get_state() 的結果恢復引擎狀態"""
+        state = copy.deepcopy(state)
+        self.initial_capital = state['initial_capital']
+        self.current_capital = state['current_capital']
+        self.positions = state['positions']
+        self.trade_history = state['trade_history']
+        self.equity_curve = state['equity_curve']
+        if 'bot' in state:
+            self.trading_bot.set_state(state['bot'])
+    
+    def _prepare_exits(self, data):
+        """保存K線數組，並為已有持倉（續跑或延長數據時）重新排程出場"""
+        self._bars = {
+            'index': data.index,
+            'open': data['Open'].to_numpy(dtype=float),
+            'high': data['High'].to_numpy(dtype=float),
+            'low': data['Low'].to_numpy(dtype=float)
+        }
+        self._scheduled_exits = {}
+        for key, position in self.positions.items():
+            self._schedule_exit(key, position)
+    
+    def _schedule_exit(self, key, position):
+        """向量化搜索持倉的首次觸發K線並登記出場"""
+        brackets = position.get('brackets')
+        if self._bars is None or not brackets or not brackets_enabled(brackets):
+            return
+        start = self._bars['index'].searchsorted(position['entry_time'], side='right')
+        exit_ = find_bracket_exit(
+            self._bars['open'][start:], self._bars['high'][start:], self._bars['low'][start:],
+            position['entry_price'], brackets
+        )
+        if exit_ is not None:
+            offset, price, reason = exit_
+            timestamp = self._bars['index'][start + offset]
+            self._scheduled_exits.setdefault(timestamp, []).append((key, price, reason))
+    
+    def _execute_exits(self, timestamp):
+        for key, price, reason in self._scheduled_exits.pop(timestamp):
+            # 持倉可能已被 SELL 信號平掉
+            if key in self.positions:
+                self._close_position(key, price, timestamp, reason)
+    
+    def _close_position(self, key, price, timestamp, reason):
+        position = self.positions.pop(key)
+        value = position['quantity'] * price
+        
+        self.current_capital += value
+        profit_loss = value - (position['quantity'] * position['entry_price'])
+        holding_period = timestamp - position['entry_time']
+        
+        self.trade_history.append({
+            'timestamp': timestamp,
+            'action': 'SELL',
+            'price': price,
+            'quantity': position['quantity'],
+            'value': value,
+            'profit_loss': profit_loss,
+            'holding_period': holding_period,
+            'strategy': position['strategy'],
+            'reason': reason
+        })
+    
+    def _current_equity(self, price):
+        """現金加上持倉按當前價格估值"""
+        return self.current_capital + sum(
+            position['quantity'] * price for position in self.positions.values()
+        )
+    
+    @timed('trading_stage_seconds', stage='execute_signals')
     async def _execute_signals(self, signals, current_data, timestamp):
         """執行交易信號"""
         for signal in signals:
@@ -52,8 +198,13 @@ class BacktestEngine:
                         'quantity': quantity,
                         'entry_price': price,
                         'entry_time': timestamp,
-                        'strategy': signal.get('strategy', 'unknown')
+                        'strategy': signal.get('strategy', 'unknown'),
+                        'brackets': {
+                            **self.brackets,
+                            **{key: signal[key] for key in BRACKET_KEYS if key in signal}
+                        }
                     }
+                    self._schedule_exit(current_data.name, self.positions[current_data.name])
                     self.trade_history.append({
                         'timestamp': timestamp,
                         'action': 'BUY',
@@ -65,26 +216,7 @@ class BacktestEngine:
                     })
                     
             elif signal['action'] == 'SELL' and current_data.name in self.positions:
-                position = self.positions[current_data.name]
-                price = current_data['Close']
-                value = position['quantity'] * price
-                
-                self.current_capital += value
-                profit_loss = value - (position['quantity'] * position['entry_price'])
-                holding_period = timestamp - position['entry_time']
-                
-                self.trade_history.append({
-                    'timestamp': timestamp,
-                    'action': 'SELL',
-                    'price': price,
-                    'quantity': position['quantity'],
-                    'value': value,
-                    'profit_loss': profit_loss,
-                    'holding_period': holding_period,
-                    'strategy': position['strategy']
-                })
-                
-                del self.positions[current_data.name]
+                self._close_position(current_data.name, current_data['Close'], timestamp, 'signal')
     
     def _calculate_performance_metrics(self):
         """計算績效指標"""
@@ -93,15 +225,18 @@ class BacktestEngine:
         
         trades_df = pd.DataFrame(self.trade_history)
         trades_df.set_index('timestamp', inplace=True)
+        if 'profit_loss' not in trades_df:
+            # 尚無平倉交易（只有 BUY）
+            trades_df['profit_loss'] = np.nan
         
         # 基本指標
         total_trades = len(self.trade_history)
         winning_trades = sum(1 for trade in self.trade_history if trade.get('profit_loss', 0) > 0)
         total_profit_loss = sum(trade.get('profit_loss', 0) for trade in self.trade_history)
         
-        # 收益率指標
-        returns = trades_df['value'].pct_change()
-        total_return = (self.current_capital - self.initial_capital) / self.initial_capital
+        # 收益率指標（未平倉持倉按最後一根K線估值）
+        final_equity = self.equity_curve[-1][1] if self.equity_curve else self.current_capital
+        total_return = (final_equity - self.initial_capital) / self.initial_capital
         annual_return = total_return * (252 / len(trades_df))
         
         # 風險指標
@@ -142,6 +277,7 @@ class BacktestEngine:
         """繪製權益曲線"""
         if not self.trade_history:
             return None
+        import matplotlib.pyplot as plt
             
         trades_df = pd.DataFrame(self.trade_history)
         trades_df.set_index('timestamp', inplace=True)
@@ -0,0 +1,66 @@
+"""JWT 驗證吞吐量微基準：完整解碼驗證 vs 本地驗證緩存命中
+
+用法: python -m benchmarks.bench_auth [--tokens 1000] [--rounds 20]
+"""
+import argparse
+import time
+from datetime import datetime, timedelta
+
+import jwt
+
+from auth_config import AUTH_CONFIG
+from auth_handler import VerifiedTokenCache
+
+# 只用於簽發測試 Token，未設置 JWT_SECRET 時也能執行
+SECRET = AUTH_CONFIG['jwt_secret'] or 'benchmark-secret-not-for-production-use'
+
+def make_tokens(count):
+    expires = datetime.utcnow() + timedelta(hours=1)
+    return [
+        jwt.encode(
+            {'user_id': f'user-{i}', 'email': f'user-{i}@example.com', 'exp': expires},
+            SECRET,
+            algorithm=AUTH_CONFIG['jwt_algorithm']
+        )
+        for i in range(count)
+    ]
+
+def bench_decode(tokens, rounds):
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            jwt.decode(token, SECRET, algorithms=[AUTH_CONFIG['jwt_algorithm']])
+    return len(tokens) * rounds / (time.perf_counter() - start)
+
+def bench_cached(tokens, rounds):
+    cache = VerifiedTokenCache(max_size=len(tokens))
+    for token in tokens:
+        cache.put(token, jwt.decode(
+            token, SECRET, algorithms=[AUTH_CONFIG['jwt_algorithm']]
+        ))
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for token in tokens:
+            cache.get(token)
+    return len(tokens) * rounds / (time.perf_counter() - start)
+
+def run(tokens=1000, rounds=20):
+    token_list = make_tokens(tokens)
+    return {
+        'jwt_decode_ops_per_sec': bench_decode(token_list, rounds),
+        'jwt_cache_hit_ops_per_sec': bench_cached(token_list, rounds)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--tokens', type=int, default=1000)
+    parser.add_argument('--rounds', type=int, default=20)
+    args = parser.parse_args()
+    
+    results = run(args.tokens, args.rounds)
+    for name, value in results.items():
+        print(f"{name}: {value:,.0f}")
+    print(f"speedup: {results['jwt_cache_hit_ops_per_sec'] / results['jwt_decode_ops_per_sec']:.1f}x")
+
+if __name__ == '__main__':
+    main()
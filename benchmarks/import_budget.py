@@ -0,0 +1,61 @@
+"""啟動導入時間預算檢查
+
+每個模組在全新的解釋器中導入，記錄耗時與被順帶加載的重型依賴。
+超出預算或提前加載重型依賴時以非零狀態碼退出:
+    python -m benchmarks.import_budget
+"""
+import json
+import subprocess
+import sys
+
+# 儀表板、回測工作進程與命令行入口的導入預算（秒）
+IMPORT_BUDGETS = {
+    'backtester': 1.0,
+    'seo_optimizer': 1.0,
+    'backtest_jobs': 1.5,
+    'market_data_cache': 1.0,
+    'risk_analytics': 1.0,
+}
+
+# 只應在首次使用時加載的重型依賴
+HEAVY_MODULES = ('yfinance', 'ccxt', 'talib', 'sklearn', 'scipy', 'matplotlib')
+
+_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{'seconds': elapsed, 'loaded': [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+def measure(module, repeat=3):
+    """返回 {'seconds': 最短導入耗時, 'loaded': 被加載的重型依賴}"""
+    best = None
+    for _ in range(repeat):
+        output = subprocess.check_output(
+            [sys.executable, '-c', _PROBE.format(module=module, heavy=HEAVY_MODULES)]
+        )
+        result = json.loads(output.decode().strip().splitlines()[-1])
+        if best is None or result['seconds'] < best['seconds']:
+            best = result
+    return best
+
+def check(budgets=None, repeat=3):
+    """返回 (模組, 結果, 是否通過) 列表"""
+    rows = []
+    for module, budget in (budgets or IMPORT_BUDGETS).items():
+        result = measure(module, repeat)
+        ok = result['seconds'] <= budget and not result['loaded']
+        rows.append((module, result, ok))
+    return rows
+
+def main():
+    rows = check()
+    for module, result, ok in rows:
+        loaded = f"  loaded {','.join(result['loaded'])}" if result['loaded'] else ''
+        flag = '' if ok else '  OVER BUDGET'
+        print(f"{module:<20} {result['seconds']:>8.3f}s / {IMPORT_BUDGETS[module]:.1f}s{loaded}{flag}")
+    sys.exit(0 if all(ok for _, _, ok in rows) else 1)
+
+if __name__ == '__main__':
+    main()
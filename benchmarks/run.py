@@ -0,0 +1,385 @@
+"""可重現的效能基準套件
+
+執行並保存結果:
+    python -m benchmarks.run --sizes 1000,100000 --symbols 1,10,100 --output bench.json
+    python -m benchmarks.run --sizes 10000000 --only indicators
+比較兩次結果（如兩個提交），變慢超過閾值時以非零狀態碼退出:
+    python -m benchmarks.run compare base.json head.json --threshold 0.10
+導入時間預算檢查見 benchmarks/import_budget.py
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import asynccontextmanager
+from datetime import datetime
+
+from benchmarks.synthetic import generate_universe
+
+def _best_of(func, repeat):
+    """重複執行取最短耗時，降低雜訊"""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def bench_indicators(n_bars, n_symbols, repeat):
+    from seo_optimizer import AdvancedTradingBot
+    bot = AdvancedTradingBot(100000)
+    universe = generate_universe(n_symbols, n_bars, freq='min')
+    seconds = _best_of(
+        lambda: [bot.calculate_technical_indicators(df.copy()) for df in universe.values()],
+        repeat
+    )
+    return {'seconds': seconds, 'bars_per_sec': n_bars * n_symbols / seconds}
+
+def bench_predict(n_bars, n_symbols, repeat):
+    from seo_optimizer import AdvancedTradingBot
+    bot = AdvancedTradingBot(100000)
+    frames = []
+    for df in generate_universe(n_symbols, n_bars, freq='min').values():
+        df = bot.calculate_technical_indicators(df)
+        frames.append(df)
+    seconds = _best_of(lambda: [bot.predict_price_movement(df) for df in frames], repeat)
+    return {'seconds': seconds, 'calls_per_sec': n_symbols / seconds}
+
+def bench_backtest(n_bars, n_symbols, repeat):
+    from backtester import BacktestEngine
+    universe = generate_universe(n_symbols, n_bars)
+
+    def run():
+        for df in universe.values():
+            asyncio.run(BacktestEngine(100000).run_backtest('benchmark', df.copy()))
+
+    seconds = _best_of(run, repeat)
+    return {'seconds': seconds, 'bars_per_sec': n_bars * n_symbols / seconds}
+
+def bench_optimize_portfolio(n_bars, n_symbols, repeat):
+    from seo_optimizer import AdvancedTradingBot
+    bot = AdvancedTradingBot(100000)
+    assets = {}
+    for symbol, df in generate_universe(n_symbols, n_bars).items():
+        df['Returns'] = df['Close'].pct_change()
+        assets[symbol] = df
+    seconds = _best_of(lambda: bot.optimize_portfolio(assets), repeat)
+    return {'seconds': seconds}
+
+def bench_robustness(n_paths, n_steps, repeat):
+    from robustness import simulate
+    returns = generate_universe(1, n_steps + 1)['SYM0000']['Close'].pct_change().to_numpy()[1:]
+    turnover = abs(returns) * 10
+    seconds = _best_of(
+        lambda: simulate(returns, 'block_bootstrap', n_paths, turnover=turnover, slippage=0.0005, seed=0),
+        repeat
+    )
+    return {'seconds': seconds, 'paths_per_sec': n_paths / seconds}
+
+def bench_signal_service(n_requests, n_symbols, repeat):
+    """並發請求信號服務（預熱後），量測吞吐量與請求延遲 p99"""
+    import random
+    from benchmarks.synthetic import SyntheticFetcher
+    from market_data_cache import MarketDataCache
+    from signal_service import SignalService
+
+    symbols = [f'SYM{i:04d}' for i in range(n_symbols)]
+    rng = random.Random(0)
+
+    async def run_once():
+        service = SignalService(MarketDataCache(fetcher=SyntheticFetcher()))
+        try:
+            await service.get_signals(symbols)
+            # 首次訓練在背景進行；完成後預測就緒、緩存被清空，再預熱一次才量測
+            await service.wait_for_training()
+            await service.get_signals(symbols)
+            service.latency.__init__()
+            start = time.perf_counter()
+            for _ in range(n_requests // 500):
+                await asyncio.gather(*[
+                    service.get_signals(rng.sample(symbols, min(3, n_symbols))) for _ in range(500)
+                ])
+            return time.perf_counter() - start, service.latency.percentile(0.99)
+        finally:
+            await service.stop()
+
+    seconds, p99 = min(asyncio.run(run_once()) for _ in range(repeat))
+    return {'seconds': seconds, 'requests_per_sec': n_requests / seconds, 'p99_seconds': p99}
+
+def bench_db_save_trade(n_trades, repeat):
+    from database_handler import DatabaseManager
+
+    def run():
+        with tempfile.TemporaryDirectory() as directory:
+            db = DatabaseManager(f"sqlite:///{os.path.join(directory, 'bench.db')}")
+
+            async def save_all():
+                for i in range(n_trades):
+                    await db.save_trade({
+                        'user_id': f'user-{i % 100}', 'symbol': 'SYM0000', 'action': 'BUY',
+                        'price': 100.0, 'quantity': 1.0, 'total_value': 100.0,
+                        'strategy': 'benchmark', 'profit_loss': 0.0, 'status': 'OPEN'
+                    })
+
+            asyncio.run(save_all())
+            db.close()
+            db.engine.dispose()
+
+    seconds = _best_of(run, repeat)
+    return {'seconds': seconds, 'trades_per_sec': n_trades / seconds}
+
+@asynccontextmanager
+async def _fake_notification_server():
+    """本地假 Telegram/LINE 服務，期間 CONFIG 的 api_base 指向它（不限流）"""
+    from aiohttp import web
+    from config import CONFIG
+
+    async def ok(request):
+        await request.read()
+        return web.json_response({'ok': True})
+
+    app = web.Application()
+    app.router.add_post('/{path:.*}', ok)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+
+    settings = CONFIG['notifications']
+    saved = (dict(CONFIG['telegram']), dict(CONFIG['line']), settings.get('rate_limits'))
+    CONFIG['telegram']['api_base'] = f'http://127.0.0.1:{port}'
+    CONFIG['line']['api_base'] = f'http://127.0.0.1:{port}'
+    # 基準只量測派送路徑，不受外部服務的限流配置影響
+    settings['rate_limits'] = {}
+    try:
+        yield
+    finally:
+        CONFIG['telegram'], CONFIG['line'], settings['rate_limits'] = saved
+        await runner.cleanup()
+
+def bench_notification_fanout(n_messages, repeat):
+    """對本地假 Telegram/LINE 服務發送通知，量測派送吞吐量"""
+    from notification_system import NotificationSystem
+
+    async def run_once():
+        async with _fake_notification_server():
+            notifications = NotificationSystem()
+            try:
+                start = time.perf_counter()
+                for i in range(n_messages):
+                    await notifications.send_notification(
+                        f'user-{i % 1000}',
+                        {'title': 'benchmark', 'content': str(i), 'priority': 'urgent',
+                         'telegram_chat_id': f'chat-{i % 1000}', 'line_user_id': f'line-{i % 1000}'},
+                        ['telegram', 'line']
+                    )
+                await notifications.flush()
+                return time.perf_counter() - start
+            finally:
+                await notifications.stop()
+
+    seconds = min(asyncio.run(run_once()) for _ in range(repeat))
+    return {'seconds': seconds, 'messages_per_sec': n_messages / seconds}
+
+def bench_replay(n_events, n_symbols, repeat, speed=None):
+    """以回放行情驅動完整實盤循環（指標、信號、風控、SQLite、假通知服務）"""
+    from config import CONFIG
+    from database_handler import DatabaseManager
+    from checkpoint import CheckpointManager
+    from live_trader import LiveTrader
+    from market_replay import MarketDataStore, MarketReplay, ReplayFetcher, SimulatedClock
+    from notification_system import NotificationSystem
+
+    lookback = CONFIG['live']['lookback']
+    universe = generate_universe(n_symbols, lookback + n_events, freq='min')
+
+    async def run_once(directory):
+        store = MarketDataStore(os.path.join(directory, 'market'))
+        for symbol, bars in universe.items():
+            store.save_bars(symbol, bars)
+        first_event = next(iter(universe.values())).index[lookback]
+        clock = SimulatedClock(first_event, speed=speed)
+        fetcher = ReplayFetcher(store, clock, timeframe='1m')
+        db = DatabaseManager(f"sqlite:///{os.path.join(directory, 'replay.db')}")
+        async with _fake_notification_server():
+            notifications = NotificationSystem(db=db)
+            trader = LiveTrader('replay-user', list(universe), fetcher=fetcher, db=db,
+                                notifications=notifications, clock=clock,
+                                recipients={'telegram_chat_id': 'chat', 'line_user_id': 'line'},
+                                timeframe='1m', checkpoint_manager=CheckpointManager(
+                                    backend='file', directory=os.path.join(directory, 'checkpoints')
+                                ))
+            try:
+                report = await MarketReplay(fetcher, clock).run(trader.step, start=first_event)
+                await notifications.flush()
+            finally:
+                await notifications.stop()
+                db.close()
+                db.engine.dispose()
+        return report
+
+    reports = []
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            reports.append(asyncio.run(run_once(directory)))
+    report = min(reports, key=lambda r: r['wall_seconds'])
+    return {
+        'seconds': report['wall_seconds'],
+        'events_per_sec': report['events'] / report['wall_seconds'],
+        'achieved_speed': report['achieved_speed'],
+        'step_p99_seconds': report['step_seconds']['p99']
+    }
+
+def bench_import(module, repeat):
+    from benchmarks import import_budget
+    return import_budget.measure(module, repeat)
+
+def bench_jwt(repeat):
+    from benchmarks import bench_auth
+    results = [bench_auth.run(tokens=1000, rounds=5) for _ in range(repeat)]
+    return {name: max(result[name] for result in results) for name in results[0]}
+
+# 逐筆回測與模型訓練的開銷隨K線數增長很快，超出上限的組合會被跳過
+BACKTEST_MAX_BARS = 2_000
+PREDICT_MAX_BARS = 100_000
+
+def _git_commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+def run_suite(sizes, symbol_counts, only=None, repeat=3):
+    plan = []
+    for n_bars in sizes:
+        plan.append((f'indicators[bars={n_bars},symbols=1]', lambda n=n_bars: bench_indicators(n, 1, repeat)))
+        if n_bars <= PREDICT_MAX_BARS:
+            plan.append((f'predict_price_movement[bars={n_bars},symbols=1]',
+                         lambda n=n_bars: bench_predict(n, 1, repeat)))
+        if n_bars <= BACKTEST_MAX_BARS:
+            plan.append((f'run_backtest[bars={n_bars},symbols=1]', lambda n=n_bars: bench_backtest(n, 1, repeat)))
+    for n_symbols in symbol_counts:
+        plan.append((f'indicators[bars=1000,symbols={n_symbols}]',
+                     lambda m=n_symbols: bench_indicators(1000, m, repeat)))
+        plan.append((f'optimize_portfolio[bars=1000,symbols={n_symbols}]',
+                     lambda m=n_symbols: bench_optimize_portfolio(1000, m, repeat)))
+        plan.append((f'notification_fanout[messages={n_symbols * 10}]',
+                     lambda m=n_symbols: bench_notification_fanout(m * 10, repeat)))
+    plan.append(('robustness[paths=10000,steps=2520]', lambda: bench_robustness(10000, 2520, repeat)))
+    plan.append(('signal_service[requests=20000,symbols=50]', lambda: bench_signal_service(20000, 50, repeat)))
+    plan.append(('replay[events=30,symbols=2]', lambda: bench_replay(30, 2, repeat)))
+    plan.append(('db_save_trade[trades=1000]', lambda: bench_db_save_trade(1000, repeat)))
+    plan.append(('jwt_verify[tokens=1000]', lambda: bench_jwt(repeat)))
+    for module in ('backtester', 'backtest_jobs', 'market_data_cache'):
+        plan.append((f'import[{module}]', lambda m=module: bench_import(m, repeat)))
+
+    results = {}
+    for name, bench in plan:
+        if only and not any(name.startswith(prefix) for prefix in only):
+            continue
+        print(f"running {name} ...", file=sys.stderr)
+        try:
+            results[name] = bench()
+        except Exception as e:
+            results[name] = {'error': f"{type(e).__name__}: {str(e)}"}
+    return {
+        'meta': {
+            'commit': _git_commit(),
+            'timestamp': datetime.now().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'repeat': repeat
+        },
+        'results': results
+    }
+
+def _metrics(result):
+    """返回 [(指標, 是否越高越好)]：有 seconds 時以耗時比較，否則比較所有 *_per_sec 吞吐量"""
+    if 'seconds' in result:
+        return [('seconds', False)]
+    return [(key, True) for key in result if key.endswith('_per_sec')]
+
+def compare(base, head, threshold):
+    """返回 (rows, failures)
+
+    rows 為 (名稱, 指標, 基準值, 新值, 變慢倍數, 是否變慢) 列表；變慢倍數對耗時為 新/基準，
+    對吞吐量為 基準/新，大於 1 + threshold 視為變慢。
+    failures 為 (名稱, 原因) 列表：基準成功但新結果出錯或缺少指標、新結果缺少該項基準，
+    或基準結果沒有可比較的指標。
+    """
+    rows, failures = [], []
+    for name, base_result in base['results'].items():
+        if 'error' in base_result:
+            continue
+        metrics = _metrics(base_result)
+        if not metrics:
+            failures.append((name, f"no comparable metric in base: {sorted(base_result)}"))
+            continue
+        head_result = head['results'].get(name)
+        if head_result is None:
+            failures.append((name, 'missing from head'))
+            continue
+        if 'error' in head_result:
+            failures.append((name, f"base ok, head error: {head_result['error']}"))
+            continue
+        for metric, higher_is_better in metrics:
+            if metric not in head_result:
+                failures.append((name, f"head result has no {metric}"))
+                continue
+            base_value, head_value = base_result[metric], head_result[metric]
+            ratio = base_value / head_value if higher_is_better else head_value / base_value
+            rows.append((name, metric, base_value, head_value, ratio, ratio > 1 + threshold))
+    return rows, failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest='command')
+
+    compare_parser = subparsers.add_parser('compare', help='比較兩份基準結果')
+    compare_parser.add_argument('base')
+    compare_parser.add_argument('head')
+    compare_parser.add_argument('--threshold', type=float, default=0.10)
+
+    parser.add_argument('--sizes', default='1000,100000', help='K線數，逗號分隔（可含 10000000）')
+    parser.add_argument('--symbols', default='1,10,100,1000', help='標的數，逗號分隔')
+    parser.add_argument('--only', default='', help='只執行名稱以這些前綴開頭的基準，逗號分隔')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', default='bench_results.json')
+    args = parser.parse_args()
+
+    if args.command == 'compare':
+        with open(args.base) as f:
+            base = json.load(f)
+        with open(args.head) as f:
+            head = json.load(f)
+        rows, failures = compare(base, head, args.threshold)
+        print(f"base {base['meta'].get('commit')} -> head {head['meta'].get('commit')}")
+        for name, metric, base_value, head_value, ratio, regressed in rows:
+            flag = '  SLOWER' if regressed else ''
+            label = name if metric == 'seconds' else f"{name} {metric}"
+            print(f"{label:<70} {base_value:>12.4g} {head_value:>12.4g} {ratio:>6.2f}x{flag}")
+        for name, reason in failures:
+            print(f"{name:<50} FAILED: {reason}")
+        sys.exit(1 if failures or any(row[5] for row in rows) else 0)
+
+    report = run_suite(
+        [int(size) for size in args.sizes.split(',') if size],
+        [int(count) for count in args.symbols.split(',') if count],
+        only=[prefix for prefix in args.only.split(',') if prefix],
+        repeat=args.repeat
+    )
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    for name, result in report['results'].items():
+        print(f"{name:<50} {result}")
+
+if __name__ == '__main__':
+    main()
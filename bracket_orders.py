@@ -0,0 +1,90 @@
+"""止損 / 止盈 / 移動止損的括號單出場計算
+
+開倉時即以數組一次搜索出場K線：各出場價位對後續每根K線向量化比較，
+用 argmax 取首次觸發的位置，回測主循環只需在該K線執行出場，不必逐根檢查持倉。
+搜索窗口由小到大倍增，出場通常較近，避免每筆開倉都掃描整段剩餘歷史。
+"""
+from typing import Dict, Optional
+
+import numpy as np
+
+# 同一根K線同時觸及止損與止盈時的假設
+INTRABAR_ORDERS = ('stop_first', 'target_first', 'nearest_first')
+
+BRACKET_KEYS = ('stop_loss', 'take_profit', 'trailing_stop')
+
+def normalize_brackets(settings: Optional[Dict[str, object]]) -> Dict[str, object]:
+    """補全括號單設定：比例以小數表示（0.02 = 2%），None 表示不設該出場"""
+    settings = settings or {}
+    brackets = {key: settings.get(key) for key in BRACKET_KEYS}
+    brackets['intrabar_order'] = settings.get('intrabar_order') or 'stop_first'
+    if brackets['intrabar_order'] not in INTRABAR_ORDERS:
+        raise ValueError(f"intrabar_order must be one of {INTRABAR_ORDERS}")
+    return brackets
+
+def brackets_enabled(brackets: Dict[str, object]) -> bool:
+    return any(brackets.get(key) is not None for key in BRACKET_KEYS)
+
+def _resolve_window(open_, high, low, entry_price, peak_before, brackets):
+    """在一個窗口內搜索首次觸發；返回 ((窗口內位置, 出場價, 原因) 或 None, 截至窗口末的最高價)"""
+    n = len(high)
+    fixed_stop = entry_price * (1 - brackets['stop_loss']) if brackets['stop_loss'] is not None else -np.inf
+    stop_level = np.full(n, fixed_stop)
+    if brackets['trailing_stop'] is not None:
+        # 移動止損以上一根K線為止的最高價計算，當根的高點不抬高當根的止損位
+        peak = np.maximum.accumulate(np.concatenate(([peak_before], high[:-1])))
+        stop_level = np.maximum(stop_level, peak * (1 - brackets['trailing_stop']))
+    target_level = entry_price * (1 + brackets['take_profit']) if brackets['take_profit'] is not None else np.inf
+
+    stop_hit = low <= stop_level
+    target_hit = high >= target_level
+    hit = stop_hit | target_hit
+    if not hit.any():
+        return None, np.maximum(peak_before, high.max())
+
+    i = int(np.argmax(hit))
+    stop = stop_level[i]
+    if stop_hit[i] and target_hit[i]:
+        if open_[i] <= stop:
+            take_stop = True
+        elif open_[i] >= target_level:
+            take_stop = False
+        elif brackets['intrabar_order'] == 'stop_first':
+            take_stop = True
+        elif brackets['intrabar_order'] == 'target_first':
+            take_stop = False
+        else:
+            take_stop = open_[i] - stop <= target_level - open_[i]
+    else:
+        take_stop = bool(stop_hit[i])
+
+    if take_stop:
+        # 跳空低開穿過止損位時以開盤價成交
+        reason = 'trailing_stop' if stop > fixed_stop else 'stop_loss'
+        return (i, min(stop, open_[i]), reason), None
+    return (i, max(target_level, open_[i]), 'take_profit'), None
+
+def find_bracket_exit(open_: np.ndarray, high: np.ndarray, low: np.ndarray, entry_price: float,
+                      brackets: Dict[str, object], initial_window: int = 64):
+    """返回 (相對起點的K線位置, 出場價, 原因)，數據內未觸發則返回 None
+
+    open_/high/low 為開倉之後的K線（不含開倉K線本身）。
+    """
+    if not brackets_enabled(brackets):
+        return None
+    open_ = np.asarray(open_, dtype=float)
+    high = np.asarray(high, dtype=float)
+    low = np.asarray(low, dtype=float)
+    peak = entry_price
+    start = 0
+    window = initial_window
+    while start < len(high):
+        end = min(start + window, len(high))
+        result, peak = _resolve_window(open_[start:end], high[start:end], low[start:end],
+                                       entry_price, peak, brackets)
+        if result is not None:
+            offset, price, reason = result
+            return start + offset, float(price), reason
+        start = end
+        window *= 2
+    return None
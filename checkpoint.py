@@ -0,0 +1,88 @@
+import asyncio
+import glob
+import os
+import pickle
+from typing import Any, Optional
+
+from config import CONFIG
+
+class CheckpointManager:
+    """引擎狀態檢查點：pickle 二進制序列化，保存到本地目錄或數據庫
+
+    每個名稱保留最近 keep 個檢查點；讀取時從最新的開始，損壞則退回較舊的一個。
+    本地文件以臨時文件寫入後原子替換，進程中途崩潰不會留下半寫入的檢查點。
+    """
+
+    def __init__(self, backend: Optional[str] = None, directory: Optional[str] = None,
+                 keep: Optional[int] = None, db=None):
+        settings = CONFIG['checkpoint']
+        self.backend = backend or settings['backend']
+        self.directory = directory or settings['directory']
+        self.keep = keep or settings['keep']
+        self._db = db
+        if self.backend == 'file':
+            os.makedirs(self.directory, exist_ok=True)
+
+    @property
+    def db(self):
+        if self._db is None:
+            from database_handler import DatabaseManager
+            self._db = DatabaseManager(CONFIG['database']['url'])
+        return self._db
+
+    def _files(self, name: str):
+        """按新到舊返回檢查點文件"""
+        pattern = f"{glob.escape(name)}-{'[0-9]' * 10}.ckpt"
+        return sorted(glob.glob(os.path.join(self.directory, pattern)), reverse=True)
+
+    def _write_file(self, name: str, payload: bytes):
+        files = self._files(name)
+        seq = int(files[0].rsplit('-', 1)[1].split('.')[0]) + 1 if files else 0
+        path = os.path.join(self.directory, f"{name}-{seq:010d}.ckpt")
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(payload)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+        for stale in self._files(name)[self.keep:]:
+            os.remove(stale)
+
+    def _read_files(self, name: str):
+        payloads = []
+        for path in self._files(name):
+            try:
+                with open(path, 'rb') as f:
+                    payloads.append(f.read())
+            except OSError:
+                continue
+        return payloads
+
+    async def save(self, name: str, state: Any):
+        """序列化並保存狀態，I/O 在執行緒中進行以免阻塞事件循環"""
+        payload = await asyncio.to_thread(pickle.dumps, state, pickle.HIGHEST_PROTOCOL)
+        if self.backend == 'file':
+            await asyncio.to_thread(self._write_file, name, payload)
+        else:
+            await self.db.save_checkpoint(name, payload, keep=self.keep)
+
+    async def load_latest(self, name: str) -> Optional[Any]:
+        """返回最新可用的檢查點狀態，沒有則返回 None"""
+        if self.backend == 'file':
+            payloads = await asyncio.to_thread(self._read_files, name)
+        else:
+            payloads = await self.db.get_checkpoints(name)
+        for payload in payloads:
+            try:
+                return pickle.loads(payload)
+            except Exception as e:
+                print(f"Skipping corrupt checkpoint {name}: {e}")
+        return None
+
+    async def clear(self, name: str):
+        """刪除指定名稱的所有檢查點"""
+        if self.backend == 'file':
+            for path in self._files(name):
+                os.remove(path)
+        else:
+            await self.db.delete_checkpoints(name)
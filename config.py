@@ -1,6 +1,8 @@
+import os
+
 CONFIG = {
     'database': {
-        'url': 'sqlite:///trading_system.db'
+        'url': os.environ.get('DATABASE_URL', 'sqlite:///trading_system.db')
     },
     'email': {
         'enabled': True,
@@ -8,21 +10,152 @@ CONFIG = {
         'smtp_port': 587,
         'sender': 'your_email@gmail.com',
         'password': 'your_app_password',
-        'recipient': 'recipient@email.com'
+        'recipient': 'recipient@email.com',
+        'use_starttls': True,
+        # 共用的 SMTP 連接數、每批連續發送的郵件數及閒置重連秒數
+        'pool_size': 2,
+        'batch_size': 50,
+        'idle_timeout': 60,
+        'timeout': 30
     },
     'telegram': {
         'enabled': True,
         'bot_token': 'your_bot_token',
-        'chat_id': 'your_chat_id'
+        'chat_id': 'your_chat_id',
+        'api_base': 'https://api.telegram.org'
     },
     'line': {
         'enabled': True,
         'channel_access_token': 'your_line_token',
-        'user_id': 'your_line_user_id'
+        'user_id': 'your_line_user_id',
+        'api_base': 'https://api.line.me'
+    },
+    'notifications': {
+        'workers': 4,
+        'queue_maxsize': 10000,
+        'pool_limit': 100,
+        'pool_limit_per_host': 30,
+        'keepalive_timeout': 60,
+        'request_timeout': 10,
+        # 每個渠道 (rate/burst) 與每個收件人 (recipient_rate/recipient_burst) 的令牌桶
+        # retry_after_scope: 429 只暫停該收件人 ('recipient') 或整個渠道 ('channel')
+        'rate_limits': {
+            'telegram': {'rate': 30, 'burst': 30, 'recipient_rate': 1, 'recipient_burst': 3},
+            # LINE 的 429 針對整個 channel access token
+            'line': {'rate': 100, 'burst': 100, 'recipient_rate': 5, 'recipient_burst': 10,
+                     'retry_after_scope': 'channel'},
+            'email': {'rate': 10, 'burst': 20, 'recipient_rate': 1, 'recipient_burst': 5}
+        },
+        'retry': {
+            'max_retries': 5,
+            'base_delay': 0.5,
+            'max_delay': 30
+        },
+        # 非緊急通知在窗口內按用戶與渠道合併為一則摘要
+        'coalesce': {
+            'enabled': True,
+            'window': 5,
+            'max_batch': 50,
+            'bypass_priorities': ['urgent', 'stop_loss']
+        },
+        # 每個用戶保留最近的通知記錄
+        'history': {
+            'max_per_user': 500,
+            'max_users': 100000,
+            'retention_seconds': 7 * 24 * 3600
+        }
+    },
+    'dashboard': {
+        'lookback_days': 365,
+        'fetch_workers': 8,
+        'max_chart_points': 800,
+        # 各市場的緩存秒數
+        'ttl': {
+            'stock': 300,
+            'futures': 300,
+            'crypto': 60,
+            'portfolio': 60
+        }
+    },
+    'backtest': {
+        'max_workers': 2,
+        'cache_dir': '.backtest_cache',
+        'cache_max_bytes': 512 * 1024 * 1024,
+        # 默認括號單（比例，None 為不設）；intrabar_order 決定同一K線同時觸及止損與止盈時的先後:
+        # stop_first（保守）、target_first 或 nearest_first（離開盤價較近者先觸發）
+        'brackets': {
+            'stop_loss': None,
+            'take_profit': None,
+            'trailing_stop': None,
+            'intrabar_order': 'stop_first'
+        }
+    },
+    # 下單前風控：倉位按 risk_per_trade / 止損距離計算，止損距離 = 倍數 × 日波動率
+    'risk': {
+        'stop_volatility_multiple': 2.0,
+        'default_stop_distance': 0.05,
+        'max_position_fraction': 0.2,
+        'user_limits': {
+            'max_symbol_notional': 50000,
+            'max_asset_class_notional': {'stock': 200000, 'crypto': 50000, 'futures': 100000},
+            'max_gross_notional': 300000,
+            'max_open_positions': 50,
+            'max_daily_loss': 5000
+        },
+        'global_limits': {
+            'max_symbol_notional': 5000000,
+            'max_asset_class_notional': {'stock': 20000000, 'crypto': 5000000, 'futures': 10000000},
+            'max_gross_notional': 30000000
+        }
+    },
+    # 信號服務：未命中緩存的請求最多等待 max_wait_ms 合併為一批
+    'signal_service': {
+        'timeframe': '1d',
+        'max_bars': 500,
+        'indicator_window': 250,
+        'max_batch': 256,
+        'max_wait_ms': 2,
+        'max_symbols_per_request': 100,
+        'min_train_rows': 50
+    },
+    # 蒙地卡羅穩健性模擬；workers 為 None 時使用全部 CPU
+    'robustness': {
+        'n_paths': 10000,
+        'block_size': 20,
+        'batch_size': 1000,
+        'workers': None,
+        'ruin_threshold': 0.5
+    },
+    # 實盤循環；replay 的 data_dir 為 RecordingFetcher 錄製的本地行情庫
+    'live': {
+        'timeframe': '1d',
+        'lookback': 250,
+        'poll_interval': 60,
+        'notification_channels': ['telegram', 'line']
+    },
+    'replay': {
+        'data_dir': '.market_data'
+    },
+    # 引擎狀態檢查點；dyno 的文件系統在重啟後會清空，部署時應改用 database
+    'checkpoint': {
+        'backend': os.environ.get('CHECKPOINT_BACKEND', 'file'),
+        'directory': os.environ.get('CHECKPOINT_DIR', '.checkpoints'),
+        'keep': 3,
+        'backtest_interval': 500,
+        'live_interval_seconds': 300
+    },
+    # 計時/計數與剖析；停用時計時器為空操作
+    'instrumentation': {
+        'enabled': False,
+        'profile_runs': False,
+        'profile_dir': 'profiles',
+        'port': 9100
     },
     'trading': {
         'initial_capital': 100000,
         'risk_per_trade': 0.02,
+        # 預測模型至少需要的訓練樣本數（指標預熱期後），不足時返回中性預測
+        'ml_min_train_rows': 50,
         'default_symbols': [
             'AAPL', 'GOOGL', 'TSLA',  # 股票
             'BTC/USDT', 'ETH/USDT',   # 加密貨幣
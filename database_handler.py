@@ -1,9 +1,10 @@
 import sqlite3
 from datetime import datetime
 import pandas as pd
-from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON
+from sqlalchemy import create_engine, Column, Integer, String, Float, DateTime, JSON, LargeBinary
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
+from instrumentation import timed
 
 Base = declarative_base()
 
@@ -45,6 +46,40 @@ class PortfolioSnapshot(Base):
     positions = Column(JSON)
     metrics = Column(JSON)
 
+class DeadLetterNotification(Base):
+    __tablename__ = 'dead_letter_notifications'
+    
+    id = Column(Integer, primary_key=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    user_id = Column(String, index=True)
+    channel = Column(String)
+    payload = Column(JSON)
+    error = Column(String)
+    attempts = Column(Integer)
+
+class BacktestJob(Base):
+    __tablename__ = 'backtest_jobs'
+    
+    id = Column(Integer, primary_key=True)
+    job_key = Column(String, index=True)  # 相同參數的回測共用同一鍵值
+    status = Column(String)  # QUEUED/RUNNING/COMPLETED/FAILED
+    progress = Column(Float, default=0.0)
+    submitted_at = Column(DateTime, default=datetime.utcnow)
+    started_at = Column(DateTime)
+    finished_at = Column(DateTime)
+    params = Column(JSON)
+    results = Column(JSON)
+    equity_curve = Column(JSON)
+    error = Column(String)
+
+class EngineCheckpoint(Base):
+    __tablename__ = 'engine_checkpoints'
+    
+    id = Column(Integer, primary_key=True)
+    name = Column(String, index=True)
+    timestamp = Column(DateTime, default=datetime.utcnow)
+    data = Column(LargeBinary)
+
 class DatabaseManager:
     def __init__(self, db_url='sqlite:///trading_system.db'):
         self.engine = create_engine(db_url)
@@ -52,6 +87,7 @@ class DatabaseManager:
         Session = sessionmaker(bind=self.engine)
         self.session = Session()
     
+    @timed('db_commit_seconds', op='save_trade')
     async def save_trade(self, trade_data):
         """保存交易記錄"""
         try:
@@ -77,6 +113,7 @@ class DatabaseManager:
             
         return query.all()
     
+    @timed('db_commit_seconds', op='save_portfolio_snapshot')
     async def save_portfolio_snapshot(self, snapshot_data):
         """保存投資組合快照"""
         try:
@@ -95,6 +132,7 @@ class DatabaseManager:
             UserSettings.user_id == user_id
         ).first()
     
+    @timed('db_commit_seconds', op='update_user_settings')
     async def update_user_settings(self, user_id, settings_data):
         """更新用戶設置"""
         try:
@@ -129,6 +167,115 @@ class DatabaseManager:
             
         return query.order_by(PortfolioSnapshot.timestamp).all()
     
+    async def save_dead_letter(self, dead_letter_data):
+        """保存重試耗盡的通知"""
+        try:
+            dead_letter = DeadLetterNotification(**dead_letter_data)
+            self.session.add(dead_letter)
+            self.session.commit()
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"Error saving dead letter: {e}")
+            return False
+    
+    async def get_dead_letters(self, channel=None, limit=100):
+        """獲取死信隊列中的通知"""
+        query = self.session.query(DeadLetterNotification)
+        if channel:
+            query = query.filter(DeadLetterNotification.channel == channel)
+        return query.order_by(DeadLetterNotification.id).limit(limit).all()
+    
+    async def delete_dead_letter(self, dead_letter_id):
+        """從死信隊列移除通知"""
+        try:
+            self.session.query(DeadLetterNotification).filter(
+                DeadLetterNotification.id == dead_letter_id
+            ).delete()
+            self.session.commit()
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"Error deleting dead letter: {e}")
+            return False
+    
+    async def create_backtest_job(self, job_data):
+        """創建回測任務，返回任務ID"""
+        try:
+            job = BacktestJob(**job_data)
+            self.session.add(job)
+            self.session.commit()
+            return job.id
+        except Exception as e:
+            self.session.rollback()
+            print(f"Error creating backtest job: {e}")
+            return None
+    
+    async def update_backtest_job(self, job_id, job_data):
+        """更新回測任務狀態、進度或結果"""
+        try:
+            self.session.query(BacktestJob).filter(BacktestJob.id == job_id).update(job_data)
+            self.session.commit()
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"Error updating backtest job: {e}")
+            return False
+    
+    async def get_backtest_job(self, job_id):
+        """獲取回測任務"""
+        # 任務由其他進程更新，讀取前先丟棄本地緩存的對象狀態
+        self.session.expire_all()
+        return self.session.query(BacktestJob).filter(BacktestJob.id == job_id).first()
+    
+    async def find_backtest_job(self, job_key, statuses):
+        """按參數鍵值查找最近一個處於指定狀態的回測任務"""
+        self.session.expire_all()
+        return self.session.query(BacktestJob).filter(
+            BacktestJob.job_key == job_key,
+            BacktestJob.status.in_(statuses)
+        ).order_by(BacktestJob.id.desc()).first()
+    
+    async def save_checkpoint(self, name, data, keep=3):
+        """保存檢查點並只保留最近 keep 個"""
+        try:
+            self.session.add(EngineCheckpoint(name=name, data=data))
+            self.session.flush()
+            stale_ids = [
+                row.id for row in self.session.query(EngineCheckpoint.id)
+                .filter(EngineCheckpoint.name == name)
+                .order_by(EngineCheckpoint.id.desc())
+                .offset(keep)
+            ]
+            if stale_ids:
+                self.session.query(EngineCheckpoint).filter(
+                    EngineCheckpoint.id.in_(stale_ids)
+                ).delete(synchronize_session=False)
+            self.session.commit()
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"Error saving checkpoint: {e}")
+            return False
+    
+    async def get_checkpoints(self, name):
+        """按新到舊返回檢查點數據"""
+        rows = self.session.query(EngineCheckpoint.data).filter(
+            EngineCheckpoint.name == name
+        ).order_by(EngineCheckpoint.id.desc()).all()
+        return [row.data for row in rows]
+    
+    async def delete_checkpoints(self, name):
+        """刪除指定名稱的所有檢查點"""
+        try:
+            self.session.query(EngineCheckpoint).filter(EngineCheckpoint.name == name).delete()
+            self.session.commit()
+            return True
+        except Exception as e:
+            self.session.rollback()
+            print(f"Error deleting checkpoints: {e}")
+            return False
+    
     def close(self):
         """關閉數據庫連接"""
         self.session.close()
\ No newline at end of file
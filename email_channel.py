@@ -0,0 +1,135 @@
+import asyncio
+import smtplib
+import ssl
+import time
+from email.message import Message
+from typing import Any, List, Optional, Tuple
+
+class SMTPEmailChannel:
+    """共用 SMTP 連接的異步郵件渠道
+
+    每個發送工作者持有一條已認證 (STARTTLS + LOGIN) 的長連接，
+    從隊列批次取出郵件並在同一連接上連續發送；連接閒置超時後重新建立。
+    smtplib 為阻塞式實現，實際網絡 I/O 在執行緒中進行。
+    """
+
+    def __init__(self, smtp_server: str, smtp_port: int, sender: str,
+                 password: Optional[str] = None, use_starttls: bool = True,
+                 pool_size: int = 2, batch_size: int = 50,
+                 idle_timeout: float = 60, timeout: float = 30):
+        self.smtp_server = smtp_server
+        self.smtp_port = smtp_port
+        self.sender = sender
+        self.password = password
+        self.use_starttls = use_starttls
+        self.pool_size = pool_size
+        self.batch_size = batch_size
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._senders: List[asyncio.Task] = []
+
+    @classmethod
+    def from_config(cls, email_config: dict) -> 'SMTPEmailChannel':
+        return cls(
+            smtp_server=email_config['smtp_server'],
+            smtp_port=email_config['smtp_port'],
+            sender=email_config['sender'],
+            password=email_config.get('password'),
+            use_starttls=email_config.get('use_starttls', True),
+            pool_size=email_config.get('pool_size', 2),
+            batch_size=email_config.get('batch_size', 50),
+            idle_timeout=email_config.get('idle_timeout', 60),
+            timeout=email_config.get('timeout', 30)
+        )
+
+    async def send(self, msg: Message) -> Any:
+        """發送一封郵件；成功返回 True，失敗返回對應的異常"""
+        if self._queue is None:
+            self._queue = asyncio.Queue()
+        if not self._senders:
+            self._senders = [
+                asyncio.create_task(self._sender_loop())
+                for _ in range(self.pool_size)
+            ]
+
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((msg, future))
+        return await future
+
+    async def close(self):
+        """停止發送工作者（各自在退出時關閉連接）"""
+        for sender in self._senders:
+            sender.cancel()
+        await asyncio.gather(*self._senders, return_exceptions=True)
+        self._senders = []
+
+    async def _sender_loop(self):
+        conn: Optional[smtplib.SMTP] = None
+        last_used = 0.0
+        try:
+            while True:
+                batch = [await self._queue.get()]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+
+                # 閒置過久的連接多半已被服務端關閉，直接重建
+                if conn is not None and time.monotonic() - last_used > self.idle_timeout:
+                    await asyncio.to_thread(self._quit, conn)
+                    conn = None
+
+                try:
+                    conn, results = await asyncio.to_thread(
+                        self._send_batch, conn, [msg for msg, _ in batch]
+                    )
+                except Exception as e:
+                    conn, results = None, [e] * len(batch)
+                last_used = time.monotonic()
+
+                for (_, future), result in zip(batch, results):
+                    if not future.done():
+                        future.set_result(result)
+                    self._queue.task_done()
+        finally:
+            if conn is not None:
+                # QUIT 會等待服務端回應，同樣不能阻塞事件循環
+                await asyncio.to_thread(self._quit, conn)
+
+    def _connect(self) -> smtplib.SMTP:
+        conn = smtplib.SMTP(self.smtp_server, self.smtp_port, timeout=self.timeout)
+        conn.ehlo()
+        if self.use_starttls:
+            conn.starttls(context=ssl.create_default_context())
+            conn.ehlo()
+        if self.password:
+            conn.login(self.sender, self.password)
+        return conn
+
+    @staticmethod
+    def _quit(conn: smtplib.SMTP):
+        try:
+            conn.quit()
+        except Exception:
+            conn.close()
+
+    def _send_batch(self, conn: Optional[smtplib.SMTP],
+                    messages: List[Message]) -> Tuple[Optional[smtplib.SMTP], List[Any]]:
+        """在同一連接上依序發送整批郵件，斷線時重連一次"""
+        results = []
+        for msg in messages:
+            try:
+                if conn is None:
+                    conn = self._connect()
+                try:
+                    conn.send_message(msg, from_addr=self.sender)
+                except smtplib.SMTPServerDisconnected:
+                    conn = self._connect()
+                    conn.send_message(msg, from_addr=self.sender)
+                results.append(True)
+            except smtplib.SMTPServerDisconnected as e:
+                conn = None
+                results.append(e)
+            except Exception as e:
+                results.append(e)
+        return conn, results
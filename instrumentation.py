@@ -0,0 +1,259 @@
+import bisect
+import cProfile
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Tuple
+
+from config import CONFIG
+
+# 延遲直方圖的桶上限（秒），50 微秒到 60 秒
+LATENCY_BUCKETS = (
+    0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025,
+    0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0
+)
+
+class _State:
+    enabled = os.environ.get('ADDX_METRICS', '').lower() in ('1', 'true') or \
+        CONFIG['instrumentation']['enabled']
+
+_state = _State()
+
+def enable():
+    _state.enabled = True
+
+def disable():
+    _state.enabled = False
+
+def is_enabled() -> bool:
+    return _state.enabled
+
+class Histogram:
+    """Prometheus 風格的累積桶直方圖"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def percentile(self, q: float) -> float:
+        """按桶內線性插值估算分位數（不超過觀測到的最大值）"""
+        if self.count == 0:
+            return 0.0
+        return min(self._interpolate(q), self.max)
+
+    def _interpolate(self, q: float) -> float:
+        rank = q * self.count
+        cumulative = 0
+        for i, bucket_count in enumerate(self.counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[i - 1] if i > 0 else 0.0
+                upper = self.buckets[i] if i < len(self.buckets) else self.buckets[-1]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        return {
+            'count': self.count,
+            'sum': self.sum,
+            'mean': self.sum / self.count if self.count else 0.0,
+            'p50': self.percentile(0.5),
+            'p90': self.percentile(0.9),
+            'p99': self.percentile(0.99),
+            'max': self.max
+        }
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+def _format_labels(labels: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(labels) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+class MetricsRegistry:
+    """計數器與直方圖的集合，可導出為 Prometheus 文本或 JSON"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, Dict[LabelKey, float]] = {}
+        self.histograms: Dict[str, Dict[LabelKey, Histogram]] = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.counters.setdefault(name, {})
+            series[key] = series.get(key, 0) + value
+
+    def observe(self, name: str, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self.histograms.setdefault(name, {})
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = Histogram()
+            histogram.observe(value)
+
+    def histogram(self, name: str, **labels) -> Optional[Histogram]:
+        return self.histograms.get(name, {}).get(tuple(sorted(labels.items())))
+
+    def reset(self):
+        with self._lock:
+            self.counters.clear()
+            self.histograms.clear()
+
+    def to_prometheus(self) -> str:
+        lines = []
+        with self._lock:
+            for name, series in sorted(self.counters.items()):
+                lines.append(f"# TYPE {name} counter")
+                for labels, value in series.items():
+                    lines.append(f"{name}{_format_labels(labels)} {value}")
+            for name, series in sorted(self.histograms.items()):
+                lines.append(f"# TYPE {name} histogram")
+                for labels, histogram in series.items():
+                    cumulative = 0
+                    for bound, bucket_count in zip(histogram.buckets, histogram.counts):
+                        cumulative += bucket_count
+                        lines.append(f"{name}_bucket{_format_labels(labels, ('le', str(bound)))} {cumulative}")
+                    lines.append(f"{name}_bucket{_format_labels(labels, ('le', '+Inf'))} {histogram.count}")
+                    lines.append(f"{name}_sum{_format_labels(labels)} {histogram.sum}")
+                    lines.append(f"{name}_count{_format_labels(labels)} {histogram.count}")
+        return '\n'.join(lines) + '\n'
+
+    def to_dict(self) -> Dict[str, list]:
+        with self._lock:
+            return {
+                'counters': [
+                    {'name': name, 'labels': dict(labels), 'value': value}
+                    for name, series in self.counters.items()
+                    for labels, value in series.items()
+                ],
+                'histograms': [
+                    {'name': name, 'labels': dict(labels), **histogram.summary()}
+                    for name, series in self.histograms.items()
+                    for labels, histogram in series.items()
+                ]
+            }
+
+    def write_json_report(self, path: str):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+registry = MetricsRegistry()
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+_NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ('name', 'labels', 'start')
+
+    def __init__(self, name, labels):
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        if exc_type is not None:
+            registry.incr(f"{self.name}_errors", **self.labels)
+        return False
+
+def timer(name: str, **labels):
+    """計時上下文管理器；停用時返回共用的空操作對象"""
+    if not _state.enabled:
+        return _NULL_TIMER
+    return _Timer(name, labels)
+
+def incr(name: str, value: float = 1, **labels):
+    if _state.enabled:
+        registry.incr(name, value, **labels)
+
+def timed(name: str, **labels):
+    """為同步或異步函數計時的裝飾器"""
+    def decorator(func):
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _state.enabled:
+                    return await func(*args, **kwargs)
+                with _Timer(name, labels):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return func(*args, **kwargs)
+            with _Timer(name, labels):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+@contextmanager
+def profile_run(name: str, enabled: Optional[bool] = None):
+    """以 cProfile 剖析一次執行，結果寫入 profile_dir/<name>-<時間>.prof"""
+    if enabled is None:
+        enabled = CONFIG['instrumentation']['profile_runs']
+    if not enabled:
+        yield None
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profile_dir = CONFIG['instrumentation']['profile_dir']
+        os.makedirs(profile_dir, exist_ok=True)
+        profiler.dump_stats(os.path.join(profile_dir, f"{name}-{int(time.time())}.prof"))
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.startswith('/metrics.json'):
+            body = json.dumps(registry.to_dict()).encode()
+            content_type = 'application/json'
+        elif self.path.startswith('/metrics'):
+            body = registry.to_prometheus().encode()
+            content_type = 'text/plain; version=0.0.4'
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+def start_metrics_server(port: Optional[int] = None, host: str = '0.0.0.0') -> ThreadingHTTPServer:
+    """在背景執行緒提供 /metrics（Prometheus 文本）與 /metrics.json"""
+    server = ThreadingHTTPServer((host, port or CONFIG['instrumentation']['port']), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
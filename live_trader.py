@@ -0,0 +1,292 @@
+"""實盤交易循環
+
+每一步：取數 → 技術指標 → 括號單出場 → 信號 → 下單前風控 → 成交 → 數據庫記錄 → 通知
+→ 投資組合快照 → 檢查點。
+fetcher 與 clock 可替換為 market_replay 的 ReplayFetcher 與 SimulatedClock，
+以與實盤完全相同的代碼路徑離線回放並壓力測試。
+
+只處理已收盤的K線（時間戳 + timeframe 不晚於當前時間），尚在形成中的最後一根等收盤後再處理。
+止損/止盈/移動止損與回測共用 bracket_orders 與 CONFIG['backtest']['brackets']。
+機器人與風控引擎的持倉、敞口及已處理的K線一併保存到檢查點，重啟後第一步先恢復。
+
+成交為模擬成交（以最新收盤價或括號單觸發價全部成交）；接入交易所下單時替換 _execute_order。
+"""
+import asyncio
+import re
+import time
+from typing import Any, Dict, List, Optional
+
+from bracket_orders import BRACKET_KEYS, normalize_brackets, brackets_enabled, find_bracket_exit
+from config import CONFIG
+from instrumentation import timer, incr
+from market_replay import timeframe_delta
+
+class LiveTrader:
+    def __init__(self, user_id: str, symbols: List[str], fetcher=None, bot=None, risk_engine=None,
+                 db=None, notifications=None, clock=None, recipients: Optional[Dict[str, Any]] = None,
+                 checkpoint_manager=None, brackets: Optional[Dict[str, Any]] = None,
+                 timeframe: Optional[str] = None):
+        settings = CONFIG['live']
+        self.user_id = user_id
+        self.symbols = symbols
+        self.timeframe = timeframe or settings['timeframe']
+        self.bar_duration = timeframe_delta(self.timeframe)
+        self.lookback = settings['lookback']
+        self.channels = settings['notification_channels']
+        # 通知接收者（如 telegram_chat_id、line_user_id、email），合併到每條通知
+        self.recipients = recipients or {}
+        # 默認括號單，信號中的同名欄位優先（與回測相同）
+        self.brackets = normalize_brackets(
+            brackets if brackets is not None else CONFIG['backtest']['brackets']
+        )
+        self._fetcher = fetcher
+        self._bot = bot
+        self._risk_engine = risk_engine
+        self._db = db
+        self._notifications = notifications
+        self._clock = clock
+        self._checkpoint_manager = checkpoint_manager
+        self.checkpoint_name = f"live-{re.sub(r'[^A-Za-z0-9_-]', '_', user_id)}"
+        self._restored = False
+        self._last_checkpoint = 0.0
+        self._last_bar: Dict[str, Any] = {}
+        self._last_price: Dict[str, float] = {}
+        self._fills = 0
+
+    @property
+    def fetcher(self):
+        if self._fetcher is None:
+            from seo_optimizer import AdvancedMarketDataFetcher
+            self._fetcher = AdvancedMarketDataFetcher()
+        return self._fetcher
+
+    @property
+    def bot(self):
+        if self._bot is None:
+            from seo_optimizer import AdvancedTradingBot
+            self._bot = AdvancedTradingBot(CONFIG['trading']['initial_capital'])
+        return self._bot
+
+    @property
+    def risk_engine(self):
+        if self._risk_engine is None:
+            from risk_engine import PreTradeRiskEngine
+            self._risk_engine = PreTradeRiskEngine()
+        return self._risk_engine
+
+    @property
+    def db(self):
+        if self._db is None:
+            from database_handler import DatabaseManager
+            self._db = DatabaseManager(CONFIG['database']['url'])
+        return self._db
+
+    @property
+    def notifications(self):
+        if self._notifications is None:
+            from notification_system import NotificationSystem
+            self._notifications = NotificationSystem(db=self.db)
+        return self._notifications
+
+    @property
+    def clock(self):
+        if self._clock is None:
+            from market_replay import SystemClock
+            self._clock = SystemClock()
+        return self._clock
+
+    @property
+    def checkpoint_manager(self):
+        if self._checkpoint_manager is None:
+            from checkpoint import CheckpointManager
+            self._checkpoint_manager = CheckpointManager()
+        return self._checkpoint_manager
+
+    def get_state(self) -> Dict[str, Any]:
+        """機器人（資金、持倉、模型）、風控引擎的敞口，以及每個標的已處理的最後一根K線"""
+        return {
+            'bot': self.bot.get_state(),
+            'risk_engine': self.risk_engine.get_state(),
+            'last_bar': dict(self._last_bar),
+            'last_price': dict(self._last_price)
+        }
+
+    def set_state(self, state: Dict[str, Any]):
+        self.bot.set_state(state['bot'])
+        self.risk_engine.set_state(state['risk_engine'])
+        self._last_bar = dict(state['last_bar'])
+        self._last_price = dict(state['last_price'])
+
+    async def restore(self) -> bool:
+        """從最新檢查點恢復，成功返回 True"""
+        state = await self.checkpoint_manager.load_latest(self.checkpoint_name)
+        if state is None:
+            return False
+        self.set_state(state)
+        return True
+
+    async def checkpoint(self, force: bool = False) -> bool:
+        """距上次保存超過 live_interval_seconds（或 force）時保存檢查點"""
+        now = time.monotonic()
+        if not force and now - self._last_checkpoint < CONFIG['checkpoint']['live_interval_seconds']:
+            return False
+        await self.checkpoint_manager.save(self.checkpoint_name, self.get_state())
+        self._last_checkpoint = now
+        return True
+
+    def _closed_bars(self, data, now):
+        """只保留已收盤的K線：交易所返回的最後一根可能仍在形成中（與 ReplayFetcher 一致）"""
+        if data.index.tz is not None and now.tz is None:
+            now = now.tz_localize('UTC').tz_convert(data.index.tz)
+        return data[data.index + self.bar_duration <= now]
+
+    def _evaluate(self, data):
+        """計算指標與信號（CPU 密集，在執行緒中執行）"""
+        df = self.bot.calculate_technical_indicators(data.copy())
+        return df, self.bot.generate_advanced_signals(df)
+
+    async def step(self):
+        """處理每個標的自上一步以來的新K線"""
+        if not self._restored:
+            # 重啟後先恢復持倉與敞口，避免機器人與風控引擎不一致或重複處理同一根K線
+            self._restored = True
+            await self.restore()
+        with timer('live_step_seconds'):
+            fills = self._fills
+            frames = await asyncio.gather(*[
+                self.fetcher.get_historical_data(symbol, self.timeframe, limit=self.lookback)
+                for symbol in self.symbols
+            ])
+            now = self.clock.now()
+            for symbol, data in zip(self.symbols, frames):
+                if data is None or data.empty:
+                    continue
+                data = self._closed_bars(data, now)
+                if data.empty or data.index[-1] == self._last_bar.get(symbol):
+                    continue
+                self._last_bar[symbol] = data.index[-1]
+                self._last_price[symbol] = float(data['Close'].iloc[-1])
+                # 括號單在K線內觸發，先於收盤價產生的信號執行
+                await self._check_exits(symbol, data)
+                try:
+                    df, signals = await asyncio.to_thread(self._evaluate, data)
+                except Exception as e:
+                    print(f"Error evaluating {symbol}: {e}")
+                    continue
+                for signal in signals:
+                    await self._handle_signal(symbol, signal, df)
+            await self._save_snapshot()
+            # 有成交時立即保存，其餘按間隔保存
+            await self.checkpoint(force=self._fills != fills)
+
+    async def run(self, poll_interval: Optional[float] = None):
+        """實盤輪詢，直到任務被取消；退出時保存檢查點"""
+        poll_interval = poll_interval or CONFIG['live']['poll_interval']
+        try:
+            while True:
+                await self.step()
+                await self.clock.sleep(poll_interval)
+        finally:
+            await self.checkpoint(force=True)
+
+    async def _check_exits(self, symbol: str, data):
+        """以開倉後的K線搜索持倉的止損/止盈/移動止損，觸發時按觸發價平倉"""
+        position = self.bot.positions.get(symbol)
+        if position is None or not brackets_enabled(position.get('brackets') or {}):
+            return
+        after = data[data.index > position.get('entry_bar', position['entry_time'])]
+        if after.empty:
+            return
+        exit_ = find_bracket_exit(
+            after['Open'].to_numpy(dtype=float), after['High'].to_numpy(dtype=float),
+            after['Low'].to_numpy(dtype=float), position['entry_price'], position['brackets']
+        )
+        if exit_ is not None:
+            _, price, reason = exit_
+            await self._execute_order(symbol, 'SELL', position['quantity'], price, {'reason': reason})
+
+    async def _handle_signal(self, symbol: str, signal: Dict[str, Any], df):
+        price = float(df['Close'].iloc[-1])
+        action = signal['action']
+        if action == 'BUY':
+            quantity = self.bot.capital * signal['suggested_size'] / price
+        elif action == 'SELL' and symbol in self.bot.positions:
+            quantity = self.bot.positions[symbol]['quantity']
+        else:
+            return
+        if quantity <= 0:
+            return
+
+        accepted, reason = self.risk_engine.check_order(
+            self.user_id, symbol, action, quantity, price, volatility=df['Volatility'].iloc[-1]
+        )
+        if not accepted:
+            incr('live_orders_rejected_total', reason=reason)
+            return
+        await self._execute_order(symbol, action, quantity, price, signal)
+
+    async def _execute_order(self, symbol: str, action: str, quantity: float, price: float,
+                             signal: Dict[str, Any]):
+        timestamp = self.clock.now().to_pydatetime()
+        profit_loss = self.risk_engine.on_fill(self.user_id, symbol, action, quantity, price)
+        self._fills += 1
+        value = quantity * price
+        if action == 'BUY':
+            self.bot.capital -= value
+            position = self.bot.positions.get(symbol)
+            if position is None:
+                self.bot.positions[symbol] = {
+                    'quantity': quantity,
+                    'entry_price': price,
+                    'entry_time': timestamp,
+                    # 開倉K線，括號單從其後的K線開始檢查
+                    'entry_bar': self._last_bar.get(symbol),
+                    'brackets': {
+                        **self.brackets,
+                        **{key: signal[key] for key in BRACKET_KEYS if key in signal}
+                    }
+                }
+            else:
+                total = position['quantity'] + quantity
+                position['entry_price'] = (position['quantity'] * position['entry_price'] + value) / total
+                position['quantity'] = total
+        else:
+            self.bot.capital += value
+            del self.bot.positions[symbol]
+        incr('live_orders_filled_total', action=action)
+
+        await self.db.save_trade({
+            'timestamp': timestamp,
+            'user_id': self.user_id,
+            'symbol': symbol,
+            'action': action,
+            'price': price,
+            'quantity': quantity,
+            'total_value': value,
+            'strategy': signal.get('reason', 'unknown'),
+            'profit_loss': profit_loss,
+            'status': 'OPEN' if action == 'BUY' else 'CLOSED'
+        })
+        await self.notifications.send_notification(self.user_id, {
+            'title': f'{action} {symbol}',
+            'content': f'{action} {quantity:.4f} {symbol} @ {price:.2f}（{signal.get("reason", "")}）',
+            'priority': 'normal',
+            **self.recipients
+        }, self.channels)
+
+    async def _save_snapshot(self):
+        positions_value = sum(
+            position['quantity'] * self._last_price.get(symbol, position['entry_price'])
+            for symbol, position in self.bot.positions.items()
+        )
+        await self.db.save_portfolio_snapshot({
+            'user_id': self.user_id,
+            'timestamp': self.clock.now().to_pydatetime(),
+            'total_value': self.bot.capital + positions_value,
+            'cash_balance': self.bot.capital,
+            'positions': {
+                symbol: {'quantity': position['quantity'], 'entry_price': position['entry_price']}
+                for symbol, position in self.bot.positions.items()
+            },
+            'metrics': self.risk_engine.exposure(self.user_id)
+        })
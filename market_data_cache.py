@@ -0,0 +1,155 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from config import CONFIG
+
+def _run(coro):
+    """在沒有事件循環的執行緒（如 Streamlit 腳本）中執行協程"""
+    return asyncio.run(coro)
+
+def symbol_ttl(symbol: str) -> float:
+    """按市場類型決定緩存秒數：加密貨幣 24 小時交易，刷新較頻繁"""
+    ttls = CONFIG['dashboard']['ttl']
+    if '/' in symbol:
+        return ttls['crypto']
+    if symbol.endswith('=F'):
+        return ttls['futures']
+    return ttls['stock']
+
+def downsample(df: pd.DataFrame, max_points: int) -> pd.DataFrame:
+    """按屏幕解析度降採樣：每個區間保留最小與最大值，保持曲線形狀"""
+    if len(df) <= max_points or max_points < 2:
+        return df
+    n_buckets = max_points // 2
+    buckets = np.arange(len(df)) * n_buckets // len(df)
+    # 以第一列決定各區間的極值位置，所有列共用同一組時間點
+    series = df.iloc[:, 0].astype(float).reset_index(drop=True).ffill().bfill()
+    grouped = series.groupby(buckets)
+    keep = np.union1d(grouped.idxmin().to_numpy(), grouped.idxmax().to_numpy())
+    keep = np.union1d(keep, [0, len(df) - 1])
+    return df.iloc[keep]
+
+class MarketDataCache:
+    """按標的緩存K線，過期後只拉取最後一根K線之後的新數據"""
+
+    def __init__(self, fetcher=None, timeframe: str = '1d', lookback: Optional[int] = None):
+        self._fetcher = fetcher
+        self.timeframe = timeframe
+        self.lookback = lookback or CONFIG['dashboard']['lookback_days']
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=CONFIG['dashboard']['fetch_workers'])
+
+    @property
+    def fetcher(self):
+        if self._fetcher is None:
+            from seo_optimizer import AdvancedMarketDataFetcher
+            self._fetcher = AdvancedMarketDataFetcher()
+        return self._fetcher
+
+    def _symbol_lock(self, symbol: str) -> threading.Lock:
+        with self._lock:
+            return self._locks.setdefault(symbol, threading.Lock())
+
+    def is_fresh(self, symbol: str) -> bool:
+        fetched_at = self._fetched_at.get(symbol)
+        return fetched_at is not None and time.monotonic() - fetched_at < symbol_ttl(symbol)
+
+    def get_bars(self, symbol: str) -> Optional[pd.DataFrame]:
+        """返回標的K線；緩存未過期時不發出任何請求"""
+        if self.is_fresh(symbol):
+            return self._frames.get(symbol)
+
+        with self._symbol_lock(symbol):
+            # 等待鎖期間可能已被其他會話刷新
+            if self.is_fresh(symbol):
+                return self._frames.get(symbol)
+
+            cached = self._frames.get(symbol)
+            if cached is not None and not cached.empty:
+                # 從最後一根K線開始重取，該K線可能尚未收盤
+                new_bars = _run(self.fetcher.get_historical_data(
+                    symbol, self.timeframe, limit=self.lookback, start=cached.index[-1]
+                ))
+                if new_bars is not None and not new_bars.empty:
+                    merged = pd.concat([cached, new_bars])
+                    cached = merged[~merged.index.duplicated(keep='last')].sort_index()
+            else:
+                cached = _run(self.fetcher.get_historical_data(
+                    symbol, self.timeframe, limit=self.lookback
+                ))
+
+            if cached is not None:
+                # 只保留最近 lookback 根，長時間運行時記憶體與降採樣成本不會增長
+                cached = cached.iloc[-self.lookback:]
+                self._frames[symbol] = cached
+            self._fetched_at[symbol] = time.monotonic()
+            return cached
+
+    def get_many(self, symbols: List[str]) -> Dict[str, pd.DataFrame]:
+        """並行刷新過期的標的，未過期的直接取自緩存"""
+        stale = [symbol for symbol in symbols if not self.is_fresh(symbol)]
+        if stale:
+            list(self._executor.map(self.get_bars, stale))
+        return {
+            symbol: self._frames[symbol]
+            for symbol in symbols
+            if self._frames.get(symbol) is not None
+        }
+
+class PortfolioHistoryCache:
+    """緩存投資組合快照，只查詢上次之後新增的記錄"""
+
+    def __init__(self, db=None, ttl: Optional[float] = None):
+        self._db = db
+        self.ttl = ttl or CONFIG['dashboard']['ttl']['portfolio']
+        self._frames: Dict[str, pd.DataFrame] = {}
+        self._fetched_at: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    @property
+    def db(self):
+        if self._db is None:
+            from database_handler import DatabaseManager
+            self._db = DatabaseManager(CONFIG['database']['url'])
+        return self._db
+
+    def get_history(self, user_id: str) -> pd.DataFrame:
+        fetched_at = self._fetched_at.get(user_id)
+        if fetched_at is not None and time.monotonic() - fetched_at < self.ttl:
+            return self._frames[user_id]
+
+        with self._lock:
+            cached = self._frames.get(user_id)
+            start_date = None
+            if cached is not None and not cached.empty:
+                start_date = cached.index[-1].to_pydatetime()
+
+            snapshots = _run(self.db.get_portfolio_history(user_id, start_date=start_date))
+            new_rows = pd.DataFrame(
+                [
+                    {
+                        'timestamp': snapshot.timestamp,
+                        'total_value': snapshot.total_value,
+                        'cash_balance': snapshot.cash_balance,
+                        'positions': len(snapshot.positions or {})
+                    }
+                    for snapshot in snapshots
+                ],
+                columns=['timestamp', 'total_value', 'cash_balance', 'positions']
+            ).set_index('timestamp')
+
+            if cached is not None:
+                merged = pd.concat([cached, new_rows])
+                new_rows = merged[~merged.index.duplicated(keep='last')]
+            self._frames[user_id] = new_rows
+            self._fetched_at[user_id] = time.monotonic()
+            return new_rows
@@ -0,0 +1,277 @@
+"""錄製行情與加速回放
+
+RecordingFetcher 包裝真實的 AdvancedMarketDataFetcher，把取得的K線、成交與盤口快照
+寫入本地 MarketDataStore；ReplayFetcher 提供相同的異步接口，但只返回模擬時鐘
+當前時間之前的數據。MarketReplay 按錄製的事件時間推進時鐘，可選實時、N 倍速
+或不等待（as fast as possible），每個事件驅動一次實盤循環（LiveTrader.step）。
+"""
+import asyncio
+import bisect
+import json
+import os
+import re
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from config import CONFIG
+from instrumentation import Histogram, timer
+
+def _symbol_dir(symbol: str) -> str:
+    return re.sub(r'[^A-Za-z0-9=_-]', '_', symbol)
+
+def timeframe_delta(timeframe: str) -> pd.Timedelta:
+    """K線週期（ccxt / yfinance 格式，如 1m、15m、1h、1d、1w、1wk）對應的時長"""
+    match = re.fullmatch(r'(\d+)(m|h|d|w|wk)', timeframe)
+    if match is None:
+        raise ValueError(f"Unsupported timeframe: {timeframe}")
+    count, unit = match.groups()
+    minutes = {'m': 1, 'h': 60, 'd': 1440, 'w': 10080, 'wk': 10080}[unit]
+    return pd.Timedelta(minutes=int(count) * minutes)
+
+def _to_timestamp(value) -> pd.Timestamp:
+    if isinstance(value, (int, float)):
+        return pd.Timestamp(value, unit='ms')
+    return pd.Timestamp(value)
+
+class MarketDataStore:
+    """本地行情庫：每個標的一個目錄，K線為 pickle，成交與盤口快照為 JSON lines"""
+
+    def __init__(self, directory: Optional[str] = None):
+        self.directory = directory or CONFIG['replay']['data_dir']
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, symbol: str, name: str) -> str:
+        path = os.path.join(self.directory, _symbol_dir(symbol))
+        os.makedirs(path, exist_ok=True)
+        return os.path.join(path, name)
+
+    def symbols(self) -> List[str]:
+        symbols = []
+        for name in sorted(os.listdir(self.directory)):
+            meta = os.path.join(self.directory, name, 'symbol')
+            if os.path.exists(meta):
+                with open(meta) as f:
+                    symbols.append(f.read().strip())
+        return symbols
+
+    def save_bars(self, symbol: str, bars: pd.DataFrame):
+        """合併新K線（同時間戳以新數據為準）"""
+        existing = self.load_bars(symbol)
+        if existing is not None:
+            bars = pd.concat([existing, bars])
+            bars = bars[~bars.index.duplicated(keep='last')].sort_index()
+        tmp_path = self._path(symbol, 'bars.pkl.tmp')
+        bars.to_pickle(tmp_path)
+        os.replace(tmp_path, self._path(symbol, 'bars.pkl'))
+        with open(self._path(symbol, 'symbol'), 'w') as f:
+            f.write(symbol)
+
+    def load_bars(self, symbol: str) -> Optional[pd.DataFrame]:
+        path = self._path(symbol, 'bars.pkl')
+        if not os.path.exists(path):
+            return None
+        return pd.read_pickle(path)
+
+    def _append(self, symbol: str, name: str, records: List[Dict[str, Any]]):
+        with open(self._path(symbol, name), 'a') as f:
+            for record in records:
+                f.write(json.dumps(record, default=str) + '\n')
+        with open(self._path(symbol, 'symbol'), 'w') as f:
+            f.write(symbol)
+
+    def _load(self, symbol: str, name: str) -> List[Dict[str, Any]]:
+        path = self._path(symbol, name)
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            records = [json.loads(line) for line in f if line.strip()]
+        return sorted(records, key=lambda record: _to_timestamp(record['timestamp']))
+
+    def save_trades(self, symbol: str, trades: List[Dict[str, Any]]):
+        self._append(symbol, 'trades.jsonl', trades)
+
+    def load_trades(self, symbol: str) -> List[Dict[str, Any]]:
+        return self._load(symbol, 'trades.jsonl')
+
+    def save_order_book(self, symbol: str, timestamp, book: Dict[str, Any]):
+        self._append(symbol, 'depth.jsonl', [{'timestamp': str(timestamp), **book}])
+
+    def load_order_books(self, symbol: str) -> List[Dict[str, Any]]:
+        return self._load(symbol, 'depth.jsonl')
+
+class RecordingFetcher:
+    """代理真實行情接口，並把每次取得的數據寫入 MarketDataStore"""
+
+    def __init__(self, fetcher, store: MarketDataStore):
+        self.fetcher = fetcher
+        self.store = store
+
+    async def get_market_depth(self, symbol, market_type):
+        book = await self.fetcher.get_market_depth(symbol, market_type)
+        if book is not None:
+            await asyncio.to_thread(self.store.save_order_book, symbol, datetime.utcnow(), book)
+        return book
+
+    async def get_historical_data(self, symbol, timeframe='1d', limit=100, start=None):
+        data = await self.fetcher.get_historical_data(symbol, timeframe, limit=limit, start=start)
+        if data is not None and not data.empty:
+            await asyncio.to_thread(self.store.save_bars, symbol, data)
+        return data
+
+    async def get_recent_trades(self, symbol, limit=100):
+        trades = await self.fetcher.get_recent_trades(symbol, limit=limit)
+        if trades:
+            await asyncio.to_thread(self.store.save_trades, symbol, trades)
+        return trades
+
+class SystemClock:
+    """實盤時鐘，返回不帶時區的 UTC 時間（與 ccxt K線時間戳一致）"""
+
+    def now(self) -> pd.Timestamp:
+        return pd.Timestamp.now(tz='UTC').tz_localize(None)
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+class SimulatedClock:
+    """模擬時鐘：speed 為相對真實時間的倍數，None 表示不等待直接跳到目標時間
+
+    按倍速等待時以首次推進的真實時間為錨點，處理較慢時不再額外等待，誤差不會累積。
+    """
+
+    def __init__(self, start, speed: Optional[float] = None):
+        self.current = pd.Timestamp(start)
+        self.speed = speed
+        self._anchor = None
+
+    def now(self) -> pd.Timestamp:
+        return self.current
+
+    def due(self, target) -> float:
+        """按倍速計算模擬時間 target 應到達的真實時間（perf_counter 秒）"""
+        if self._anchor is None:
+            self._anchor = (time.perf_counter(), self.current)
+        wall_start, sim_start = self._anchor
+        return wall_start + (pd.Timestamp(target) - sim_start).total_seconds() / self.speed
+
+    async def advance_to(self, target):
+        target = pd.Timestamp(target)
+        if target <= self.current:
+            return
+        if self.speed:
+            await asyncio.sleep(max(0.0, self.due(target) - time.perf_counter()))
+        else:
+            await asyncio.sleep(0)
+        self.current = target
+
+    async def sleep(self, seconds: float):
+        await self.advance_to(self.current + pd.Timedelta(seconds=seconds))
+
+class ReplayFetcher:
+    """與 AdvancedMarketDataFetcher 相同的異步接口，只返回模擬時間之前已發生的數據
+
+    yfinance 與 ccxt 都以開盤時間標記K線，因此K線在 時間戳 + timeframe（收盤）時才可見；
+    每次查詢以二分搜索定位，與錄製長度無關。
+    """
+
+    def __init__(self, store: MarketDataStore, clock: SimulatedClock, symbols: Optional[List[str]] = None,
+                 timeframe: Optional[str] = None):
+        self.clock = clock
+        # 錄製K線的週期
+        self.bar_duration = timeframe_delta(timeframe or CONFIG['live']['timeframe'])
+        self.bars: Dict[str, pd.DataFrame] = {}
+        self.trades: Dict[str, List[Dict[str, Any]]] = {}
+        self.trade_times: Dict[str, List[pd.Timestamp]] = {}
+        self.books: Dict[str, List[Dict[str, Any]]] = {}
+        self.book_times: Dict[str, List[pd.Timestamp]] = {}
+        for symbol in symbols or store.symbols():
+            bars = store.load_bars(symbol)
+            if bars is not None:
+                self.bars[symbol] = bars
+            self.trades[symbol] = store.load_trades(symbol)
+            self.trade_times[symbol] = [_to_timestamp(t['timestamp']) for t in self.trades[symbol]]
+            self.books[symbol] = store.load_order_books(symbol)
+            self.book_times[symbol] = [_to_timestamp(b['timestamp']) for b in self.books[symbol]]
+
+    def event_times(self) -> List[pd.Timestamp]:
+        """所有標的K線收盤時間的有序並集，作為回放的事件序列"""
+        index = pd.DatetimeIndex([])
+        for bars in self.bars.values():
+            index = index.union(bars.index + self.bar_duration)
+        return list(index)
+
+    async def get_market_depth(self, symbol, market_type):
+        times = self.book_times.get(symbol) or []
+        i = bisect.bisect_right(times, self.clock.now())
+        if i == 0:
+            return None
+        book = self.books[symbol][i - 1]
+        return {'bids': book['bids'][:10], 'asks': book['asks'][:10]}
+
+    async def get_historical_data(self, symbol, timeframe='1d', limit=100, start=None):
+        bars = self.bars.get(symbol)
+        if bars is None:
+            return None
+        # 只返回已收盤的K線
+        end = bars.index.searchsorted(self.clock.now() - self.bar_duration, side='right')
+        if start is not None:
+            begin = bars.index.searchsorted(pd.Timestamp(start), side='left')
+        else:
+            begin = max(0, end - limit)
+        return bars.iloc[begin:end]
+
+    async def get_recent_trades(self, symbol, limit=100):
+        end = bisect.bisect_right(self.trade_times.get(symbol) or [], self.clock.now())
+        return self.trades.get(symbol, [])[max(0, end - limit):end]
+
+class MarketReplay:
+    """按錄製的事件時間推進模擬時鐘，每個事件調用一次 handler()
+
+    返回事件數、實際耗時、模擬時間跨度、達到的倍速，以及處理延遲分佈
+    （handler 開始時相對該事件排程時間的落後程度，持續增長表示跟不上指定倍速）。
+    """
+
+    def __init__(self, fetcher: ReplayFetcher, clock: SimulatedClock):
+        self.fetcher = fetcher
+        self.clock = clock
+
+    async def run(self, handler, start=None, end=None, max_events: Optional[int] = None) -> Dict[str, Any]:
+        events = self.fetcher.event_times()
+        if start is not None:
+            events = [t for t in events if t >= pd.Timestamp(start)]
+        if end is not None:
+            events = [t for t in events if t <= pd.Timestamp(end)]
+        if max_events is not None:
+            events = events[:max_events]
+        if not events:
+            return {'events': 0}
+
+        step_latency = Histogram()
+        lag = Histogram()
+        wall_start = time.perf_counter()
+        sim_start = events[0]
+        for event in events:
+            await self.clock.advance_to(event)
+            step_start = time.perf_counter()
+            with timer('replay_step_seconds'):
+                result = handler()
+                if asyncio.iscoroutine(result):
+                    await result
+            finished = time.perf_counter()
+            step_latency.observe(finished - step_start)
+            if self.clock.speed:
+                lag.observe(max(0.0, step_start - self.clock.due(event)))
+
+        wall = time.perf_counter() - wall_start
+        simulated = (events[-1] - sim_start).total_seconds()
+        return {
+            'events': len(events),
+            'wall_seconds': wall,
+            'simulated_seconds': simulated,
+            'achieved_speed': simulated / wall if wall > 0 else None,
+            'step_seconds': step_latency.summary(),
+            'lag_seconds': lag.summary() if self.clock.speed else None
+        }
@@ -0,0 +1,55 @@
+import time
+from collections import OrderedDict, deque
+from itertools import islice
+from typing import Dict, Any, List, Optional
+
+class NotificationHistory:
+    """有界的通知歷史：每個用戶一個環形緩衝區，追加 O(1)，讀取 O(limit)"""
+
+    def __init__(self, max_per_user: int = 500, max_users: int = 100000,
+                 retention_seconds: Optional[float] = None):
+        self.max_per_user = max_per_user
+        self.max_users = max_users
+        self.retention_seconds = retention_seconds
+        self._buffers: 'OrderedDict[str, deque]' = OrderedDict()
+
+    def append(self, record: Dict[str, Any]):
+        """記錄一則通知，超出容量時淘汰最舊的記錄或最久未活動的用戶"""
+        user_id = record['user_id']
+        buffer = self._buffers.get(user_id)
+        if buffer is None:
+            buffer = deque(maxlen=self.max_per_user)
+            self._buffers[user_id] = buffer
+            if len(self._buffers) > self.max_users:
+                self._buffers.popitem(last=False)
+        else:
+            self._buffers.move_to_end(user_id)
+
+        now = time.time()
+        buffer.append((now, record))
+        self._expire(buffer, now)
+
+    def _expire(self, buffer: deque, now: float):
+        # 緩衝區按時間排序，只需從左端移除過期記錄
+        if self.retention_seconds is None:
+            return
+        cutoff = now - self.retention_seconds
+        while buffer and buffer[0][0] < cutoff:
+            buffer.popleft()
+
+    def get(self, user_id: str, limit: int = 50) -> List[Dict[str, Any]]:
+        """返回用戶最近的 limit 則通知（由舊到新）"""
+        buffer = self._buffers.get(user_id)
+        if not buffer:
+            return []
+        self._expire(buffer, time.time())
+        latest = [record for _, record in islice(reversed(buffer), limit)]
+        latest.reverse()
+        return latest
+
+    def clear(self, user_id: str):
+        """清除單一用戶的通知歷史"""
+        self._buffers.pop(user_id, None)
+
+    def __len__(self) -> int:
+        return sum(len(buffer) for buffer in self._buffers.values())
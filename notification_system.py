@@ -5,16 +5,295 @@ import requests
 import json
 from datetime import datetime
 import asyncio
+import random
+from collections import deque
 import aiohttp
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional, Tuple
+from config import CONFIG
+from rate_limiter import TokenBucket, KeyedRateLimiter
+from notification_history import NotificationHistory
+from email_channel import SMTPEmailChannel
+from instrumentation import timer, timed, incr
+
+class RetryableDeliveryError(Exception):
+    """可重試的發送錯誤（429、5xx、連線錯誤）"""
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
 
 class NotificationSystem:
-    def __init__(self):
-        self.notification_queue = asyncio.Queue()
-        self.notification_history = []
+    def __init__(self, num_workers: Optional[int] = None, db=None):
+        settings = CONFIG.get('notifications', {})
+        self.settings = settings
+        self.num_workers = num_workers or settings.get('workers', 4)
+        self.notification_queue = asyncio.Queue(maxsize=settings.get('queue_maxsize', 0))
+        history_settings = settings.get('history', {})
+        self.notification_history = NotificationHistory(
+            max_per_user=history_settings.get('max_per_user', 500),
+            max_users=history_settings.get('max_users', 100000),
+            retention_seconds=history_settings.get('retention_seconds')
+        )
+        
+        # 每個渠道一個長期存活的連接池，避免每則訊息重新握手
+        self._sessions: Dict[str, aiohttp.ClientSession] = {}
+        self._workers: List[asyncio.Task] = []
+        
+        # 每個渠道與每個收件人的令牌桶限流
+        self.channel_limiters: Dict[str, TokenBucket] = {}
+        self.recipient_limiters: Dict[str, KeyedRateLimiter] = {}
+        for channel, limits in settings.get('rate_limits', {}).items():
+            self.channel_limiters[channel] = TokenBucket(limits['rate'], limits.get('burst'))
+            self.recipient_limiters[channel] = KeyedRateLimiter(
+                limits['recipient_rate'], limits.get('recipient_burst')
+            )
+        self.retry_settings = settings.get('retry', {})
+        # 等待限流令牌的通知按 (渠道, 收件人) 排隊，由獨立任務按速率放回派送隊列
+        self._rate_waiting: Dict[Tuple[str, Any], deque] = {}
+        # 延後重試與限流等待的背景任務
+        self._pending_tasks: set = set()
+        
+        # 死信隊列存放於數據庫，首次使用時才建立連接
+        self._db = db
+        self._email_channel: Optional[SMTPEmailChannel] = None
+        
+        # 合併窗口：按 (用戶, 渠道) 暫存非緊急通知，窗口結束後發送一則摘要
+        self.coalesce_settings = settings.get('coalesce', {})
+        self._coalesce_buffers: Dict[Tuple[str, str], Dict[str, Dict[str, Any]]] = {}
+        self._coalesce_timers: Dict[Tuple[str, str], asyncio.Task] = {}
+        
+    async def start(self):
+        """啟動背景派送工作者"""
+        if self._workers:
+            return
+        self._workers = [
+            asyncio.create_task(self._dispatch_worker(i))
+            for i in range(self.num_workers)
+        ]
+    
+    async def stop(self, drain: bool = True):
+        """停止派送工作者並關閉連接池；drain 為 False 時丟棄合併窗口中尚未發送的通知"""
+        if drain and self._workers:
+            await self.flush()
+        
+        timers = list(self._coalesce_timers.values())
+        for timer in timers:
+            timer.cancel()
+        await asyncio.gather(*timers, return_exceptions=True)
+        self._coalesce_timers = {}
+        dropped = sum(len(buffer) for buffer in self._coalesce_buffers.values())
+        if dropped:
+            print(f"Dropped {dropped} coalesced notifications on stop")
+        self._coalesce_buffers = {}
+            
+        for task in [*self._workers, *self._pending_tasks]:
+            task.cancel()
+        await asyncio.gather(*self._workers, *self._pending_tasks, return_exceptions=True)
+        self._workers = []
+        self._pending_tasks = set()
+        self._rate_waiting = {}
+        
+        for session in self._sessions.values():
+            await session.close()
+        self._sessions = {}
+        
+        if self._email_channel is not None:
+            await self._email_channel.close()
+            self._email_channel = None
+    
+    async def flush(self):
+        """立即送出合併窗口中的通知，並等待隊列中所有通知派送完成"""
+        for key in list(self._coalesce_buffers):
+            await self._flush_coalesced(key)
+        await self.notification_queue.join()
+        # 延後重試的通知會在任務結束前放回隊列，等到兩者都清空為止
+        while self._pending_tasks:
+            await asyncio.gather(*list(self._pending_tasks), return_exceptions=True)
+            await self.notification_queue.join()
+    
+    def _get_session(self, channel: str) -> aiohttp.ClientSession:
+        """取得渠道共用的 HTTP 連接池"""
+        session = self._sessions.get(channel)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.settings.get('pool_limit', 100),
+                limit_per_host=self.settings.get('pool_limit_per_host', 30),
+                keepalive_timeout=self.settings.get('keepalive_timeout', 60),
+                ttl_dns_cache=300
+            )
+            session = aiohttp.ClientSession(
+                connector=connector,
+                timeout=aiohttp.ClientTimeout(total=self.settings.get('request_timeout', 10))
+            )
+            self._sessions[channel] = session
+        return session
+    
+    @property
+    def email_channel(self) -> SMTPEmailChannel:
+        if self._email_channel is None:
+            self._email_channel = SMTPEmailChannel.from_config(CONFIG['email'])
+        return self._email_channel
+    
+    @property
+    def db(self):
+        if self._db is None:
+            from database_handler import DatabaseManager
+            self._db = DatabaseManager(CONFIG['database']['url'])
+        return self._db
+    
+    def _track(self, coroutine) -> asyncio.Task:
+        task = asyncio.create_task(coroutine)
+        self._pending_tasks.add(task)
+        task.add_done_callback(self._pending_tasks.discard)
+        return task
+    
+    def _acquire_rate_limit(self, channel: str, recipient: Any, notification: Dict[str, Any]) -> bool:
+        """立即取得收件人與渠道的限流令牌；需要等待時把通知交給對應的等待隊列並返回 False，
+        不佔用派送工作者"""
+        if notification.get('rate_acquired'):
+            return True
+        gates = []
+        if channel in self.recipient_limiters and recipient is not None:
+            gates.append(((channel, recipient), self.recipient_limiters[channel].bucket(recipient)))
+        if channel in self.channel_limiters:
+            gates.append(((channel, None), self.channel_limiters[channel]))
+        for key, bucket in gates:
+            # 已有通知在排隊時直接排在後面，保持發送順序
+            if key in self._rate_waiting or bucket.try_acquire() > 0:
+                waiting = self._rate_waiting.get(key)
+                if waiting is None:
+                    waiting = self._rate_waiting[key] = deque()
+                    self._track(self._drain_rate_limited(key))
+                waiting.append(notification)
+                incr('notifications_rate_limited_total', channel=channel)
+                return False
+        return True
+    
+    async def _drain_rate_limited(self, key: Tuple[str, Any]):
+        """按令牌速率把等待中的通知放回派送隊列（已取得令牌，工作者不再重複取用）"""
+        channel, recipient = key
+        waiting = self._rate_waiting[key]
+        try:
+            while waiting:
+                if recipient is not None:
+                    await self.recipient_limiters[channel].acquire(recipient)
+                if channel in self.channel_limiters:
+                    await self.channel_limiters[channel].acquire()
+                notification = waiting.popleft()
+                await self.notification_queue.put({**notification, 'channels': [channel], 'rate_acquired': True})
+        finally:
+            self._rate_waiting.pop(key, None)
+    
+    def _apply_backoff(self, channel: str, recipient: Any, seconds: float):
+        """服務端限流時暫停令牌補充：只暫停該收件人，
+        渠道的 retry_after_scope 為 'channel'（整個機器人被限流）或沒有收件人時才暫停整個渠道"""
+        scope = self.settings.get('rate_limits', {}).get(channel, {}).get('retry_after_scope', 'recipient')
+        if scope == 'recipient' and channel in self.recipient_limiters and recipient is not None:
+            self.recipient_limiters[channel].bucket(recipient).penalize(seconds)
+        elif channel in self.channel_limiters:
+            self.channel_limiters[channel].penalize(seconds)
+    
+    @staticmethod
+    async def _parse_retry_after(response: aiohttp.ClientResponse) -> Optional[float]:
+        """讀取 Retry-After 標頭或 Telegram 的 parameters.retry_after"""
+        header = response.headers.get('Retry-After')
+        if header:
+            try:
+                return float(header)
+            except ValueError:
+                pass
+        try:
+            body = await response.json(content_type=None)
+            return float(body['parameters']['retry_after'])
+        except Exception:
+            return None
+    
+    def _backoff_delay(self, attempt: int) -> float:
+        """指數退避加隨機抖動"""
+        base = self.retry_settings.get('base_delay', 0.5)
+        cap = self.retry_settings.get('max_delay', 30)
+        return random.uniform(0, min(cap, base * (2 ** attempt)))
+    
+    async def _requeue_after(self, delay: float, notification: Dict[str, Any]):
+        await asyncio.sleep(delay)
+        await self.notification_queue.put(notification)
+    
+    async def _retry_later(self, channel: str, notification: Dict[str, Any], error: str,
+                           delay: Optional[float] = None) -> Optional[bool]:
+        """延後重新放入隊列（只含該渠道）而不在工作者中等待；重試耗盡後寫入死信隊列
+        
+        返回 None 表示已排程重試，False 表示已寫入死信隊列。
+        """
+        attempt = notification.get('attempt', 0)
+        if attempt >= self.retry_settings.get('max_retries', 5):
+            await self._dead_letter(channel, notification, error, attempt + 1)
+            return False
+        if delay is None:
+            delay = self._backoff_delay(attempt)
+        incr('notifications_retried_total', channel=channel)
+        retry = {k: v for k, v in notification.items() if k != 'rate_acquired'}
+        self._track(self._requeue_after(delay, {**retry, 'channels': [channel], 'attempt': attempt + 1}))
+        return None
+    
+    async def _post_with_retry(self, channel: str, recipient: Any, notification: Dict[str, Any],
+                               url: str, **kwargs) -> Optional[bool]:
+        """經限流發送 HTTP 請求，可重試錯誤延後重新入隊，耗盡後寫入死信隊列
+        
+        返回 True 表示成功，False 表示失敗，None 表示在等待限流令牌或已排程重試。
+        """
+        if not self._acquire_rate_limit(channel, recipient, notification):
+            return None
+        session = self._get_session(channel)
+        delay = None
+        try:
+            with timer('notification_send_seconds', channel=channel):
+                async with session.post(url, **kwargs) as response:
+                    if response.status == 200:
+                        incr('notifications_sent_total', channel=channel)
+                        return True
+                    if response.status == 429 or response.status >= 500:
+                        raise RetryableDeliveryError(
+                            f"HTTP {response.status}",
+                            await self._parse_retry_after(response)
+                        )
+                    # 其他 4xx 為永久錯誤，重試無意義
+                    error = f"HTTP {response.status}: {await response.text()}"
+                    await self._dead_letter(channel, notification, error, notification.get('attempt', 0) + 1)
+                    return False
+        except RetryableDeliveryError as e:
+            error = str(e)
+            if e.retry_after is not None:
+                # 服務端要求的等待同樣受 max_delay 限制
+                delay = min(e.retry_after, self.retry_settings.get('max_delay', 30))
+                self._apply_backoff(channel, recipient, delay)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            error = f"{type(e).__name__}: {str(e)}"
+        return await self._retry_later(channel, notification, error, delay)
+    
+    async def _dead_letter(self, channel: str, notification: Dict[str, Any], error: str, attempts: int):
+        """將發送失敗的通知持久化到死信隊列"""
+        incr('notifications_dead_lettered_total', channel=channel)
+        print(f"{channel} notification moved to dead letter queue: {error}")
+        await self.db.save_dead_letter({
+            'user_id': notification['user_id'],
+            'channel': channel,
+            'payload': json.loads(json.dumps(notification, default=str)),
+            'error': error,
+            'attempts': attempts
+        })
+    
+    async def retry_dead_letters(self, channel: Optional[str] = None, limit: int = 100) -> int:
+        """將死信隊列中的通知重新加入派送隊列"""
+        dead_letters = await self.db.get_dead_letters(channel=channel, limit=limit)
+        if dead_letters and not self._workers:
+            await self.start()
+        for dead_letter in dead_letters:
+            payload = {k: v for k, v in dead_letter.payload.items() if k not in ('attempt', 'rate_acquired')}
+            await self.notification_queue.put({**payload, 'channels': [dead_letter.channel]})
+            await self.db.delete_dead_letter(dead_letter.id)
+        return len(dead_letters)
         
     async def send_notification(self, user_id: str, message: Dict[str, Any], channels: List[str]):
-        """發送通知到指定渠道"""
+        """發送通知到指定渠道（加入隊列後立即返回）"""
         try:
             # 添加時間戳和用戶ID
             notification = {
@@ -24,49 +303,154 @@ class NotificationSystem:
                 'channels': channels
             }
             
-            # 將通知加入隊列
-            await self.notification_queue.put(notification)
+            if not self._workers:
+                await self.start()
             
-            # 處理通知
-            tasks = []
-            for channel in channels:
-                if channel == 'email':
-                    tasks.append(self.send_email_notification(notification))
-                elif channel == 'telegram':
-                    tasks.append(self.send_telegram_notification(notification))
-                elif channel == 'line':
-                    tasks.append(self.send_line_notification(notification))
-                    
-            # 並行發送所有通知
-            results = await asyncio.gather(*tasks, return_exceptions=True)
-            
-            # 記錄通知歷史
-            self.notification_history.append({
-                **notification,
-                'status': 'success' if all(r is not None for r in results) else 'partial_failure',
-                'results': results
-            })
+            # 緊急通知（如止損觸發）不進入合併窗口
+            if not self._should_coalesce(message):
+                await self.notification_queue.put(notification)
+                return True
             
+            for channel in channels:
+                await self._coalesce(user_id, channel, message)
             return True
             
         except Exception as e:
             print(f"Error sending notification: {str(e)}")
             return False
     
+    def _should_coalesce(self, message: Dict[str, Any]) -> bool:
+        if not self.coalesce_settings.get('enabled', False):
+            return False
+        bypass = self.coalesce_settings.get('bypass_priorities', [])
+        return message.get('priority', 'normal') not in bypass
+    
+    @staticmethod
+    def _dedupe_key(message: Dict[str, Any]) -> str:
+        """相同信號的通知使用相同鍵值，以便去重"""
+        if 'dedupe_key' in message:
+            return str(message['dedupe_key'])
+        return json.dumps(
+            [message.get(field) for field in ('symbol', 'action', 'title', 'content')],
+            default=str, ensure_ascii=False
+        )
+    
+    async def _coalesce(self, user_id: str, channel: str, message: Dict[str, Any]):
+        """將通知放入 (用戶, 渠道) 的合併緩衝區"""
+        key = (user_id, channel)
+        buffer = self._coalesce_buffers.setdefault(key, {})
+        dedupe_key = self._dedupe_key(message)
+        if dedupe_key in buffer:
+            buffer[dedupe_key]['count'] += 1
+        else:
+            buffer[dedupe_key] = {'message': message, 'count': 1}
+        
+        if len(buffer) >= self.coalesce_settings.get('max_batch', 50):
+            await self._flush_coalesced(key)
+        elif key not in self._coalesce_timers:
+            self._coalesce_timers[key] = asyncio.create_task(
+                self._flush_after(key, self.coalesce_settings.get('window', 5))
+            )
+    
+    async def _flush_after(self, key: Tuple[str, str], window: float):
+        await asyncio.sleep(window)
+        self._coalesce_timers.pop(key, None)
+        await self._flush_coalesced(key)
+    
+    async def _flush_coalesced(self, key: Tuple[str, str]):
+        """將合併緩衝區轉為單則通知（或摘要）放入派送隊列"""
+        timer = self._coalesce_timers.pop(key, None)
+        if timer is not None and timer is not asyncio.current_task():
+            timer.cancel()
+        buffer = self._coalesce_buffers.pop(key, None)
+        if not buffer:
+            return
+        
+        user_id, channel = key
+        entries = list(buffer.values())
+        if len(entries) == 1 and entries[0]['count'] == 1:
+            message = entries[0]['message']
+        else:
+            message = self._build_digest(entries)
+        
+        await self.notification_queue.put({
+            'timestamp': datetime.now().isoformat(),
+            'user_id': user_id,
+            'message': message,
+            'channels': [channel]
+        })
+    
+    @staticmethod
+    def _build_digest(entries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """將多則通知合併為摘要訊息，保留第一則的收件人資訊"""
+        first = entries[0]['message']
+        total = sum(entry['count'] for entry in entries)
+        items = [{**entry['message'], 'count': entry['count']} for entry in entries]
+        return {
+            **{k: v for k, v in first.items() if k in ('email', 'telegram_chat_id', 'line_user_id')},
+            'subject': f'ADDX 交易提醒摘要 ({total} 則)',
+            'title': f'交易提醒摘要 ({total} 則)',
+            'content': '\n'.join(
+                f"{item.get('title', '交易提醒')}: {item.get('content')}"
+                + (f" (x{item['count']})" if item['count'] > 1 else '')
+                for item in items
+            ),
+            'digest': items
+        }
+    
+    async def _dispatch_worker(self, worker_id: int):
+        """背景工作者：持續消費通知隊列"""
+        while True:
+            notification = await self.notification_queue.get()
+            try:
+                await self._deliver(notification)
+            except Exception as e:
+                print(f"Notification worker {worker_id} error: {str(e)}")
+            finally:
+                self.notification_queue.task_done()
+    
+    @timed('notification_delivery_seconds')
+    async def _deliver(self, notification: Dict[str, Any]):
+        """將單一通知並行派送到所有渠道"""
+        senders = {
+            'email': self.send_email_notification,
+            'telegram': self.send_telegram_notification,
+            'line': self.send_line_notification
+        }
+        channels = [channel for channel in notification['channels'] if channel in senders]
+                
+        # 並行發送所有通知
+        results = await asyncio.gather(
+            *[senders[channel](notification) for channel in channels], return_exceptions=True
+        )
+        
+        # 只記錄已有結果的渠道；等待限流或已排程重試的渠道（None）由之後的派送各自記錄
+        finished = [(channel, r) for channel, r in zip(channels, results) if r is not None]
+        if not finished:
+            return
+        
+        # 記錄通知歷史
+        self.notification_history.append({
+            **{k: v for k, v in notification.items() if k not in ('attempt', 'rate_acquired')},
+            'channels': [channel for channel, _ in finished],
+            'status': 'success' if all(r is True for _, r in finished) else 'partial_failure',
+            'results': [r for _, r in finished]
+        })
+    
     async def send_email_notification(self, notification: Dict[str, Any]):
         """發送電子郵件通知"""
         try:
             msg = MIMEMultipart()
             msg['Subject'] = notification['message'].get('subject', 'ADDX 交易提醒')
-            msg['From'] = "noreply@addx-trading.com"
-            msg['To'] = notification['message'].get('email')
+            msg['From'] = CONFIG['email']['sender']
+            msg['To'] = notification['message'].get('email') or CONFIG['email']['recipient']
             
             # 創建HTML內容
             html_content = f"""
             <html>
                 <body>
                     <h2>{notification['message'].get('title', '交易提醒')}</h2>
-                    <p>{notification['message'].get('content')}</p>
+                    <p>{str(notification['message'].get('content')).replace(chr(10), '<br>')}</p>
                     <hr>
                     <p style="color: gray; font-size: 12px;">
                         發送時間: {notification['timestamp']}
@@ -77,20 +461,46 @@ class NotificationSystem:
             
             msg.attach(MIMEText(html_content, 'html'))
             
-            # 使用異步方式發送郵件
-            async with aiohttp.ClientSession() as session:
-                # 這裡應該使用您的郵件服務API
-                pass
-                
-            return True
+            # 經共用的 SMTP 連接池發送，暫時性錯誤延後重新入隊
+            if not self._acquire_rate_limit('email', msg['To'], notification):
+                return None
+            result = await self.email_channel.send(msg)
+            if result is True:
+                return True
+            error = f"{type(result).__name__}: {str(result)}"
+            if not self._is_transient_smtp_error(result):
+                await self._dead_letter('email', notification, error, notification.get('attempt', 0) + 1)
+                return False
+            return await self._retry_later('email', notification, error)
         except Exception as e:
             print(f"Email notification failed: {str(e)}")
             return False
     
+    @staticmethod
+    def _is_transient_smtp_error(error: Exception) -> bool:
+        """斷線、4xx 回應與非 SMTP 的連線/逾時錯誤可重試，其餘 SMTP 錯誤（含 5xx）為永久錯誤
+        
+        smtplib.SMTPException 是 OSError 的子類，必須先於 OSError 判斷。
+        """
+        if isinstance(error, smtplib.SMTPRecipientsRefused):
+            # 只有所有收件人都是 4xx（如信箱暫時不可用）時才重試
+            codes = [code for code, _ in error.recipients.values()]
+            return bool(codes) and all(400 <= code < 500 for code in codes)
+        if isinstance(error, smtplib.SMTPServerDisconnected):
+            return True
+        if isinstance(error, smtplib.SMTPResponseException):
+            return 400 <= error.smtp_code < 500
+        if isinstance(error, smtplib.SMTPException):
+            return False
+        return isinstance(error, OSError)
+    
     async def send_telegram_notification(self, notification: Dict[str, Any]):
         """發送Telegram通知"""
         try:
-            message_text = f"""
+            if 'digest' in notification['message']:
+                message_text = self._format_telegram_digest(notification)
+            else:
+                message_text = f"""
 🔔 *{notification['message'].get('title', '交易提醒')}*
 
 {notification['message'].get('content')}
@@ -98,63 +508,116 @@ class NotificationSystem:
 _發送時間: {notification['timestamp']}_
             """
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    f"https://api.telegram.org/bot{notification['bot_token']}/sendMessage",
-                    json={
-                        "chat_id": notification['message'].get('telegram_chat_id'),
-                        "text": message_text,
-                        "parse_mode": "Markdown"
-                    }
-                ) as response:
-                    return response.status == 200
+            telegram_config = CONFIG['telegram']
+            bot_token = notification.get('bot_token') or telegram_config['bot_token']
+            chat_id = notification['message'].get('telegram_chat_id') or telegram_config['chat_id']
+            
+            return await self._post_with_retry(
+                'telegram', chat_id, notification,
+                f"{telegram_config.get('api_base', 'https://api.telegram.org')}/bot{bot_token}/sendMessage",
+                json={
+                    "chat_id": chat_id,
+                    "text": message_text,
+                    "parse_mode": "Markdown"
+                }
+            )
                     
         except Exception as e:
             print(f"Telegram notification failed: {str(e)}")
             return False
     
+    @staticmethod
+    def _format_telegram_digest(notification: Dict[str, Any]) -> str:
+        """將摘要渲染為一則 Telegram 表格訊息"""
+        items = notification['message']['digest']
+        rows = [f"{'標的':<10} {'動作':<6} {'次數':>4}  內容"]
+        for item in items:
+            rows.append(
+                f"{str(item.get('symbol', '-')):<10} {str(item.get('action', '-')):<6} "
+                f"{item['count']:>4}  {item.get('title', item.get('content', ''))}"
+            )
+        table = '\n'.join(rows)
+        # Telegram 單則訊息上限 4096 字元
+        if len(table) > 3500:
+            table = table[:3500] + '\n...'
+        return (
+            f"🔔 *{notification['message']['title']}*\n\n"
+            f"```\n{table}\n```\n"
+            f"_發送時間: {notification['timestamp']}_"
+        )
+    
+    @staticmethod
+    def _build_line_bubble(title: str, content: Any) -> Dict[str, Any]:
+        return {
+            'type': 'bubble',
+            'body': {
+                'type': 'box',
+                'layout': 'vertical',
+                'contents': [
+                    {
+                        'type': 'text',
+                        'text': title,
+                        'weight': 'bold',
+                        'size': 'xl'
+                    },
+                    {
+                        'type': 'text',
+                        'text': str(content),
+                        'wrap': True,
+                        'margin': 'md'
+                    }
+                ]
+            }
+        }
+    
     async def send_line_notification(self, notification: Dict[str, Any]):
         """發送LINE通知"""
         try:
+            if 'digest' in notification['message']:
+                # LINE carousel 最多 12 個 bubble，超出部分併入最後一個
+                items = notification['message']['digest']
+                bubbles = [
+                    self._build_line_bubble(
+                        item.get('title', '交易提醒')
+                        + (f" (x{item['count']})" if item['count'] > 1 else ''),
+                        item.get('content')
+                    )
+                    for item in items[:11 if len(items) > 12 else 12]
+                ]
+                if len(items) > 12:
+                    bubbles.append(self._build_line_bubble(
+                        f'其他 {len(items) - 11} 則',
+                        '\n'.join(str(item.get('title', item.get('content'))) for item in items[11:])
+                    ))
+                contents = {'type': 'carousel', 'contents': bubbles}
+            else:
+                contents = self._build_line_bubble(
+                    notification['message'].get('title', '交易提醒'),
+                    notification['message'].get('content')
+                )
+            
             message = {
                 'type': 'flex',
                 'altText': notification['message'].get('title', '交易提醒'),
-                'contents': {
-                    'type': 'bubble',
-                    'body': {
-                        'type': 'box',
-                        'layout': 'vertical',
-                        'contents': [
-                            {
-                                'type': 'text',
-                                'text': notification['message'].get('title', '交易提醒'),
-                                'weight': 'bold',
-                                'size': 'xl'
-                            },
-                            {
-                                'type': 'text',
-                                'text': notification['message'].get('content'),
-                                'wrap': True,
-                                'margin': 'md'
-                            }
-                        ]
-                    }
-                }
+                'contents': contents
             }
             
-            async with aiohttp.ClientSession() as session:
-                async with session.post(
-                    'https://api.line.me/v2/bot/message/push',
-                    headers={
-                        'Authorization': f"Bearer {notification['line_token']}",
-                        'Content-Type': 'application/json'
-                    },
-                    json={
-                        'to': notification['message'].get('line_user_id'),
-                        'messages': [message]
-                    }
-                ) as response:
-                    return response.status == 200
+            line_config = CONFIG['line']
+            line_token = notification.get('line_token') or line_config['channel_access_token']
+            line_user_id = notification['message'].get('line_user_id') or line_config['user_id']
+            
+            return await self._post_with_retry(
+                'line', line_user_id, notification,
+                f"{line_config.get('api_base', 'https://api.line.me')}/v2/bot/message/push",
+                headers={
+                    'Authorization': f"Bearer {line_token}",
+                    'Content-Type': 'application/json'
+                },
+                json={
+                    'to': line_user_id,
+                    'messages': [message]
+                }
+            )
                     
         except Exception as e:
             print(f"LINE notification failed: {str(e)}")
@@ -162,8 +625,8 @@ _發送時間: {notification['timestamp']}_
     
     async def get_notification_history(self, user_id: str, limit: int = 50):
         """獲取通知歷史"""
-        return [n for n in self.notification_history if n['user_id'] == user_id][-limit:]
+        return self.notification_history.get(user_id, limit)
     
     async def clear_notification_history(self, user_id: str):
         """清除通知歷史"""
-        self.notification_history = [n for n in self.notification_history if n['user_id'] != user_id] 
\ No newline at end of file
+        self.notification_history.clear(user_id) 
\ No newline at end of file
@@ -0,0 +1,72 @@
+import asyncio
+import time
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+class TokenBucket:
+    """令牌桶限流器：以固定速率補充令牌，允許短暫突發"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = float(rate)
+        self.capacity = float(capacity if capacity is not None else rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+
+    def _refill(self, now: float):
+        elapsed = now - self.updated_at
+        if elapsed > 0:
+            self.tokens = min(self.capacity, self.tokens + elapsed * self.rate)
+            self.updated_at = now
+
+    def try_acquire(self, tokens: float = 1) -> float:
+        """嘗試取得令牌；成功返回 0，否則返回需要等待的秒數"""
+        now = time.monotonic()
+        self._refill(now)
+        if self.tokens >= tokens:
+            self.tokens -= tokens
+            return 0.0
+        # 退避期間 updated_at 位於未來，補充要到那時才開始
+        return (tokens - self.tokens) / self.rate + max(0.0, self.updated_at - now)
+
+    async def acquire(self, tokens: float = 1):
+        """等待直到取得令牌"""
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait <= 0:
+                return
+            await asyncio.sleep(wait)
+
+    def penalize(self, seconds: float):
+        """服務端要求退避時（如 429），清空突發額度，使下一個令牌恰在 seconds 秒後可用"""
+        now = time.monotonic()
+        self._refill(now)
+        ready_at = now + seconds
+        if ready_at > self.updated_at + max(0.0, 1 - self.tokens) / self.rate:
+            self.tokens = 0.0
+            self.updated_at = ready_at - 1 / self.rate
+
+class KeyedRateLimiter:
+    """按鍵（如收件人）分別限流，保留最近使用的有限數量令牌桶"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None, max_keys: int = 10000):
+        self.rate = rate
+        self.capacity = capacity
+        self.max_keys = max_keys
+        self.buckets: 'OrderedDict[Hashable, TokenBucket]' = OrderedDict()
+
+    def bucket(self, key: Hashable) -> TokenBucket:
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = TokenBucket(self.rate, self.capacity)
+            self.buckets[key] = bucket
+            if len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+        return bucket
+
+    def try_acquire(self, key: Hashable, tokens: float = 1) -> float:
+        return self.bucket(key).try_acquire(tokens)
+
+    async def acquire(self, key: Hashable, tokens: float = 1):
+        await self.bucket(key).acquire(tokens)
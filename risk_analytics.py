@@ -0,0 +1,240 @@
+"""向量化的滾動風險分析
+
+所有函數以 (時間 × 標的) 的二維數組一次計算整段歷史，不修改輸入數據。
+滾動均值/方差/協方差以累積和實現，每個指標只需一次 O(T×N) 掃描；
+歷史 VaR/CVaR 需要排序，按時間分塊處理以限制記憶體。
+RollingRiskState 提供實盤逐筆增量更新的版本。
+"""
+from statistics import NormalDist
+from typing import Dict, Optional, Union
+
+import numpy as np
+import pandas as pd
+
+TRADING_DAYS = 252
+
+ArrayLike = Union[np.ndarray, pd.DataFrame, pd.Series]
+
+def _as_2d(values: ArrayLike) -> np.ndarray:
+    array = np.asarray(values, dtype=float)
+    return array[:, None] if array.ndim == 1 else array
+
+def _wrap(result: np.ndarray, like: ArrayLike):
+    """按輸入類型返回結果（DataFrame/Series 保留索引與列名）"""
+    if isinstance(like, pd.DataFrame):
+        return pd.DataFrame(result, index=like.index, columns=like.columns)
+    if isinstance(like, pd.Series):
+        return pd.Series(result[:, 0], index=like.index, name=like.name)
+    return result
+
+def returns_from_prices(prices: ArrayLike) -> ArrayLike:
+    """簡單收益率，第一行為 NaN"""
+    p = _as_2d(prices)
+    r = np.full_like(p, np.nan)
+    r[1:] = p[1:] / p[:-1] - 1
+    return _wrap(r, prices)
+
+def _rolling_sum(x: np.ndarray, window: int) -> np.ndarray:
+    """沿時間軸的滾動和；窗口內有 NaN 時結果為 NaN"""
+    valid = ~np.isnan(x)
+    filled = np.where(valid, x, 0.0)
+    csum = np.cumsum(filled, axis=0)
+    ccount = np.cumsum(valid, axis=0)
+    out = csum.copy()
+    out[window:] -= csum[:-window]
+    count = ccount.copy()
+    count[window:] -= ccount[:-window]
+    out[count < window] = np.nan
+    return out
+
+def _rolling_moments(r: np.ndarray, window: int):
+    mean = _rolling_sum(r, window) / window
+    # 先減去全局均值再求平方和，降低累積和相減的數值誤差
+    center = np.nanmean(r, axis=0)
+    centered = r - center
+    sq_mean = _rolling_sum(centered * centered, window) / window
+    # 單點窗口的樣本方差無定義
+    scale = window / (window - 1) if window > 1 else np.nan
+    var = np.maximum(sq_mean - (mean - center) ** 2, 0.0) * scale
+    return mean, var
+
+def rolling_volatility(returns: ArrayLike, window: int = 20, annualize: bool = True) -> ArrayLike:
+    _, var = _rolling_moments(_as_2d(returns), window)
+    vol = np.sqrt(var) * (np.sqrt(TRADING_DAYS) if annualize else 1.0)
+    return _wrap(vol, returns)
+
+def rolling_sharpe(returns: ArrayLike, window: int = TRADING_DAYS, risk_free_rate: float = 0.02) -> ArrayLike:
+    r = _as_2d(returns) - risk_free_rate / TRADING_DAYS
+    mean, var = _rolling_moments(r, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.sqrt(TRADING_DAYS) * mean / np.sqrt(var)
+    return _wrap(sharpe, returns)
+
+def drawdown(returns: ArrayLike) -> ArrayLike:
+    """相對歷史最高點的回撤序列"""
+    r = np.nan_to_num(_as_2d(returns))
+    equity = np.cumprod(1 + r, axis=0)
+    peak = np.maximum.accumulate(equity, axis=0)
+    return _wrap(equity / peak - 1, returns)
+
+def max_drawdown(returns: ArrayLike) -> ArrayLike:
+    """截至每個時間點的最大回撤"""
+    dd = _as_2d(drawdown(returns))
+    return _wrap(np.minimum.accumulate(dd, axis=0), returns)
+
+def _rolling_extreme(x: np.ndarray, window: int, reduce, fill: float) -> np.ndarray:
+    """滾動最大/最小值（min_periods=1）：前端以 fill 補齊後對滑動窗口一次歸約"""
+    padded = np.concatenate([np.full((window - 1, x.shape[1]), fill), x], axis=0)
+    return reduce(np.lib.stride_tricks.sliding_window_view(padded, window, axis=0), axis=-1)
+
+def rolling_max_drawdown(prices: ArrayLike, window: int = TRADING_DAYS) -> ArrayLike:
+    """相對 window 根滾動高點的回撤，再取最近 window 根中的最差值（與 pandas rolling 的 min_periods=1 一致）"""
+    p = _as_2d(prices)
+    dd = p / _rolling_extreme(p, window, np.max, -np.inf) - 1
+    return _wrap(_rolling_extreme(dd, window, np.min, np.inf), prices)
+
+def rolling_beta_correlation(returns: ArrayLike, benchmark: ArrayLike, window: int = 60):
+    """返回 (beta, correlation)，每列標的相對基準收益率"""
+    r = _as_2d(returns)
+    b = _as_2d(benchmark)
+    mean_r = _rolling_sum(r, window) / window
+    mean_b = _rolling_sum(b, window) / window
+    cov = (_rolling_sum(r * b, window) / window - mean_r * mean_b) * window / (window - 1)
+    _, var_r = _rolling_moments(r, window)
+    _, var_b = _rolling_moments(b, window)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        beta = cov / var_b
+        corr = cov / np.sqrt(var_r * var_b)
+    return _wrap(beta, returns), _wrap(np.clip(corr, -1.0, 1.0), returns)
+
+def rolling_historical_var(returns: ArrayLike, window: int = TRADING_DAYS, confidence: float = 0.95,
+                           chunk_size: int = 2048):
+    """歷史模擬法 VaR 與 CVaR（以正數表示損失），返回 (var, cvar)"""
+    r = _as_2d(returns)
+    n_rows, n_cols = r.shape
+    var = np.full((n_rows, n_cols), np.nan)
+    cvar = np.full((n_rows, n_cols), np.nan)
+    if n_rows < window:
+        return _wrap(var, returns), _wrap(cvar, returns)
+
+    windows = np.lib.stride_tricks.sliding_window_view(r, window, axis=0)  # (T-w+1, N, w)
+    k = max(int(np.floor((1 - confidence) * window)), 1)
+    for start in range(0, windows.shape[0], chunk_size):
+        block = windows[start:start + chunk_size]
+        # 只需最差的 k 筆收益，部分排序即可
+        worst = np.partition(block, k - 1, axis=-1)[..., :k]
+        rows = slice(start + window - 1, start + window - 1 + block.shape[0])
+        var[rows] = -worst.max(axis=-1)
+        cvar[rows] = -worst.mean(axis=-1)
+    has_nan = _rolling_sum(np.isnan(r).astype(float), window) > 0
+    var[has_nan] = np.nan
+    cvar[has_nan] = np.nan
+    return _wrap(var, returns), _wrap(cvar, returns)
+
+def rolling_parametric_var(returns: ArrayLike, window: int = TRADING_DAYS, confidence: float = 0.95):
+    """常態分佈假設下的 VaR 與 CVaR，返回 (var, cvar)"""
+    mean, var = _rolling_moments(_as_2d(returns), window)
+    std = np.sqrt(var)
+    z = NormalDist().inv_cdf(1 - confidence)
+    alpha = 1 - confidence
+    value_at_risk = -(mean + z * std)
+    conditional = -(mean - std * NormalDist().pdf(z) / alpha)
+    return _wrap(value_at_risk, returns), _wrap(conditional, returns)
+
+def portfolio_returns(returns: ArrayLike, weights: ArrayLike) -> ArrayLike:
+    """按固定權重組合的收益率序列"""
+    r = np.nan_to_num(_as_2d(returns))
+    combined = r @ np.asarray(weights, dtype=float)
+    if isinstance(returns, pd.DataFrame):
+        return pd.Series(combined, index=returns.index, name='portfolio')
+    return combined
+
+def compute_risk_metrics(prices: ArrayLike, benchmark: Optional[ArrayLike] = None,
+                         weights: Optional[ArrayLike] = None, volatility_window: int = 20,
+                         window: int = TRADING_DAYS, beta_window: int = 60,
+                         confidence: float = 0.95, risk_free_rate: float = 0.02) -> Dict[str, ArrayLike]:
+    """對多個標的（或按 weights 組成的投資組合）一次計算全部滾動風險指標"""
+    returns = returns_from_prices(prices)
+    if weights is not None:
+        returns = portfolio_returns(returns, weights)
+    metrics = {
+        'returns': returns,
+        'volatility': rolling_volatility(returns, volatility_window),
+        'sharpe_ratio': rolling_sharpe(returns, window, risk_free_rate),
+        'drawdown': drawdown(returns),
+        'max_drawdown': max_drawdown(returns),
+    }
+    metrics['historical_var'], metrics['historical_cvar'] = rolling_historical_var(returns, window, confidence)
+    metrics['parametric_var'], metrics['parametric_cvar'] = rolling_parametric_var(returns, window, confidence)
+    if benchmark is not None:
+        metrics['beta'], metrics['correlation'] = rolling_beta_correlation(
+            returns, returns_from_prices(benchmark), beta_window
+        )
+    return metrics
+
+class RollingRiskState:
+    """實盤用的增量風險狀態：每筆新價格 O(N) 更新滾動矩與回撤
+
+    以環形緩衝區保存最近 window 筆收益率，均值/方差由滾動和維護，
+    歷史 VaR 僅在查詢時對緩衝區做一次部分排序。
+    """
+
+    def __init__(self, n_assets: int, window: int = TRADING_DAYS, confidence: float = 0.95,
+                 risk_free_rate: float = 0.02):
+        self.window = window
+        self.confidence = confidence
+        self.risk_free_rate = risk_free_rate
+        self.buffer = np.zeros((window, n_assets))
+        self.position = 0
+        self.count = 0
+        self.sum = np.zeros(n_assets)
+        self.sum_sq = np.zeros(n_assets)
+        self.last_price: Optional[np.ndarray] = None
+        self.equity = np.ones(n_assets)
+        self.peak = np.ones(n_assets)
+        self.max_drawdown = np.zeros(n_assets)
+
+    def update(self, prices: ArrayLike):
+        prices = np.asarray(prices, dtype=float)
+        if self.last_price is None:
+            self.last_price = prices
+            return
+        r = prices / self.last_price - 1
+        self.last_price = prices
+
+        old = self.buffer[self.position]
+        if self.count == self.window:
+            self.sum -= old
+            self.sum_sq -= old * old
+        else:
+            self.count += 1
+        self.buffer[self.position] = r
+        self.sum += r
+        self.sum_sq += r * r
+        self.position = (self.position + 1) % self.window
+
+        self.equity *= 1 + r
+        self.peak = np.maximum(self.peak, self.equity)
+        self.max_drawdown = np.minimum(self.max_drawdown, self.equity / self.peak - 1)
+
+    def snapshot(self) -> Dict[str, np.ndarray]:
+        n = self.count
+        if n < 2:
+            return {}
+        mean = self.sum / n
+        var = np.maximum(self.sum_sq / n - mean * mean, 0.0) * n / (n - 1)
+        std = np.sqrt(var)
+        window = self.buffer[:n]
+        k = max(int(np.floor((1 - self.confidence) * n)), 1)
+        worst = np.partition(window, k - 1, axis=0)[:k]
+        excess = mean - self.risk_free_rate / TRADING_DAYS
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sharpe = np.sqrt(TRADING_DAYS) * excess / std
+        return {
+            'volatility': std * np.sqrt(TRADING_DAYS),
+            'sharpe_ratio': sharpe,
+            'drawdown': self.equity / self.peak - 1,
+            'max_drawdown': self.max_drawdown,
+            'historical_var': -worst.max(axis=0),
+            'historical_cvar': -worst.mean(axis=0)
+        }
@@ -0,0 +1,240 @@
+"""下單前風險檢查與持倉敞口聚合
+
+每筆成交只增量更新受影響的聚合值（用戶×標的、用戶×資產類別、用戶總額、
+全局×標的、全局×資產類別、全局總額、用戶當日已實現盈虧），
+下單檢查只做固定數量的字典查找，與持倉數量無關。
+敞口以持倉成本計（|數量| × 均價），不需隨行情逐筆重算。
+"""
+import copy
+import threading
+from datetime import date
+from typing import Any, Dict, Optional, Tuple
+
+import numpy as np
+
+from config import CONFIG
+
+def asset_class(symbol: str) -> str:
+    """按代碼格式判斷資產類別（與行情緩存的判斷一致）"""
+    if '/' in symbol:
+        return 'crypto'
+    if symbol.endswith('=F'):
+        return 'futures'
+    return 'stock'
+
+def stop_distance(volatility=None):
+    """以年化波動率估算止損距離（價格比例）；缺少波動率時使用默認值"""
+    settings = CONFIG['risk']
+    default = settings['default_stop_distance']
+    if volatility is None:
+        return default
+    volatility = np.asarray(volatility, dtype=float)
+    distance = settings['stop_volatility_multiple'] * volatility / np.sqrt(252)
+    distance = np.where(np.isfinite(distance) & (distance > 0), distance, default)
+    return distance if distance.ndim else float(distance)
+
+def volatility_position_size(volatility=None, risk_per_trade: Optional[float] = None):
+    """波動率倉位：觸及止損時虧損約為資金的 risk_per_trade，返回資金比例
+
+    支援數組輸入，上限為 max_position_fraction。
+    """
+    settings = CONFIG['risk']
+    risk_per_trade = risk_per_trade if risk_per_trade is not None else CONFIG['trading']['risk_per_trade']
+    fraction = np.minimum(risk_per_trade / stop_distance(volatility), settings['max_position_fraction'])
+    return fraction if np.ndim(fraction) else float(fraction)
+
+def _sign(value: float) -> int:
+    return (value > 0) - (value < 0)
+
+class PreTradeRiskEngine:
+    """按用戶與全局限額檢查訂單，成交後增量更新敞口與盈虧
+
+    限額鍵（未設定或為 None 表示不限）:
+      max_symbol_notional, max_asset_class_notional{類別: 金額}, max_gross_notional,
+      max_open_positions 與 max_daily_loss（僅用戶）
+    用戶另有 equity 與 risk_per_trade（來自 UserSettings 的 initial_capital / risk_tolerance），
+    單筆訂單在止損距離上的風險不得超過 equity × risk_per_trade。
+    """
+
+    def __init__(self, user_limits: Optional[Dict[str, Any]] = None,
+                 global_limits: Optional[Dict[str, Any]] = None):
+        settings = CONFIG['risk']
+        self.default_user_limits = dict(user_limits or settings['user_limits'])
+        self.global_limits = dict(global_limits or settings['global_limits'])
+        self.user_limits: Dict[str, Dict[str, Any]] = {}
+        # (user, symbol) -> [數量（空頭為負）, 均價]
+        self.positions: Dict[Tuple[str, str], list] = {}
+        self.user_symbol_notional: Dict[Tuple[str, str], float] = {}
+        self.user_class_notional: Dict[Tuple[str, str], float] = {}
+        self.user_gross_notional: Dict[str, float] = {}
+        self.user_open_positions: Dict[str, int] = {}
+        self.symbol_notional: Dict[str, float] = {}
+        self.class_notional: Dict[str, float] = {}
+        self.gross_notional = 0.0
+        self.realized_pnl: Dict[str, float] = {}
+        # user -> (日期, 當日已實現盈虧)
+        self.daily_pnl: Dict[str, Tuple[date, float]] = {}
+        self._lock = threading.Lock()
+
+    # 檢查點保存的屬性：用戶限額、持倉與全部聚合值
+    _STATE_FIELDS = ('user_limits', 'positions', 'user_symbol_notional', 'user_class_notional',
+                     'user_gross_notional', 'user_open_positions', 'symbol_notional', 'class_notional',
+                     'gross_notional', 'realized_pnl', 'daily_pnl')
+
+    def get_state(self) -> Dict[str, Any]:
+        """返回可序列化的持倉與敞口狀態，重啟後以 set_state 恢復"""
+        with self._lock:
+            return copy.deepcopy({field: getattr(self, field) for field in self._STATE_FIELDS})
+
+    def set_state(self, state: Dict[str, Any]):
+        state = copy.deepcopy(state)
+        with self._lock:
+            for field in self._STATE_FIELDS:
+                if field in state:
+                    setattr(self, field, state[field])
+
+    def set_user_limits(self, user_id: str, limits: Dict[str, Any]):
+        self.user_limits[user_id] = {**self.default_user_limits, **self.user_limits.get(user_id, {}), **limits}
+
+    def limits_for(self, user_id: str) -> Dict[str, Any]:
+        return self.user_limits.get(user_id, self.default_user_limits)
+
+    async def load_user_settings(self, db, user_id: str):
+        """以 UserSettings 的 initial_capital 與 risk_tolerance 設定用戶限額"""
+        settings = await db.get_user_settings(user_id)
+        if settings is None:
+            return
+        limits = {}
+        if settings.initial_capital:
+            limits['equity'] = settings.initial_capital
+        if settings.risk_tolerance:
+            limits['risk_per_trade'] = settings.risk_tolerance
+        self.set_user_limits(user_id, limits)
+
+    def position_size(self, user_id: str, price: float, volatility=None) -> float:
+        """按用戶風險比例與波動率計算可下單數量"""
+        limits = self.limits_for(user_id)
+        equity = limits.get('equity') or CONFIG['trading']['initial_capital']
+        fraction = volatility_position_size(volatility, limits.get('risk_per_trade'))
+        return equity * fraction / price
+
+    def _daily_loss(self, user_id: str) -> float:
+        day, pnl = self.daily_pnl.get(user_id, (None, 0.0))
+        return -pnl if day == date.today() and pnl < 0 else 0.0
+
+    @staticmethod
+    def _exceeds(limit, value) -> bool:
+        return limit is not None and value > limit + 1e-9
+
+    def check_order(self, user_id: str, symbol: str, side: str, quantity: float, price: float,
+                    volatility=None) -> Tuple[bool, Optional[str]]:
+        """返回 (是否接受, 拒絕原因)；只減少敞口的訂單總是接受"""
+        if quantity <= 0 or price <= 0:
+            return False, 'invalid_order'
+        signed = quantity if side.upper() == 'BUY' else -quantity
+        key = (user_id, symbol)
+        cls = asset_class(symbol)
+        limits = self.limits_for(user_id)
+
+        with self._lock:
+            current_qty, avg_price = self.positions.get(key, (0.0, 0.0))
+            new_qty = current_qty + signed
+            before = self.user_symbol_notional.get(key, 0.0)
+            if current_qty and _sign(new_qty) == _sign(current_qty):
+                # 同向加倉按加權成本，減倉按原均價
+                if abs(new_qty) > abs(current_qty):
+                    after = before + quantity * price
+                else:
+                    after = abs(new_qty) * avg_price
+            else:
+                after = abs(new_qty) * price
+            delta = after - before
+            if delta <= 0:
+                return True, None
+
+            if self._daily_loss(user_id) >= (limits.get('max_daily_loss') or float('inf')):
+                return False, 'daily_loss_limit'
+            if not current_qty and self._exceeds(limits.get('max_open_positions'),
+                                                 self.user_open_positions.get(user_id, 0) + 1):
+                return False, 'max_open_positions'
+            equity = limits.get('equity')
+            risk_per_trade = limits.get('risk_per_trade')
+            if equity and risk_per_trade and delta * stop_distance(volatility) > equity * risk_per_trade * (1 + 1e-9):
+                return False, 'risk_per_trade'
+
+            checks = (
+                ('user_symbol_notional', limits.get('max_symbol_notional'), after),
+                ('user_asset_class_notional', (limits.get('max_asset_class_notional') or {}).get(cls),
+                 self.user_class_notional.get((user_id, cls), 0.0) + delta),
+                ('user_gross_notional', limits.get('max_gross_notional'),
+                 self.user_gross_notional.get(user_id, 0.0) + delta),
+                ('global_symbol_notional', self.global_limits.get('max_symbol_notional'),
+                 self.symbol_notional.get(symbol, 0.0) + delta),
+                ('global_asset_class_notional', (self.global_limits.get('max_asset_class_notional') or {}).get(cls),
+                 self.class_notional.get(cls, 0.0) + delta),
+                ('global_gross_notional', self.global_limits.get('max_gross_notional'),
+                 self.gross_notional + delta)
+            )
+            for reason, limit, value in checks:
+                if self._exceeds(limit, value):
+                    return False, reason
+            return True, None
+
+    def on_fill(self, user_id: str, symbol: str, side: str, quantity: float, price: float) -> float:
+        """記錄成交並增量更新所有聚合值，返回該筆成交的已實現盈虧"""
+        signed = quantity if side.upper() == 'BUY' else -quantity
+        key = (user_id, symbol)
+        cls = asset_class(symbol)
+
+        with self._lock:
+            current_qty, avg_price = self.positions.get(key, (0.0, 0.0))
+            new_qty = current_qty + signed
+            realized = 0.0
+            if current_qty and _sign(signed) != _sign(current_qty):
+                closed = min(abs(signed), abs(current_qty))
+                realized = closed * (price - avg_price) * _sign(current_qty)
+            if not current_qty or _sign(new_qty) != _sign(current_qty):
+                # 新開倉或反向開倉，均價為成交價
+                avg_price = price
+            elif abs(new_qty) > abs(current_qty):
+                avg_price = (abs(current_qty) * avg_price + quantity * price) / abs(new_qty)
+
+            before = self.user_symbol_notional.get(key, 0.0)
+            after = abs(new_qty) * avg_price if new_qty else 0.0
+            delta = after - before
+
+            if new_qty:
+                self.positions[key] = [new_qty, avg_price]
+                self.user_symbol_notional[key] = after
+            else:
+                self.positions.pop(key, None)
+                self.user_symbol_notional.pop(key, None)
+            if not current_qty and new_qty:
+                self.user_open_positions[user_id] = self.user_open_positions.get(user_id, 0) + 1
+            elif current_qty and not new_qty:
+                self.user_open_positions[user_id] = self.user_open_positions.get(user_id, 0) - 1
+
+            self.user_class_notional[(user_id, cls)] = self.user_class_notional.get((user_id, cls), 0.0) + delta
+            self.user_gross_notional[user_id] = self.user_gross_notional.get(user_id, 0.0) + delta
+            self.symbol_notional[symbol] = self.symbol_notional.get(symbol, 0.0) + delta
+            self.class_notional[cls] = self.class_notional.get(cls, 0.0) + delta
+            self.gross_notional += delta
+
+            if realized:
+                self.realized_pnl[user_id] = self.realized_pnl.get(user_id, 0.0) + realized
+                today = date.today()
+                day, pnl = self.daily_pnl.get(user_id, (today, 0.0))
+                self.daily_pnl[user_id] = (today, (pnl if day == today else 0.0) + realized)
+            return float(realized)
+
+    def exposure(self, user_id: str) -> Dict[str, Any]:
+        """用戶當前的敞口與盈虧摘要"""
+        return {
+            'gross_notional': self.user_gross_notional.get(user_id, 0.0),
+            'open_positions': self.user_open_positions.get(user_id, 0),
+            'asset_class_notional': {
+                cls: value for (user, cls), value in self.user_class_notional.items() if user == user_id
+            },
+            'realized_pnl': self.realized_pnl.get(user_id, 0.0),
+            'daily_loss': self._daily_loss(user_id)
+        }
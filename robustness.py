@@ -0,0 +1,174 @@
+"""回測結果的蒙地卡羅 / 自助法穩健性模擬
+
+把一次回測的逐筆交易或逐K線收益率重抽樣成上千條路徑，觀察收益、夏普、
+最大回撤的分佈與破產概率：
+  - trade_shuffle:   打亂交易順序（總收益不變，回撤與破產風險改變）
+  - block_bootstrap: 循環區塊自助法重抽K線收益，保留區塊內的自相關
+  - none:            不重排，只疊加隨機滑點
+任何方法都可疊加隨機滑點：每步成本 ~ 指數分佈，均值為 滑點率 × 該步換手。
+
+每批 batch_size 條路徑以 (路徑 × 步數) 矩陣一次計算，各批按順序分配到多個進程。
+每批使用以 SeedSequence 派生的獨立隨機流，結果只取決於 seed 與 batch_size，與進程數無關。
+"""
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from config import CONFIG
+
+METHODS = ('trade_shuffle', 'block_bootstrap', 'none')
+PERCENTILES = (5, 25, 50, 75, 95)
+
+# 路徑數 × 步數小於此值時在本進程內計算，省去啟動進程池的開銷
+_PARALLEL_THRESHOLD = 2_000_000
+
+def trade_returns(trade_history: List[Dict[str, Any]], initial_capital: float) -> Tuple[np.ndarray, np.ndarray]:
+    """已平倉交易相對當時權益的收益率，以及每筆交易的換手（買入+賣出金額 / 權益）"""
+    equity = initial_capital
+    returns, turnover = [], []
+    for trade in trade_history:
+        if trade['action'] != 'SELL':
+            continue
+        returns.append(trade['profit_loss'] / equity)
+        turnover.append((2 * trade['value'] - trade['profit_loss']) / equity)
+        equity += trade['profit_loss']
+    return np.asarray(returns, dtype=float), np.asarray(turnover, dtype=float)
+
+def bar_returns(equity_curve: List[tuple], trade_history: List[Dict[str, Any]]) -> Tuple[np.ndarray, np.ndarray]:
+    """權益曲線的逐K線收益率，以及每根K線的換手（成交金額 / 前一根權益）"""
+    if len(equity_curve) < 2:
+        return np.empty(0), np.empty(0)
+    timestamps = [timestamp for timestamp, _ in equity_curve]
+    equity = np.asarray([value for _, value in equity_curve], dtype=float)
+    traded = {}
+    for trade in trade_history:
+        traded[trade['timestamp']] = traded.get(trade['timestamp'], 0.0) + trade['value']
+    volume = np.asarray([traded.get(timestamp, 0.0) for timestamp in timestamps[1:]])
+    return equity[1:] / equity[:-1] - 1, volume / equity[:-1]
+
+def _sample_indices(method: str, n_paths: int, n_steps: int, block_size: int,
+                    rng: np.random.Generator) -> np.ndarray:
+    if method == 'trade_shuffle':
+        return rng.permuted(np.tile(np.arange(n_steps), (n_paths, 1)), axis=1)
+    if method == 'block_bootstrap':
+        n_blocks = -(-n_steps // block_size)
+        starts = rng.integers(0, n_steps, size=(n_paths, n_blocks, 1))
+        indices = (starts + np.arange(block_size)) % n_steps
+        return indices.reshape(n_paths, -1)[:, :n_steps]
+    return np.broadcast_to(np.arange(n_steps), (n_paths, n_steps))
+
+def _path_metrics(paths: np.ndarray, periods_per_year: float, ruin_threshold: float) -> Dict[str, np.ndarray]:
+    equity = np.cumprod(1 + paths, axis=1)
+    peak = np.maximum.accumulate(np.maximum(equity, 1.0), axis=1)
+    std = paths.std(axis=1, ddof=1) if paths.shape[1] > 1 else np.zeros(len(paths))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        sharpe = np.where(std > 0, paths.mean(axis=1) / std * np.sqrt(periods_per_year), 0.0)
+    return {
+        'total_return': equity[:, -1] - 1,
+        'sharpe_ratio': sharpe,
+        'max_drawdown': (equity / peak - 1).min(axis=1),
+        'ruined': (equity <= 1 - ruin_threshold).any(axis=1)
+    }
+
+def _simulate_chunk(returns: np.ndarray, turnover: Optional[np.ndarray], method: str,
+                    batches: List[Tuple[int, np.random.SeedSequence]], block_size: int, slippage: float,
+                    periods_per_year: float, ruin_threshold: float) -> Dict[str, np.ndarray]:
+    """工作進程入口：逐批生成路徑並只返回每條路徑的指標，避免傳回整個矩陣
+
+    batches 為 (路徑數, 該批的種子) 列表，每批使用自己的隨機流。
+    """
+    parts = []
+    for size, seed in batches:
+        rng = np.random.default_rng(seed)
+        indices = _sample_indices(method, size, len(returns), block_size, rng)
+        paths = returns[indices]
+        if slippage and turnover is not None:
+            paths = paths - rng.exponential(slippage, size=paths.shape) * turnover[indices]
+        parts.append(_path_metrics(paths, periods_per_year, ruin_threshold))
+    return {key: np.concatenate([part[key] for part in parts]) for key in parts[0]}
+
+def _summarize(values: np.ndarray) -> Dict[str, float]:
+    summary = {f'p{q}': float(value) for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))}
+    summary['mean'] = float(values.mean())
+    summary['std'] = float(values.std())
+    return summary
+
+def simulate(returns, method: str = 'block_bootstrap', n_paths: Optional[int] = None,
+             turnover=None, slippage: float = 0.0, block_size: Optional[int] = None,
+             periods_per_year: float = 252, ruin_threshold: Optional[float] = None,
+             seed: Optional[int] = None, workers: Optional[int] = None,
+             return_samples: bool = False) -> Dict[str, Any]:
+    """對收益率序列執行穩健性模擬，返回各指標的分位數、破產概率與虧損概率
+
+    slippage 為每單位換手的平均成本比例（如 0.0005 = 5bp），需同時提供 turnover。
+    ruin_threshold 為視為破產的權益回撤比例（0.5 = 權益跌破初始的一半）。
+    """
+    settings = CONFIG['robustness']
+    if method not in METHODS:
+        raise ValueError(f"method must be one of {METHODS}")
+    returns = np.asarray(returns, dtype=float)
+    if len(returns) == 0:
+        return {}
+    turnover = np.asarray(turnover, dtype=float) if turnover is not None else None
+    n_paths = n_paths or settings['n_paths']
+    block_size = max(1, min(block_size or settings['block_size'], len(returns)))
+    ruin_threshold = ruin_threshold if ruin_threshold is not None else settings['ruin_threshold']
+    batch_size = settings['batch_size']
+
+    # 每批一個子種子，再把連續的批次分給各進程，結果與進程數無關
+    sizes = [min(batch_size, n_paths - start) for start in range(0, n_paths, batch_size)]
+    batches = list(zip(sizes, np.random.SeedSequence(seed).spawn(len(sizes))))
+    workers = workers or settings['workers'] or os.cpu_count() or 1
+    if n_paths * len(returns) < _PARALLEL_THRESHOLD:
+        workers = 1
+    workers = min(workers, len(batches))
+    bounds = [len(batches) * i // workers for i in range(workers + 1)]
+    args = [
+        (returns, turnover, method, batches[bounds[i]:bounds[i + 1]], block_size, slippage,
+         periods_per_year, ruin_threshold)
+        for i in range(workers)
+    ]
+    if workers == 1:
+        chunks = [_simulate_chunk(*args[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunks = list(executor.map(_simulate_chunk, *zip(*args)))
+    metrics = {key: np.concatenate([chunk[key] for chunk in chunks]) for key in chunks[0]}
+
+    result = {
+        'method': method,
+        'paths': n_paths,
+        'steps': len(returns),
+        'total_return': _summarize(metrics['total_return']),
+        'sharpe_ratio': _summarize(metrics['sharpe_ratio']),
+        'max_drawdown': _summarize(metrics['max_drawdown']),
+        'risk_of_ruin': float(metrics['ruined'].mean()),
+        'probability_of_loss': float((metrics['total_return'] < 0).mean())
+    }
+    if return_samples:
+        result['samples'] = metrics
+    return result
+
+def analyze_backtest(engine, n_paths: Optional[int] = None, slippage: float = 0.0,
+                     seed: Optional[int] = None, workers: Optional[int] = None) -> Dict[str, Dict[str, Any]]:
+    """對已完成的 BacktestEngine 同時執行交易順序打亂與K線收益區塊自助法"""
+    results = {}
+    returns, turnover = trade_returns(engine.trade_history, engine.initial_capital)
+    if len(returns) > 1:
+        # 以回測期間的交易頻率年化交易級夏普
+        timestamps = [trade['timestamp'] for trade in engine.trade_history if trade['action'] == 'SELL']
+        years = (timestamps[-1] - timestamps[0]).days / 365.25 if hasattr(timestamps[0], 'year') else 0
+        results['trade_shuffle'] = simulate(
+            returns, 'trade_shuffle', n_paths, turnover=turnover, slippage=slippage,
+            periods_per_year=len(returns) / years if years > 0 else len(returns),
+            seed=seed, workers=workers
+        )
+    returns, turnover = bar_returns(engine.equity_curve, engine.trade_history)
+    if len(returns) > 1:
+        results['block_bootstrap'] = simulate(
+            returns, 'block_bootstrap', n_paths, turnover=turnover, slippage=slippage,
+            seed=seed, workers=workers
+        )
+    return results
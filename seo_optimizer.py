@@ -1,18 +1,51 @@
-import yfinance as yf
 import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
-import ccxt
-import talib
-from sklearn.ensemble import RandomForestClassifier
-from scipy import stats
+from config import CONFIG
+from instrumentation import timed
+import risk_analytics
+from risk_engine import volatility_position_size
 
+# 機器學習模型的特徵欄位（由 calculate_technical_indicators 產生）
+ML_FEATURES = ['RSI', 'MOM', 'ROC', 'Volatility']
+
+def build_ml_dataset(df):
+    """返回對齊的 (特徵, 標籤)；標籤為下一根K線是否上漲，最後一行的標籤無意義"""
+    data = df[ML_FEATURES + ['Close']].dropna()
+    X = data[ML_FEATURES]
+    y = (data['Close'].shift(-1) > data['Close']).astype(int)
+    return X, y
+
+# yfinance、ccxt、talib、sklearn 導入耗時數秒，只在首次使用時加載，
+# 使儀表板、回測工作進程與命令行工具在不取數/不訓練時能快速啟動
 class AdvancedMarketDataFetcher:
     def __init__(self):
-        self.stock_api = yf
-        self.crypto_exchange = ccxt.binance()
-        self.futures_exchange = ccxt.binanceusdm()
+        self._stock_api = None
+        self._crypto_exchange = None
+        self._futures_exchange = None
+
+    @property
+    def stock_api(self):
+        if self._stock_api is None:
+            import yfinance as yf
+            self._stock_api = yf
+        return self._stock_api
+
+    @property
+    def crypto_exchange(self):
+        if self._crypto_exchange is None:
+            import ccxt
+            self._crypto_exchange = ccxt.binance()
+        return self._crypto_exchange
+
+    @property
+    def futures_exchange(self):
+        if self._futures_exchange is None:
+            import ccxt
+            self._futures_exchange = ccxt.binanceusdm()
+        return self._futures_exchange
         
+    @timed('market_data_fetch_seconds', kind='market_depth')
     async def get_market_depth(self, symbol, market_type):
         try:
             if market_type == 'crypto':
@@ -25,12 +58,39 @@ class AdvancedMarketDataFetcher:
             print(f"Error fetching market depth: {e}")
             return None
 
-    async def get_historical_data(self, symbol, timeframe='1d', limit=100):
+    @timed('market_data_fetch_seconds', kind='trades')
+    async def get_recent_trades(self, symbol, limit=100):
+        """最近成交（僅加密貨幣）"""
+        try:
+            if '/' in symbol:
+                trades = self.crypto_exchange.fetch_trades(symbol, limit=limit)
+                return [
+                    {'timestamp': trade['timestamp'], 'price': trade['price'],
+                     'amount': trade['amount'], 'side': trade['side']}
+                    for trade in trades
+                ]
+            return []
+        except Exception as e:
+            print(f"Error fetching recent trades: {e}")
+            return None
+
+    @timed('market_data_fetch_seconds', kind='historical')
+    async def get_historical_data(self, symbol, timeframe='1d', limit=100, start=None):
+        """獲取歷史K線；指定 start 時只取該時間之後的數據（供增量更新）"""
         try:
+            if '/' in symbol:
+                since = int(pd.Timestamp(start).timestamp() * 1000) if start is not None else None
+                ohlcv = self.crypto_exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=limit)
+                data = pd.DataFrame(ohlcv, columns=['timestamp', 'Open', 'High', 'Low', 'Close', 'Volume'])
+                data.index = pd.to_datetime(data.pop('timestamp'), unit='ms')
+                return data
             if timeframe == '1d':
+                start = pd.Timestamp(start) if start is not None else datetime.now() - timedelta(days=limit)
                 data = self.stock_api.download(symbol, 
-                                             start=(datetime.now() - timedelta(days=limit)).strftime('%Y-%m-%d'),
-                                             end=datetime.now().strftime('%Y-%m-%d'))
+                                             start=start.strftime('%Y-%m-%d'),
+                                             end=(datetime.now() + timedelta(days=1)).strftime('%Y-%m-%d'))
+                if isinstance(data.columns, pd.MultiIndex):
+                    data.columns = data.columns.get_level_values(0)
                 return data
         except Exception as e:
             print(f"Error fetching historical data: {e}")
@@ -41,9 +101,43 @@ class AdvancedTradingBot:
         self.capital = initial_capital
         self.positions = {}
         self.risk_per_trade = 0.02
-        self.ml_model = RandomForestClassifier(n_estimators=100)
-        
+        self._ml_model = None
+    
+    @property
+    def ml_model(self):
+        if self._ml_model is None:
+            from sklearn.ensemble import RandomForestClassifier
+            self._ml_model = RandomForestClassifier(n_estimators=100)
+        return self._ml_model
+
+    @ml_model.setter
+    def ml_model(self, model):
+        self._ml_model = model
+
+    def get_state(self):
+        """返回資金、持倉、風險參數與機器學習模型"""
+        return {
+            'capital': self.capital,
+            'positions': self.positions,
+            'risk_per_trade': self.risk_per_trade,
+            # 未訓練過時為 None，避免為保存檢查點而加載 sklearn
+            'ml_model': self._ml_model
+        }
+    
+    def set_state(self, state):
+        self.capital = state['capital']
+        self.positions = state['positions']
+        self.risk_per_trade = state['risk_per_trade']
+        self.ml_model = state['ml_model']
+    
+    def calculate_position_size(self, price, volatility=None):
+        """按波動率計算倉位（資金比例）：觸及止損時虧損約為資金的 risk_per_trade"""
+        return volatility_position_size(volatility, self.risk_per_trade)
+
+    @timed('trading_stage_seconds', stage='calculate_technical_indicators')
     def calculate_technical_indicators(self, df):
+        import talib
+
         # 基礎指標
         df['SMA_20'] = talib.SMA(df['Close'].values, timeperiod=20)
         df['SMA_50'] = talib.SMA(df['Close'].values, timeperiod=50)
@@ -62,30 +156,30 @@ class AdvancedTradingBot:
         df['OBV'] = talib.OBV(df['Close'].values, df['Volume'].values)
         df['AD'] = talib.AD(df['High'].values, df['Low'].values, 
                            df['Close'].values, df['Volume'].values)
+
+        # 年化波動率（預測模型的特徵）
+        df['Volatility'] = risk_analytics.rolling_volatility(df['Close'].pct_change(), window=20)
         
         return df
 
+    @timed('trading_stage_seconds', stage='calculate_risk_metrics')
     def calculate_risk_metrics(self, df):
-        # 計算波動率
-        df['Returns'] = df['Close'].pct_change()
-        df['Volatility'] = df['Returns'].rolling(window=20).std() * np.sqrt(252)
-        
-        # 計算夏普比率
-        risk_free_rate = 0.02  # 假設無風險利率為2%
-        excess_returns = df['Returns'] - risk_free_rate/252
-        sharpe_ratio = np.sqrt(252) * excess_returns.mean() / excess_returns.std()
-        
-        # 計算最大回撤
-        rolling_max = df['Close'].rolling(window=252, min_periods=1).max()
-        daily_drawdown = df['Close']/rolling_max - 1.0
-        max_drawdown = daily_drawdown.rolling(window=252, min_periods=1).min()
-        
+        """最新一根K線的風險指標，委託 risk_analytics 計算且不修改 df"""
+        close = df['Close'].to_numpy(dtype=float)
+        # 少於兩根K線時沒有收益率，與舊實現一樣返回 NaN
+        if len(close) < 2:
+            return {'volatility': np.nan, 'sharpe_ratio': np.nan, 'max_drawdown': np.nan}
+        returns = risk_analytics.returns_from_prices(close)
+        # 最大回撤：相對252根滾動高點的回撤在最近252根中的最差值，只需最後 2×252-1 根收盤價
+        window = risk_analytics.TRADING_DAYS
+
         return {
-            'volatility': df['Volatility'].iloc[-1],
-            'sharpe_ratio': sharpe_ratio,
-            'max_drawdown': max_drawdown.iloc[-1]
+            'volatility': risk_analytics.rolling_volatility(returns[-21:], window=20)[-1, 0],
+            'sharpe_ratio': risk_analytics.rolling_sharpe(returns[1:], window=len(returns) - 1)[-1, 0],
+            'max_drawdown': risk_analytics.rolling_max_drawdown(close[-(2 * window - 1):], window)[-1, 0]
         }
 
+    @timed('trading_stage_seconds', stage='generate_advanced_signals')
     def generate_advanced_signals(self, df):
         signals = []
         
@@ -98,7 +192,7 @@ class AdvancedTradingBot:
                 'action': 'BUY',
                 'confidence': 0.8,
                 'reason': '多重指標顯示超賣',
-                'suggested_size': self.calculate_position_size(df['Close'].iloc[-1])
+                'suggested_size': self.calculate_position_size(df['Close'].iloc[-1], df['Volatility'].iloc[-1])
             })
             
         # 機器學習預測
@@ -108,22 +202,26 @@ class AdvancedTradingBot:
                 'action': 'BUY',
                 'confidence': prediction['probability'],
                 'reason': 'ML模型預測上漲',
-                'suggested_size': self.calculate_position_size(df['Close'].iloc[-1])
+                'suggested_size': self.calculate_position_size(df['Close'].iloc[-1], df['Volatility'].iloc[-1])
             })
             
         return signals
 
+    @timed('trading_stage_seconds', stage='predict_price_movement')
     def predict_price_movement(self, df):
-        # 準備特徵
-        features = ['RSI', 'MOM', 'ROC', 'Volatility']
-        X = df[features].dropna()
+        # 準備特徵與標籤（1表示下一根K線上漲，0表示下跌）
+        X, y = build_ml_dataset(df)
+        
+        # 最後一行沒有下一根K線，不參與訓練
+        X_train, y_train = X.iloc[:-1], y.iloc[:-1]
         
-        # 準備標籤（1表示上漲，0表示下跌）
-        y = (df['Close'].shift(-1) > df['Close']).astype(int)
-        y = y[:-1]  # 移除最後一個NA值
+        # 指標預熱期、樣本不足、只有單一類別或最新K線特徵缺失時返回中性預測
+        if (X.empty or X.index[-1] != df.index[-1] or y_train.nunique() < 2
+                or len(X_train) < CONFIG['trading']['ml_min_train_rows']):
+            return {'direction': 0, 'probability': 0.5}
         
         # 訓練模型
-        self.ml_model.fit(X[:-1], y)
+        self.ml_model.fit(X_train, y_train)
         
         # 預測下一個時間點
         latest_features = X.iloc[-1:]
@@ -0,0 +1,325 @@
+"""低延遲交易信號服務
+
+    uvicorn signal_service:app --workers 1
+
+GET /signals?symbols=AAPL,TSLA 返回各標的最新K線的信號與模型預測。
+  - 每個標的在記憶體中保留最近的K線與最新一行指標，只在出現新K線時重算尾部窗口
+  - 回應按 (K線收盤時間, 模型版本) 緩存：K線收盤前且模型未替換時直接命中緩存，
+    收盤後待行情緩存過期重取；背景重訓完成後所有回應立即失效
+  - 未命中的並發請求在 max_wait_ms 內合併為一批，標的去重後以一次向量化規則判斷
+    與一次 predict_proba 完成評分
+  - 已有標的出現新K線時在背景重訓模型，完成後原子替換；訓練期間沿用上一個模型評分
+GET /stats 返回請求延遲分位數（含 p99）、批次大小與緩存命中率。
+"""
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+from fastapi import FastAPI, HTTPException, Query
+
+from config import CONFIG
+from instrumentation import Histogram, timer, incr
+from market_data_cache import MarketDataCache
+from market_replay import SystemClock, timeframe_delta
+from risk_engine import volatility_position_size
+from seo_optimizer import AdvancedTradingBot, ML_FEATURES, build_ml_dataset
+
+# 規則信號所需的指標欄位
+RULE_COLUMNS = ['RSI', 'Close', 'BB_lower', 'MACD', 'Signal']
+
+class SymbolState:
+    """單一標的的增量指標狀態：保留最近 max_bars 根K線，新K線到達時只重算尾部窗口
+
+    talib 沒有逐筆更新的接口，重算固定長度的尾部窗口使每根新K線的成本與歷史長度無關。
+    """
+
+    def __init__(self, max_bars: int, window: int):
+        self.max_bars = max_bars
+        self.window = window
+        self.bars: Optional[pd.DataFrame] = None
+        self.indicators: Optional[pd.DataFrame] = None
+        self.bar_time = None
+        self.last_close = None
+
+    def update(self, bars: pd.DataFrame, bot: AdvancedTradingBot) -> bool:
+        """以最新K線更新狀態，最後一根K線未變時返回 False"""
+        if bars is None or bars.empty:
+            return False
+        last_time, last_close = bars.index[-1], float(bars['Close'].iloc[-1])
+        if last_time == self.bar_time and last_close == self.last_close:
+            return False
+        self.bars = bars.iloc[-self.max_bars:]
+        # 指標只依賴歷史數據，尾部窗口足以得到穩定的最新值
+        self.indicators = bot.calculate_technical_indicators(self.bars.iloc[-self.window:].copy())
+        self.bar_time, self.last_close = last_time, last_close
+        return True
+
+class MicroBatcher:
+    """將並發請求合併成批：首個請求到達後最多等待 max_wait 秒或湊滿 max_batch 個"""
+
+    def __init__(self, handler, max_batch: int, max_wait: float):
+        self.handler = handler
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self.batches = 0
+        self.batched_requests = 0
+
+    async def submit(self, symbols: List[str]) -> Dict[str, Any]:
+        if self._task is None or self._task.done():
+            self._queue = asyncio.Queue()
+            self._task = asyncio.create_task(self._run())
+        future = asyncio.get_running_loop().create_future()
+        await self._queue.put((symbols, future))
+        return await future
+
+    async def _run(self):
+        while True:
+            batch = [await self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            self.batches += 1
+            self.batched_requests += len(batch)
+
+            symbols = list(dict.fromkeys(symbol for request, _ in batch for symbol in request))
+            try:
+                results = await self.handler(symbols)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            for request, future in batch:
+                if not future.done():
+                    future.set_result({symbol: results.get(symbol) for symbol in request})
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+class SignalService:
+    """按標的返回最新信號；緩存以K線時間為鍵，新K線收盤後自動失效"""
+
+    def __init__(self, market_cache: Optional[MarketDataCache] = None, bot: Optional[AdvancedTradingBot] = None,
+                 clock=None):
+        settings = CONFIG['signal_service']
+        self.settings = settings
+        self.market_cache = market_cache or MarketDataCache(
+            timeframe=settings['timeframe'], lookback=settings['max_bars']
+        )
+        self.bot = bot or AdvancedTradingBot(CONFIG['trading']['initial_capital'])
+        self.clock = clock or SystemClock()
+        self.bar_duration = timeframe_delta(settings['timeframe'])
+        self.states: Dict[str, SymbolState] = {}
+        # symbol -> (K線收盤時間, 模型版本, 回應)
+        self._responses: Dict[str, Tuple[pd.Timestamp, int, Dict[str, Any]]] = {}
+        # 每次替換模型加一，使舊模型的回應失效
+        self.model_version = 0
+        self._model_ready = False
+        self._model_stale = True
+        self._train_task: Optional[asyncio.Task] = None
+        self.batcher = MicroBatcher(
+            self._score, settings['max_batch'], settings['max_wait_ms'] / 1000
+        )
+        self.latency = Histogram()
+        self.cache_hits = 0
+        self.requests = 0
+
+    def _bar_close(self, bar_time) -> pd.Timestamp:
+        """K線收盤時間（不帶時區的 UTC，與 SystemClock 一致）"""
+        close = pd.Timestamp(bar_time) + self.bar_duration
+        return close.tz_convert('UTC').tz_localize(None) if close.tzinfo is not None else close
+
+    def _cached(self, symbol: str) -> Optional[Dict[str, Any]]:
+        entry = self._responses.get(symbol)
+        if entry is None:
+            return None
+        bar_close, version, response = entry
+        if version != self.model_version:
+            return None
+        # 收盤後新K線可能已出現；行情緩存仍未過期時重取也得到同一根K線，不必重新評分
+        if self.clock.now() >= bar_close and not self.market_cache.is_fresh(symbol):
+            return None
+        return response
+
+    async def get_signals(self, symbols: List[str]) -> Dict[str, Any]:
+        start = time.perf_counter()
+        self.requests += 1
+        with timer('signal_request_seconds'):
+            results = {symbol: self._cached(symbol) for symbol in symbols}
+            missing = [symbol for symbol, result in results.items() if result is None]
+            if missing:
+                results.update(await self.batcher.submit(missing))
+            else:
+                self.cache_hits += 1
+                incr('signal_cache_hits_total')
+        self.latency.observe(time.perf_counter() - start)
+        return results
+
+    async def _score(self, symbols: List[str]) -> Dict[str, Any]:
+        """刷新過期標的並以一次向量化調用為整批評分"""
+        frames = await asyncio.to_thread(self.market_cache.get_many, symbols)
+        for symbol in symbols:
+            state = self.states.setdefault(
+                symbol, SymbolState(self.settings['max_bars'], self.settings['indicator_window'])
+            )
+            tracked = state.bar_time is not None
+            if symbol in frames and await asyncio.to_thread(state.update, frames[symbol], self.bot):
+                # 新加入的標的不觸發重訓，已有標的出現新K線時才重訓
+                self._model_stale = self._model_stale or tracked or not self._model_ready
+
+        ready = [s for s in symbols if self.states[s].indicators is not None]
+        if self._model_stale and ready:
+            self._schedule_training()
+
+        results = {symbol: None for symbol in symbols}
+        if ready:
+            with timer('signal_batch_score_seconds'):
+                scored = self._score_vectorized(ready)
+            for symbol in ready:
+                self._responses[symbol] = (
+                    self._bar_close(self.states[symbol].bar_time), self.model_version, scored[symbol]
+                )
+                results[symbol] = scored[symbol]
+        return results
+
+    def _schedule_training(self):
+        """在背景重訓模型，不阻塞當前批次；已在訓練時由該任務在結束後再訓練一次"""
+        if self._train_task is None or self._train_task.done():
+            self._train_task = asyncio.create_task(self._retrain())
+
+    async def _retrain(self):
+        while self._model_stale:
+            self._model_stale = False
+            # 指標表在更新時整體替換而非原地修改，取快照後即可在執行緒中訓練
+            frames = [state.indicators for state in self.states.values() if state.indicators is not None]
+            try:
+                model = await asyncio.to_thread(self._train_model, frames)
+            except Exception as e:
+                print(f"Error training signal model: {e}")
+                return
+            if model is None:
+                continue
+            self.bot.ml_model = model
+            self._model_ready = True
+            # 舊模型（或首個模型就緒前沒有預測）的回應全部失效
+            self.model_version += 1
+
+    async def wait_for_training(self):
+        """等待進行中的背景訓練完成"""
+        if self._train_task is not None:
+            await asyncio.shield(self._train_task)
+
+    def _train_model(self, frames: List[pd.DataFrame]):
+        """以全部標的的尾部窗口訓練新模型並返回；樣本不足時返回 None（保留舊模型）"""
+        from sklearn.base import clone
+
+        features, labels = [], []
+        for indicators in frames:
+            X, y = build_ml_dataset(indicators)
+            features.append(X.iloc[:-1])
+            labels.append(y.iloc[:-1])
+        if not features:
+            return None
+        X, y = pd.concat(features), pd.concat(labels)
+        if len(X) < self.settings['min_train_rows'] or y.nunique() < 2:
+            return None
+        model = clone(self.bot.ml_model)
+        model.fit(X, y)
+        return model
+
+    def _score_vectorized(self, symbols: List[str]) -> Dict[str, Any]:
+        """與 generate_advanced_signals 相同的規則，對整批標的的最新指標一次計算"""
+        latest = pd.DataFrame(
+            [self.states[symbol].indicators.iloc[-1] for symbol in symbols], index=symbols
+        )
+        rules = latest[RULE_COLUMNS].to_numpy(dtype=float)
+        oversold = (rules[:, 0] < 30) & (rules[:, 1] > rules[:, 2]) & (rules[:, 3] > rules[:, 4])
+
+        direction = np.zeros(len(symbols), dtype=int)
+        probability = np.full(len(symbols), np.nan)
+        features = latest[ML_FEATURES]
+        valid = features.notna().all(axis=1).to_numpy()
+        # 取一次引用，背景訓練替換模型時本批仍使用同一個模型
+        model = self.bot.ml_model if self._model_ready else None
+        if model is not None and valid.any():
+            proba = model.predict_proba(features[valid])
+            classes = list(model.classes_)
+            best = proba.argmax(axis=1)
+            direction[valid] = np.asarray(classes)[best]
+            probability[valid] = proba.max(axis=1)
+
+        sizes = volatility_position_size(latest['Volatility'].to_numpy(dtype=float), self.bot.risk_per_trade)
+        results = {}
+        for i, symbol in enumerate(symbols):
+            signals = []
+            if oversold[i]:
+                signals.append({'action': 'BUY', 'confidence': 0.8, 'reason': '多重指標顯示超賣',
+                                'suggested_size': float(sizes[i])})
+            if direction[i] == 1 and probability[i] > 0.7:
+                signals.append({'action': 'BUY', 'confidence': float(probability[i]),
+                                'reason': 'ML模型預測上漲', 'suggested_size': float(sizes[i])})
+            results[symbol] = {
+                'bar_time': str(self.states[symbol].bar_time),
+                'close': float(latest['Close'].iloc[i]),
+                'signals': signals,
+                'prediction': {
+                    'direction': int(direction[i]),
+                    'probability': None if np.isnan(probability[i]) else float(probability[i])
+                }
+            }
+        return results
+
+    async def stop(self):
+        await self.batcher.stop()
+        if self._train_task is not None:
+            self._train_task.cancel()
+            try:
+                await self._train_task
+            except asyncio.CancelledError:
+                pass
+            self._train_task = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'requests': self.requests,
+            'cache_hit_rate': self.cache_hits / self.requests if self.requests else 0.0,
+            'batches': self.batcher.batches,
+            'avg_batch_size': self.batcher.batched_requests / self.batcher.batches if self.batcher.batches else 0.0,
+            'latency_seconds': self.latency.summary()
+        }
+
+app = FastAPI()
+service = SignalService()
+
+@app.get('/signals')
+async def get_signals(symbols: str = Query(..., description='逗號分隔的標的')):
+    requested = [symbol.strip() for symbol in symbols.split(',') if symbol.strip()]
+    if not requested:
+        raise HTTPException(status_code=400, detail='No symbols requested')
+    if len(requested) > service.settings['max_symbols_per_request']:
+        raise HTTPException(status_code=400, detail='Too many symbols')
+    return await service.get_signals(requested)
+
+@app.get('/stats')
+async def get_stats():
+    return service.stats()
+
+@app.on_event('shutdown')
+async def shutdown():
+    await service.stop()
@@ -1,7 +1,25 @@
+import asyncio
+import time
 import streamlit as st
 import pandas as pd
-import numpy as np
 from datetime import datetime, timedelta
+from config import CONFIG
+from market_data_cache import MarketDataCache, PortfolioHistoryCache, downsample
+from backtest_jobs import BacktestJobManager
+
+@st.cache_resource
+def get_market_data_cache():
+    """跨重跑與會話共用的K線緩存"""
+    return MarketDataCache()
+
+@st.cache_resource
+def get_portfolio_cache():
+    return PortfolioHistoryCache()
+
+@st.cache_resource
+def get_backtest_jobs():
+    """回測任務在進程池中執行，不受頁面重跑影響"""
+    return BacktestJobManager()
 
 def main():
     st.set_page_config(
@@ -17,6 +35,7 @@ def main():
         st.title('設置')
         initial_capital = st.number_input('初始資金', value=100000, min_value=1000)
         risk_per_trade = st.slider('風險比例 (%)', 1, 5, 2)
+        user_id = st.text_input('用戶ID', value='demo')
     
     # 主要內容
     tabs = st.tabs(['市場概覽', '交易機器人', '投資組合', '回測系統'])
@@ -28,33 +47,49 @@ def main():
         show_trading_bot(initial_capital, risk_per_trade)
     
     with tabs[2]:
-        show_portfolio()
+        show_portfolio(user_id)
     
     with tabs[3]:
-        show_backtest()
+        show_backtest(initial_capital)
 
 def show_market_overview():
     st.header('市場概覽')
     
-    # 市場數據展示
-    col1, col2, col3, col4 = st.columns(4)
+    symbols = st.multiselect(
+        '監控標的',
+        CONFIG['trading']['default_symbols'],
+        default=CONFIG['trading']['default_symbols'][:4]
+    )
+    if not symbols:
+        st.info('請選擇至少一個標的')
+        return
     
-    with col1:
-        st.metric(label="AAPL", value="$150", delta="2.5%")
-    with col2:
-        st.metric(label="BTC/USD", value="$45,000", delta="-1.2%")
-    with col3:
-        st.metric(label="ETH/USD", value="$3,000", delta="0.8%")
-    with col4:
-        st.metric(label="S&P 500", value="4,500", delta="1.5%")
+    bars = get_market_data_cache().get_many(symbols)
     
-    # 市場趨勢圖
+    # 市場數據展示
+    columns = st.columns(min(len(symbols), 4))
+    for i, symbol in enumerate(symbols):
+        data = bars.get(symbol)
+        with columns[i % len(columns)]:
+            if data is None or len(data) < 2:
+                st.metric(label=symbol, value="N/A")
+                continue
+            last_close, prev_close = data['Close'].iloc[-1], data['Close'].iloc[-2]
+            st.metric(
+                label=symbol,
+                value=f"${last_close:,.2f}",
+                delta=f"{(last_close / prev_close - 1) * 100:.2f}%"
+            )
+    
+    # 市場趨勢圖（以首日為 100 標準化，按圖表寬度降採樣）
     st.subheader('市場趨勢')
-    chart_data = pd.DataFrame(
-        np.random.randn(30, 4).cumsum(axis=0),
-        columns=['AAPL', 'BTC', 'ETH', 'S&P 500']
-    )
-    st.line_chart(chart_data)
+    closes = pd.DataFrame({
+        symbol: data['Close'] / data['Close'].dropna().iloc[0] * 100
+        for symbol, data in bars.items()
+        if data is not None and not data['Close'].dropna().empty
+    })
+    if not closes.empty:
+        st.line_chart(downsample(closes, CONFIG['dashboard']['max_chart_points']))
 
 def show_trading_bot(initial_capital, risk_per_trade):
     st.header('交易機器人')
@@ -79,53 +114,133 @@ def show_trading_bot(initial_capital, risk_per_trade):
             st.info(f'使用策略: {strategy}')
             st.info(f'風險控制: {risk_per_trade}%')
 
-def show_portfolio():
+def show_portfolio(user_id):
     st.header('投資組合分析')
     
+    history = get_portfolio_cache().get_history(user_id)
+    if history.empty:
+        st.info('尚無投資組合快照')
+        return
+    
     # 投資組合概覽
+    latest = history.iloc[-1]
+    first_value = history['total_value'].iloc[0]
+    prev_value = history['total_value'].iloc[-2] if len(history) > 1 else latest['total_value']
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric(label="總資產", value="$150,000", delta="15.2%")
+        st.metric(
+            label="總資產",
+            value=f"${latest['total_value']:,.0f}",
+            delta=f"{(latest['total_value'] / first_value - 1) * 100:.1f}%"
+        )
     with col2:
-        st.metric(label="當日盈虧", value="$2,500", delta="1.8%")
+        st.metric(
+            label="當日盈虧",
+            value=f"${latest['total_value'] - prev_value:,.0f}",
+            delta=f"{(latest['total_value'] / prev_value - 1) * 100:.1f}%"
+        )
     with col3:
-        st.metric(label="持倉數量", value="5")
+        st.metric(label="持倉數量", value=str(int(latest['positions'])))
     
     # 資產配置圖
     st.subheader('資產配置')
-    portfolio_data = pd.DataFrame({
-        'Date': pd.date_range(start='2023-01-01', end='2024-01-01', freq='D'),
-        'Value': np.random.normal(loc=100000, scale=1000, size=366).cumsum()
-    })
-    st.line_chart(portfolio_data.set_index('Date'))
+    st.line_chart(downsample(
+        history[['total_value', 'cash_balance']],
+        CONFIG['dashboard']['max_chart_points']
+    ))
 
-def show_backtest():
+def show_backtest(initial_capital):
     st.header('回測系統')
     
     col1, col2 = st.columns(2)
     with col1:
-        st.date_input('開始日期', value=datetime.now() - timedelta(days=365))
+        start_date = st.date_input('開始日期', value=datetime.now() - timedelta(days=365))
     with col2:
-        st.date_input('結束日期', value=datetime.now())
+        end_date = st.date_input('結束日期', value=datetime.now())
     
-    st.selectbox('選擇策略', ['MACD + RSI', '布林通道', '均線交叉'])
-    st.multiselect('選擇交易標的', ['AAPL', 'GOOGL', 'BTC/USD', 'ETH/USD'])
+    strategy = st.selectbox('選擇策略', ['MACD + RSI', '布林通道', '均線交叉'])
+    symbols = st.multiselect('選擇交易標的', CONFIG['trading']['default_symbols'])
     
+    # 括號單出場，0 表示不設
+    col1, col2, col3, col4 = st.columns(4)
+    with col1:
+        stop_loss = st.number_input('止損比例 (%)', min_value=0.0, value=2.0, key='backtest_stop_loss')
+    with col2:
+        take_profit = st.number_input('獲利目標 (%)', min_value=0.0, value=6.0, key='backtest_take_profit')
+    with col3:
+        trailing_stop = st.number_input('移動止損 (%)', min_value=0.0, value=0.0, key='backtest_trailing_stop')
+    with col4:
+        intrabar_order = st.selectbox(
+            '同K線觸發順序', ['stop_first', 'target_first', 'nearest_first'],
+            format_func={'stop_first': '止損優先', 'target_first': '止盈優先',
+                         'nearest_first': '離開盤價近者優先'}.get
+        )
+    brackets = {
+        'stop_loss': stop_loss / 100 or None,
+        'take_profit': take_profit / 100 or None,
+        'trailing_stop': trailing_stop / 100 or None,
+        'intrabar_order': intrabar_order
+    }
+    
+    jobs = get_backtest_jobs()
     if st.button('開始回測'):
-        with st.spinner('執行回測中...'):
-            # 顯示回測結果
-            st.success('回測完成！')
+        if not symbols:
+            st.warning('請選擇至少一個交易標的')
+        else:
+            # 相同參數的回測直接返回已有任務的結果
+            st.session_state['backtest_job_id'] = asyncio.run(jobs.submit(
+                strategy, symbols, start_date, end_date,
+                {'initial_capital': initial_capital, 'brackets': brackets}
+            ))
+    
+    job_id = st.session_state.get('backtest_job_id')
+    if job_id is None:
+        return
+    job = asyncio.run(jobs.get_job(job_id))
+    if job is None:
+        return
+    
+    # 部分或完整的權益曲線
+    curves = {
+        symbol: pd.Series(
+            [equity for _, equity in points],
+            index=pd.to_datetime([timestamp for timestamp, _ in points])
+        )
+        for symbol, points in job['equity_curve'].items()
+    }
+    
+    if job['status'] in ('QUEUED', 'RUNNING'):
+        st.progress(job['progress'], text=f"執行回測中... {job['progress']:.0%}")
+        if curves:
+            st.line_chart(pd.DataFrame(curves))
+        # 定期重跑頁面以讀取最新進度
+        time.sleep(1)
+        st.rerun()
+    elif job['status'] == 'FAILED':
+        st.error(f"回測失敗: {job['error']}")
+    else:
+        # 顯示回測結果
+        st.success('回測完成！')
+        
+        for symbol, metrics in job['results'].items():
+            st.subheader(symbol)
+            if 'error' in metrics or not metrics:
+                st.info('無回測數據或交易')
+                continue
             
             # 回測績效指標
             col1, col2, col3, col4 = st.columns(4)
             with col1:
-                st.metric(label="總收益率", value="25.8%")
+                st.metric(label="總收益率", value=f"{metrics['total_return']:.1%}")
             with col2:
-                st.metric(label="夏普比率", value="2.1")
+                st.metric(label="夏普比率", value=f"{metrics['sharpe_ratio']:.2f}")
             with col3:
-                st.metric(label="最大回撤", value="-12.3%")
+                st.metric(label="最大回撤", value=f"{metrics['max_drawdown']:.1%}")
             with col4:
-                st.metric(label="勝率", value="65%")
+                st.metric(label="勝率", value=f"{metrics['win_rate']:.0%}")
+        
+        if curves:
+            st.line_chart(pd.DataFrame(curves))
 
 if __name__ == '__main__':
     try:
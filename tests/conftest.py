@@ -0,0 +1,7 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# 測試專用的 JWT 密鑰，須在導入 auth_config 之前設置
+os.environ.setdefault('JWT_SECRET', 'test-secret-for-unit-tests-only-0123456789')
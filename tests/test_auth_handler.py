@@ -0,0 +1,148 @@
+"""OAuth 登入流程對本地假提供者的測試，以及 JWT 驗證緩存與撤銷"""
+import asyncio
+import time
+
+import jwt
+import pytest
+from aiohttp import web
+from fastapi import HTTPException
+
+from auth_config import AUTH_CONFIG
+import auth_handler
+from auth_handler import AuthenticationSystem, VerifiedTokenCache
+
+class FakeUsers:
+    async def create_or_update_user(self, data):
+        return {'id': data.get('oauth_id') or data.get('line_id'), 'email': data.get('email', 'line@example.com'),
+                'name': data['name']}
+
+    def close(self):
+        pass
+
+def _token_ok(request):
+    return web.json_response({'access_token': 'access-123'})
+
+def _userinfo_ok(request):
+    assert request.headers['Authorization'] == 'Bearer access-123'
+    return web.json_response({'id': 'g-1', 'email': 'user@example.com', 'name': 'User'})
+
+def _profile_ok(request):
+    assert request.headers['Authorization'] == 'Bearer access-123'
+    return web.json_response({'userId': 'l-1', 'displayName': 'Line User'})
+
+async def _login(monkeypatch, provider, token_handler=_token_ok, timeout=None):
+    app = web.Application()
+    app.router.add_post('/token', token_handler)
+    app.router.add_get('/userinfo', _userinfo_ok)
+    app.router.add_get('/profile', _profile_ok)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    base = f"http://127.0.0.1:{site._server.sockets[0].getsockname()[1]}"
+
+    providers = AUTH_CONFIG['oauth2_providers']
+    for key, value in {'token_url': f'{base}/token', 'userinfo_url': f'{base}/userinfo',
+                       'profile_url': f'{base}/profile', 'client_id': 'id', 'client_secret': 'secret',
+                       'redirect_uri': 'http://localhost/callback'}.items():
+        monkeypatch.setitem(providers[provider], key, value)
+    if timeout is not None:
+        monkeypatch.setitem(AUTH_CONFIG['http_client'], 'timeout', timeout)
+
+    auth = AuthenticationSystem(db=FakeUsers())
+    try:
+        if provider == 'google':
+            return await auth.oauth2_google_login('code')
+        return await auth.line_login('code')
+    finally:
+        await auth.close()
+        await runner.cleanup()
+
+@pytest.mark.parametrize('provider, user_id', [('google', 'g-1'), ('line', 'l-1')])
+def test_login_success(monkeypatch, provider, user_id):
+    result = asyncio.run(_login(monkeypatch, provider))
+    payload = jwt.decode(result['token'], AUTH_CONFIG['jwt_secret'], algorithms=[AUTH_CONFIG['jwt_algorithm']])
+    assert payload['user_id'] == user_id
+
+def test_provider_error_status_is_400(monkeypatch):
+    def rejected(request):
+        return web.json_response({'error': 'invalid_grant'}, status=400)
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(_login(monkeypatch, 'google', rejected))
+    assert error.value.status_code == 400
+
+def test_provider_timeout_is_503(monkeypatch):
+    async def slow(request):
+        await asyncio.sleep(1)
+        return web.json_response({'access_token': 'late'})
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(_login(monkeypatch, 'line', slow, timeout=0.1))
+    assert error.value.status_code == 503
+
+@pytest.mark.parametrize('body', ['<html>maintenance</html>', '', '["not", "an", "object"]'])
+def test_non_json_success_body_is_503(monkeypatch, body):
+    def broken(request):
+        return web.Response(text=body, content_type='text/html')
+    with pytest.raises(HTTPException) as error:
+        asyncio.run(_login(monkeypatch, 'google', broken))
+    assert error.value.status_code == 503
+
+def _token(user_id='u-1', lifetime=3600):
+    return jwt.encode({'user_id': user_id, 'email': 'u@example.com', 'exp': int(time.time()) + lifetime},
+                      AUTH_CONFIG['jwt_secret'], algorithm=AUTH_CONFIG['jwt_algorithm'])
+
+def test_missing_jwt_secret_fails_at_startup(monkeypatch):
+    monkeypatch.setitem(AUTH_CONFIG, 'jwt_secret', None)
+    with pytest.raises(RuntimeError):
+        AuthenticationSystem(db=FakeUsers())
+
+def test_token_cache_expires_at_exp(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(auth_handler.time, 'time', lambda: now[0])
+    cache = VerifiedTokenCache(max_size=10)
+    cache.put('t', {'user_id': 'u-1', 'exp': 1010})
+    assert cache.get('t') == {'user_id': 'u-1', 'exp': 1010}
+    now[0] = 1010.0
+    assert cache.get('t') is None
+    assert len(cache) == 0
+
+def test_token_cache_evicts_least_recently_used():
+    cache = VerifiedTokenCache(max_size=2)
+    exp = time.time() + 3600
+    cache.put('a', {'exp': exp})
+    cache.put('b', {'exp': exp})
+    assert cache.get('a') is not None
+    cache.put('c', {'exp': exp})
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+
+def test_token_cache_returns_copies():
+    cache = VerifiedTokenCache(max_size=2)
+    cache.put('a', {'user_id': 'u-1', 'exp': time.time() + 3600})
+    cache.get('a')['user_id'] = 'changed'
+    assert cache.get('a')['user_id'] == 'u-1'
+
+@pytest.mark.parametrize('cache_size', [0, 100])
+def test_revoked_token_is_rejected_with_or_without_cache(cache_size):
+    async def run():
+        auth = AuthenticationSystem(jwt_cache_size=cache_size, db=FakeUsers())
+        token = _token()
+        assert (await auth.verify_jwt_token(token))['user_id'] == 'u-1'
+        await auth.revoke_jwt_token(token)
+        with pytest.raises(HTTPException) as error:
+            await auth.verify_jwt_token(token)
+        assert error.value.detail == 'Token has been revoked'
+        # 其他 Token 不受影響
+        assert (await auth.verify_jwt_token(_token('u-2')))['user_id'] == 'u-2'
+
+    asyncio.run(run())
+
+def test_revocation_record_expires_with_token(monkeypatch):
+    auth = AuthenticationSystem(db=FakeUsers())
+    token = _token(lifetime=60)
+    asyncio.run(auth.revoke_jwt_token(token))
+    assert auth.revoked_tokens.is_revoked(token)
+    real_time = time.time
+    monkeypatch.setattr(auth_handler.time, 'time', lambda: real_time() + 120)
+    assert not auth.revoked_tokens.is_revoked(token)
+    assert len(auth.revoked_tokens) == 0
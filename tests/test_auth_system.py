@@ -0,0 +1,101 @@
+"""CloudAuthSystem 對 fakeredis 的限流、退回本地限流與會話撤銷測試"""
+import asyncio
+
+import pytest
+
+pytest.importorskip('firebase_admin')
+pytest.importorskip('aioredis')
+fakeredis = pytest.importorskip('fakeredis')
+
+import auth_system  # noqa: E402
+from fakeredis import aioredis as fake_aioredis  # noqa: E402
+
+@pytest.fixture
+def make_auth(monkeypatch):
+    # 測試不連接 Firebase
+    monkeypatch.setattr(auth_system.credentials, 'Certificate', lambda config: None)
+    monkeypatch.setattr(auth_system.firebase_admin, 'initialize_app', lambda cred: object())
+
+    def make(server):
+        return auth_system.CloudAuthSystem(redis_client=fake_aioredis.FakeRedis(server=server))
+    return make
+
+async def _shutdown(*systems):
+    for auth in systems:
+        if auth._invalidation_task is not None:
+            auth._invalidation_task.cancel()
+            await asyncio.gather(auth._invalidation_task, return_exceptions=True)
+        await auth.redis.aclose()
+
+def test_lua_token_bucket_is_atomic_under_concurrency(make_auth):
+    pytest.importorskip('lupa')
+
+    async def run():
+        server = fakeredis.FakeServer()
+        first, second = make_auth(server), make_auth(server)
+        try:
+            capacity = first.rate_limit_capacity
+            # 兩個進程共用同一個桶，並發請求總共只允許 capacity 次
+            results = await asyncio.gather(*[
+                auth.check_rate_limit('user-1', 'login')
+                for auth in (first, second) for _ in range(capacity)
+            ])
+            assert sum(results) == capacity
+            assert await first.check_rate_limit('user-2', 'login')
+        finally:
+            await _shutdown(first, second)
+
+    asyncio.run(run())
+
+def test_rate_limit_falls_back_to_local_bucket_when_redis_fails(make_auth):
+    async def run():
+        server = fakeredis.FakeServer()
+        server.connected = False
+        auth = make_auth(server)
+        try:
+            capacity = auth.rate_limit_capacity
+            results = [await auth.check_rate_limit('user-1', 'login') for _ in range(capacity + 1)]
+            assert results == [True] * capacity + [False]
+        finally:
+            await _shutdown(auth)
+
+    asyncio.run(run())
+
+def test_revocation_evicts_other_instance_cache(make_auth):
+    async def run():
+        server = fakeredis.FakeServer()
+        issuer, other = make_auth(server), make_auth(server)
+        try:
+            session_id = await issuer.create_session({'user_id': 'user-1'})
+            assert (await other.verify_session(session_id))['user_id'] == 'user-1'
+            assert session_id in other._session_cache
+            # 等待訂閱建立
+            await asyncio.sleep(0.1)
+
+            assert await issuer.revoke_session(session_id)
+            for _ in range(50):
+                if session_id not in other._session_cache:
+                    break
+                await asyncio.sleep(0.02)
+            assert session_id not in other._session_cache
+            assert await other.verify_session(session_id) is None
+        finally:
+            await _shutdown(issuer, other)
+
+    asyncio.run(run())
+
+def test_verify_session_returns_a_copy(make_auth):
+    async def run():
+        auth = make_auth(fakeredis.FakeServer())
+        try:
+            session_id = await auth.create_session({'user_id': 'user-1', 'role': 'trader'})
+            session = await auth.verify_session(session_id)
+            session['user_data']['role'] = 'admin'
+            session['user_id'] = 'someone-else'
+            again = await auth.verify_session(session_id)
+            assert again['user_id'] == 'user-1'
+            assert again['user_data']['role'] == 'trader'
+        finally:
+            await _shutdown(auth)
+
+    asyncio.run(run())
@@ -0,0 +1,91 @@
+"""回測結果緩存：前綴續跑與完整回測一致、重複回測命中緩存、按大小淘汰最久未使用的條目"""
+import asyncio
+import os
+
+import pandas as pd
+
+from backtest_cache import BacktestResultCache
+from backtester import BacktestEngine
+from benchmarks.synthetic import generate_ohlcv
+from seo_optimizer import AdvancedTradingBot
+
+class ScriptedBot(AdvancedTradingBot):
+    """每 7 根K線買入一次，只依賴歷史K線，記錄評估次數"""
+    calls = 0
+
+    def generate_advanced_signals(self, df):
+        ScriptedBot.calls += 1
+        if len(df) % 7 == 0:
+            return [{'action': 'BUY', 'suggested_size': 0.2, 'strategy': 'scripted'}]
+        return []
+
+def _engine():
+    engine = BacktestEngine(100000, brackets={'stop_loss': 0.03, 'take_profit': 0.05, 'trailing_stop': None})
+    engine.trading_bot = ScriptedBot(100000)
+    return engine
+
+def _data():
+    return generate_ohlcv(300, seed=3, start='2020-01-01', freq='D', volatility=0.4)
+
+def test_prefix_resume_matches_full_run(tmp_path):
+    data = _data()
+    cutoff = data.index[199]
+
+    async def run():
+        full = _engine()
+        expected = await full.run_backtest('scripted', data)
+
+        cache = BacktestResultCache(str(tmp_path / 'cache'))
+        await cache.run(_engine(), 'scripted', data, end_date=cutoff)
+        ScriptedBot.calls = 0
+        extended = _engine()
+        metrics = await cache.run(extended, 'scripted', data, end_date=data.index[-1])
+        return full, expected, extended, metrics
+
+    full, expected, extended, metrics = asyncio.run(run())
+    # 只模擬新增的K線
+    assert ScriptedBot.calls == 100
+    assert len(full.trade_history) > 5
+    assert pd.DataFrame(extended.trade_history).equals(pd.DataFrame(full.trade_history))
+    assert extended.equity_curve == full.equity_curve
+    assert extended.positions.keys() == full.positions.keys()
+    assert metrics.keys() == expected.keys()
+    assert metrics['total_return'] == expected['total_return']
+    assert metrics['total_trades'] == expected['total_trades']
+
+def test_identical_run_is_a_cache_hit(tmp_path):
+    data = _data()
+
+    async def run():
+        cache = BacktestResultCache(str(tmp_path / 'cache'))
+        first = _engine()
+        expected = await cache.run(first, 'scripted', data)
+        ScriptedBot.calls = 0
+        # 新的緩存實例從磁碟索引讀取
+        second = _engine()
+        metrics = await BacktestResultCache(str(tmp_path / 'cache')).run(second, 'scripted', data)
+        return first, expected, second, metrics
+
+    first, expected, second, metrics = asyncio.run(run())
+    assert ScriptedBot.calls == 0
+    assert metrics == expected
+    assert second.performance_metrics == expected
+    assert second.trade_history == first.trade_history
+    assert second.equity_curve == first.equity_curve
+
+def test_size_based_lru_eviction(tmp_path):
+    cache = BacktestResultCache(str(tmp_path / 'cache'), max_bytes=10_000)
+    entry = {'metrics': {}, 'state': b'x' * 4_000}
+    cache.put('a', {}, entry)
+    cache.put('b', {}, entry)
+    # 讀取 a 使 b 成為最久未使用的條目
+    assert cache.get('a') is not None
+    cache.put('c', {}, entry)
+
+    assert cache.get('b') is None
+    assert cache.get('a') is not None and cache.get('c') is not None
+    assert not os.path.exists(tmp_path / 'cache' / 'b.pkl')
+    assert cache._total_bytes <= cache.max_bytes
+    # 單個超過上限的條目仍保留最新的一個
+    cache.put('d', {}, {'metrics': {}, 'state': b'x' * 20_000})
+    assert list(cache._entries) == ['d']
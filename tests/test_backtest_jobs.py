@@ -0,0 +1,69 @@
+"""回測任務端到端測試：以合成行情提交任務並等待完成；等待數據庫鎖時不阻塞事件循環"""
+import asyncio
+import threading
+import time
+
+from backtest_jobs import BacktestJobManager
+from benchmarks.synthetic import SyntheticFetcher
+
+def test_submitted_job_completes(tmp_path, monkeypatch):
+    # 緩存與檢查點目錄為相對路徑，工作進程繼承當前目錄
+    monkeypatch.chdir(tmp_path)
+    manager = BacktestJobManager(max_workers=1, db_url=f"sqlite:///{tmp_path / 'jobs.db'}",
+                                 fetcher=SyntheticFetcher(n_bars=120))
+
+    async def run():
+        job_id = await manager.submit('default', ['SYM0000'], '2000-01-03', '2000-12-31')
+        deadline = time.monotonic() + 120
+        while time.monotonic() < deadline:
+            job = await manager.get_job(job_id)
+            if job['status'] in ('COMPLETED', 'FAILED'):
+                return job
+            await asyncio.sleep(0.2)
+        return job
+
+    try:
+        job = asyncio.run(run())
+    finally:
+        manager.shutdown(wait=True)
+
+    assert job['status'] == 'COMPLETED', job['error']
+    assert job['progress'] == 1.0
+    metrics = job['results']['SYM0000']
+    assert 'total_return' in metrics
+    assert job['equity_curve']['SYM0000']
+
+def test_waiting_for_the_db_lock_does_not_block_the_event_loop(tmp_path):
+    manager = BacktestJobManager(max_workers=1, db_url=f"sqlite:///{tmp_path / 'jobs.db'}")
+    held = threading.Event()
+
+    def hold_lock():
+        # 模擬另一個 Streamlit 執行緒正在使用數據庫會話
+        with manager._lock:
+            held.set()
+            time.sleep(0.3)
+
+    async def run():
+        thread = threading.Thread(target=hold_lock)
+        thread.start()
+        held.wait()
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        ticking = asyncio.create_task(ticker())
+        jobs = await asyncio.gather(manager.get_job(1), manager.get_job(2))
+        ticking.cancel()
+        thread.join()
+        return jobs, ticks
+
+    try:
+        jobs, ticks = asyncio.run(run())
+    finally:
+        manager.shutdown()
+    assert jobs == [None, None]
+    assert ticks >= 10
@@ -0,0 +1,47 @@
+"""基準比較：耗時與吞吐量指標都參與比較，缺少指標時判為失敗"""
+from benchmarks.run import compare
+
+def _report(results):
+    return {'meta': {}, 'results': results}
+
+def test_compare_uses_seconds_and_throughput_metrics():
+    base = _report({
+        'indicators': {'seconds': 1.0, 'bars_per_sec': 1000.0},
+        'jwt_verify': {'jwt_decode_ops_per_sec': 10000.0, 'jwt_cache_hit_ops_per_sec': 1e6}
+    })
+    head = _report({
+        'indicators': {'seconds': 1.05, 'bars_per_sec': 950.0},
+        'jwt_verify': {'jwt_decode_ops_per_sec': 10000.0, 'jwt_cache_hit_ops_per_sec': 5e5}
+    })
+    rows, failures = compare(base, head, threshold=0.10)
+    assert failures == []
+    by_metric = {(name, metric): (ratio, regressed) for name, metric, _, _, ratio, regressed in rows}
+    # 有 seconds 時只比較耗時
+    assert set(by_metric) == {('indicators', 'seconds'), ('jwt_verify', 'jwt_decode_ops_per_sec'),
+                              ('jwt_verify', 'jwt_cache_hit_ops_per_sec')}
+    assert by_metric[('indicators', 'seconds')] == (1.05, False)
+    assert by_metric[('jwt_verify', 'jwt_decode_ops_per_sec')] == (1.0, False)
+    # 吞吐量減半即變慢 2 倍
+    assert by_metric[('jwt_verify', 'jwt_cache_hit_ops_per_sec')] == (2.0, True)
+
+def test_compare_fails_on_missing_metrics_and_head_errors():
+    base = _report({
+        'jwt_verify': {'jwt_decode_ops_per_sec': 10000.0},
+        'import[backtester]': {'seconds': 0.2, 'loaded': []},
+        'replay': {'seconds': 1.0},
+        'unknown': {'loaded': []},
+        'broken_in_base': {'error': 'RuntimeError: x'}
+    })
+    head = _report({
+        'jwt_verify': {'jwt_cache_hit_ops_per_sec': 1e6},
+        'import[backtester]': {'error': 'ImportError: y'},
+        'unknown': {'loaded': []}
+    })
+    rows, failures = compare(base, head, threshold=0.10)
+    assert rows == []
+    assert dict(failures) == {
+        'jwt_verify': 'head result has no jwt_decode_ops_per_sec',
+        'import[backtester]': 'base ok, head error: ImportError: y',
+        'replay': 'missing from head',
+        'unknown': "no comparable metric in base: ['loaded']"
+    }
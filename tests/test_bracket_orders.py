@@ -0,0 +1,82 @@
+"""括號單出場：同一K線止損與止盈的先後、跳空時以開盤價成交、移動止損只升不降"""
+import numpy as np
+import pytest
+
+from bracket_orders import find_bracket_exit, normalize_brackets
+
+def _brackets(**settings):
+    return normalize_brackets(settings)
+
+def _exit(*args, **kwargs):
+    """出場價四捨五入，避免比例相乘的浮點誤差"""
+    result = find_bracket_exit(*args, **kwargs)
+    return None if result is None else (result[0], round(result[1], 8), result[2])
+
+def test_same_bar_stop_and_target_follow_intrabar_order():
+    # 第二根K線同時觸及 95 止損與 110 止盈，開盤價 101 離止損較近
+    open_, high, low = [100, 101], [102, 112], [99, 94]
+    expected = {
+        'stop_first': (1, 95.0, 'stop_loss'),
+        'target_first': (1, 110.0, 'take_profit'),
+        'nearest_first': (1, 95.0, 'stop_loss')
+    }
+    for order, exit_ in expected.items():
+        brackets = _brackets(stop_loss=0.05, take_profit=0.10, intrabar_order=order)
+        assert _exit(open_, high, low, 100.0, brackets) == exit_
+
+    # 開盤價 108 離止盈較近
+    brackets = _brackets(stop_loss=0.05, take_profit=0.10, intrabar_order='nearest_first')
+    assert _exit([108], [112], [94], 100.0, brackets) == (0, 110.0, 'take_profit')
+
+def test_invalid_intrabar_order_is_rejected():
+    with pytest.raises(ValueError):
+        normalize_brackets({'stop_loss': 0.05, 'intrabar_order': 'random'})
+
+def test_gap_through_fills_at_the_open():
+    brackets = _brackets(stop_loss=0.05, take_profit=0.10)
+    # 低開於止損位之下：以開盤價 90 成交而非 95
+    assert _exit([100, 90], [101, 92], [99, 88], 100.0, brackets) == (1, 90.0, 'stop_loss')
+    # 高開於止盈位之上：以開盤價 115 成交
+    assert _exit([100, 115], [101, 118], [99, 114], 100.0, brackets) == (1, 115.0, 'take_profit')
+    # 開盤價已越過止損位時，即使 target_first 也先止損
+    brackets = _brackets(stop_loss=0.05, take_profit=0.10, intrabar_order='target_first')
+    assert _exit([93], [111], [90], 100.0, brackets) == (0, 93.0, 'stop_loss')
+
+def test_no_exit_returns_none():
+    brackets = _brackets(stop_loss=0.05, take_profit=0.10)
+    assert find_bracket_exit([100] * 5, [101] * 5, [99] * 5, 100.0, brackets) is None
+    assert find_bracket_exit([100], [200], [1], 100.0, _brackets()) is None
+
+def test_trailing_stop_ratchets_with_prior_highs():
+    brackets = _brackets(trailing_stop=0.10)
+    # 高點依次抬高到 120 後回落；止損位為 120 * 0.9 = 108，不隨之後的低高點下降
+    high = [105, 110, 120, 115, 112, 109]
+    low = [101, 104, 112, 110, 109, 107]
+    open_ = [102, 106, 113, 114, 111, 108.5]
+    assert _exit(open_, high, low, 100.0, brackets) == (5, 108.0, 'trailing_stop')
+
+def test_trailing_stop_ignores_the_current_bar_high():
+    brackets = _brackets(trailing_stop=0.10)
+    # 當根高點 130 不抬高當根止損位（仍為 100 * 0.9 = 90），低點 95 不觸發
+    assert find_bracket_exit([100], [130], [95], 100.0, brackets) is None
+    # 下一根以 130 * 0.9 = 117 為止損位
+    assert _exit([100, 120], [130, 121], [95, 116], 100.0, brackets) == (1, 117.0, 'trailing_stop')
+
+def test_trailing_below_fixed_stop_reports_stop_loss():
+    brackets = _brackets(stop_loss=0.05, trailing_stop=0.10)
+    # 移動止損位 (101 * 0.9) 低於固定止損位 95，觸發的是固定止損
+    assert _exit([100, 100], [101, 100], [99, 94], 100.0, brackets) == (1, 95.0, 'stop_loss')
+
+def test_window_doubling_matches_single_window():
+    rng = np.random.default_rng(5)
+    close = 100 * np.exp(np.cumsum(rng.normal(0.002, 0.01, 2_000)))
+    open_ = np.concatenate(([100.0], close[:-1]))
+    high = np.maximum(open_, close) * 1.002
+    low = np.minimum(open_, close) * 0.998
+    for settings in ({'trailing_stop': 0.08}, {'stop_loss': 0.2, 'take_profit': 3.0, 'trailing_stop': 0.2}):
+        brackets = _brackets(**settings)
+        # 跨越多個倍增窗口時，窗口間傳遞的最高價使結果與一次搜索全部K線一致
+        expected = find_bracket_exit(open_, high, low, 100.0, brackets, initial_window=len(high))
+        # 初始窗口 2 時前四個窗口只覆蓋 30 根K線，出場落在之後的窗口
+        assert expected is not None and expected[0] > 30
+        assert find_bracket_exit(open_, high, low, 100.0, brackets, initial_window=2) == expected
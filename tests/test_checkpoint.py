@@ -0,0 +1,82 @@
+"""檢查點：文件與數據庫後端的保存/讀取、保留最近 N 個、最新損壞時退回上一個"""
+import asyncio
+
+import numpy as np
+import pytest
+
+from checkpoint import CheckpointManager
+from database_handler import DatabaseManager, EngineCheckpoint
+
+@pytest.fixture(params=['file', 'db'])
+def manager(request, tmp_path):
+    if request.param == 'file':
+        yield CheckpointManager(backend='file', directory=str(tmp_path / 'checkpoints'), keep=3)
+        return
+    db = DatabaseManager(f"sqlite:///{tmp_path / 'checkpoints.db'}")
+    yield CheckpointManager(backend='db', keep=3, db=db)
+    db.close()
+
+def _stored(manager, name):
+    if manager.backend == 'file':
+        return manager._read_files(name)
+    return asyncio.run(manager.db.get_checkpoints(name))
+
+def _corrupt_latest(manager, name):
+    if manager.backend == 'file':
+        with open(manager._files(name)[0], 'wb') as f:
+            f.write(b'\x80\x05truncated')
+        return
+    session = manager.db.session
+    latest = session.query(EngineCheckpoint).filter(EngineCheckpoint.name == name) \
+        .order_by(EngineCheckpoint.id.desc()).first()
+    latest.data = b'\x80\x05truncated'
+    session.commit()
+
+def test_round_trip(manager):
+    state = {'capital': 1234.5, 'positions': {'SYM': {'quantity': 2.0}},
+             'equity': np.arange(5, dtype=float), 'trades': [('BUY', 1)]}
+
+    async def run():
+        assert await manager.load_latest('engine') is None
+        await manager.save('engine', state)
+        return await manager.load_latest('engine')
+
+    restored = asyncio.run(run())
+    assert restored['capital'] == state['capital']
+    assert restored['positions'] == state['positions']
+    assert restored['trades'] == state['trades']
+    np.testing.assert_array_equal(restored['equity'], state['equity'])
+
+def test_keeps_last_n_per_name(manager):
+    async def run():
+        for i in range(5):
+            await manager.save('engine', {'step': i})
+        await manager.save('other', {'step': 'other'})
+        return await manager.load_latest('engine'), await manager.load_latest('other')
+
+    latest, other = asyncio.run(run())
+    assert latest == {'step': 4}
+    assert other == {'step': 'other'}
+    assert len(_stored(manager, 'engine')) == 3
+    assert len(_stored(manager, 'other')) == 1
+
+    asyncio.run(manager.clear('engine'))
+    assert _stored(manager, 'engine') == []
+    assert asyncio.run(manager.load_latest('other')) == {'step': 'other'}
+
+def test_falls_back_to_previous_when_latest_is_corrupt(manager, capsys):
+    async def save_two():
+        await manager.save('engine', {'step': 0})
+        await manager.save('engine', {'step': 1})
+
+    asyncio.run(save_two())
+    _corrupt_latest(manager, 'engine')
+    assert asyncio.run(manager.load_latest('engine')) == {'step': 0}
+    assert 'Skipping corrupt checkpoint engine' in capsys.readouterr().out
+
+def test_file_checkpoints_leave_no_temporary_files(tmp_path):
+    manager = CheckpointManager(backend='file', directory=str(tmp_path / 'checkpoints'), keep=2)
+    for i in range(3):
+        asyncio.run(manager.save('engine', {'step': i}))
+    names = sorted(path.name for path in (tmp_path / 'checkpoints').iterdir())
+    assert names == ['engine-0000000001.ckpt', 'engine-0000000002.ckpt']
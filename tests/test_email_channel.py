@@ -0,0 +1,99 @@
+"""SMTPEmailChannel 對本地 SMTP 服務的連接重用與閒置重連測試"""
+import asyncio
+import socketserver
+import threading
+from email.mime.text import MIMEText
+
+import pytest
+
+from email_channel import SMTPEmailChannel
+
+class FakeSMTPHandler(socketserver.StreamRequestHandler):
+    """最小的 SMTP 服務端：接受所有郵件，記錄連接數、郵件數與 QUIT 次數"""
+
+    def reply(self, line: str):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.connections += 1
+        self.reply('220 localhost fake smtp')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 localhost')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                while self.rfile.readline() not in (b'.\r\n', b''):
+                    pass
+                with server.lock:
+                    server.messages += 1
+                self.reply('250 OK queued')
+            elif command == 'QUIT':
+                with server.lock:
+                    server.quits += 1
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Command not implemented')
+
+@pytest.fixture
+def smtp_server():
+    server = socketserver.ThreadingTCPServer(('127.0.0.1', 0), FakeSMTPHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.connections = server.messages = server.quits = 0
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+def _channel(server, **kwargs):
+    return SMTPEmailChannel('127.0.0.1', server.server_address[1], 'bot@example.com',
+                            use_starttls=False, timeout=5, **kwargs)
+
+def _message(i):
+    msg = MIMEText(f'body {i}')
+    msg['Subject'] = f'alert {i}'
+    msg['To'] = f'user{i}@example.com'
+    return msg
+
+def test_batch_reuses_one_connection(smtp_server):
+    async def run():
+        channel = _channel(smtp_server, pool_size=1, batch_size=50)
+        try:
+            results = await asyncio.gather(*[channel.send(_message(i)) for i in range(10)])
+        finally:
+            await channel.close()
+        return results
+
+    assert asyncio.run(run()) == [True] * 10
+    assert smtp_server.messages == 10
+    assert smtp_server.connections == 1
+    # close 時以 QUIT 正常關閉連接
+    assert smtp_server.quits == 1
+
+def test_reconnects_after_idle_timeout(smtp_server):
+    async def run():
+        channel = _channel(smtp_server, pool_size=1, idle_timeout=0.1)
+        try:
+            assert await channel.send(_message(0)) is True
+            assert await channel.send(_message(1)) is True
+            assert smtp_server.connections == 1
+            await asyncio.sleep(0.3)
+            assert await channel.send(_message(2)) is True
+        finally:
+            await channel.close()
+
+    asyncio.run(run())
+    assert smtp_server.messages == 3
+    assert smtp_server.connections == 2
+    # 閒置的連接與最後的連接都以 QUIT 關閉
+    assert smtp_server.quits == 2
@@ -0,0 +1,121 @@
+"""計時與計數：Prometheus 文本與 JSON 導出、同步/異步函數計時、停用時不記錄且開銷接近零"""
+import asyncio
+import json
+import time
+import urllib.request
+
+import pytest
+
+import instrumentation
+from instrumentation import Histogram, registry, timed, timer, incr
+
+@pytest.fixture
+def metrics():
+    was_enabled = instrumentation.is_enabled()
+    registry.reset()
+    instrumentation.enable()
+    yield registry
+    registry.reset()
+    if not was_enabled:
+        instrumentation.disable()
+
+def test_prometheus_and_json_export(metrics):
+    incr('orders_total', stage='submit')
+    incr('orders_total', 2, stage='submit')
+    metrics.observe('latency_seconds', 0.003, op='save')
+    metrics.observe('latency_seconds', 0.2, op='save')
+
+    text = metrics.to_prometheus()
+    assert '# TYPE orders_total counter' in text
+    assert 'orders_total{stage="submit"} 3' in text
+    assert '# TYPE latency_seconds histogram' in text
+    # 累積桶：0.0025 桶為空，0.005 桶含一次觀測，+Inf 含全部
+    assert 'latency_seconds_bucket{op="save",le="0.0025"} 0' in text
+    assert 'latency_seconds_bucket{op="save",le="0.005"} 1' in text
+    assert 'latency_seconds_bucket{op="save",le="+Inf"} 2' in text
+    assert 'latency_seconds_count{op="save"} 2' in text
+
+    report = json.loads(json.dumps(metrics.to_dict()))
+    assert report['counters'] == [{'name': 'orders_total', 'labels': {'stage': 'submit'}, 'value': 3}]
+    [histogram] = report['histograms']
+    assert histogram['name'] == 'latency_seconds' and histogram['labels'] == {'op': 'save'}
+    assert histogram['count'] == 2 and histogram['max'] == 0.2
+    assert histogram['sum'] == pytest.approx(0.203)
+
+def test_metrics_server_serves_both_formats(metrics):
+    incr('requests_total')
+    server = instrumentation.start_metrics_server(port=0, host='127.0.0.1')
+    try:
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        with urllib.request.urlopen(f"{base}/metrics") as response:
+            assert response.headers['Content-Type'].startswith('text/plain')
+            assert 'requests_total 1' in response.read().decode()
+        with urllib.request.urlopen(f"{base}/metrics.json") as response:
+            assert json.load(response)['counters'][0]['name'] == 'requests_total'
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_timed_sync_and_async_functions(metrics):
+    @timed('work_seconds', kind='sync')
+    def work(x):
+        time.sleep(0.01)
+        return x * 2
+
+    @timed('work_seconds', kind='async')
+    async def async_work(x):
+        await asyncio.sleep(0.01)
+        return x * 3
+
+    @timed('work_seconds', kind='failing')
+    def failing():
+        raise ValueError('boom')
+
+    assert work(2) == 4
+    assert asyncio.run(async_work(2)) == 6
+    with pytest.raises(ValueError):
+        failing()
+
+    for kind in ('sync', 'async'):
+        histogram = metrics.histogram('work_seconds', kind=kind)
+        assert histogram.count == 1 and histogram.sum >= 0.01
+    assert metrics.histogram('work_seconds', kind='failing').count == 1
+    assert metrics.counters['work_seconds_errors'] == {(('kind', 'failing'),): 1}
+    # 裝飾後保留函數名稱與協程屬性
+    assert async_work.__name__ == 'async_work'
+    assert asyncio.iscoroutinefunction(async_work)
+
+def test_disabled_records_nothing_with_near_zero_overhead(metrics):
+    instrumentation.disable()
+
+    def raw(x):
+        return x
+
+    wrapped = timed('noop_seconds')(raw)
+    assert timer('noop_seconds') is timer('other_seconds')
+    with timer('noop_seconds'):
+        incr('noop_total')
+    wrapped(1)
+    assert metrics.counters == {} and metrics.histograms == {}
+
+    n = 100_000
+
+    def per_call(func):
+        best = float('inf')
+        for _ in range(5):
+            start = time.perf_counter()
+            for i in range(n):
+                func(i)
+            best = min(best, (time.perf_counter() - start) / n)
+        return best
+
+    # 停用時只多一次屬性檢查與函數調用
+    assert per_call(wrapped) - per_call(raw) < 1e-6
+
+def test_histogram_percentiles_are_bounded_by_max():
+    histogram = Histogram()
+    for value in (0.001, 0.002, 0.003, 0.004, 0.1):
+        histogram.observe(value)
+    assert histogram.percentile(0.5) <= histogram.percentile(0.9) <= histogram.percentile(0.99) <= 0.1
+    assert histogram.percentile(0.99) == pytest.approx(0.1, rel=0.5)
+    assert Histogram().percentile(0.5) == 0.0
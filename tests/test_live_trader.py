@@ -0,0 +1,147 @@
+"""實盤循環：回放K線收盤後才可見、括號單出場、重啟後從檢查點恢復"""
+import asyncio
+
+import numpy as np
+import pandas as pd
+
+from checkpoint import CheckpointManager
+from live_trader import LiveTrader
+from market_replay import MarketDataStore, ReplayFetcher, SimulatedClock
+from risk_engine import PreTradeRiskEngine
+from seo_optimizer import AdvancedTradingBot
+
+class FakeDB:
+    def __init__(self):
+        self.trades = []
+
+    async def save_trade(self, trade):
+        self.trades.append(trade)
+
+    async def save_portfolio_snapshot(self, snapshot):
+        pass
+
+class FakeNotifications:
+    async def send_notification(self, user_id, notification, channels):
+        pass
+
+class ScriptedTrader(LiveTrader):
+    """空倉時發出買入信號，持倉時沒有信號"""
+
+    def _evaluate(self, data):
+        df = data.assign(Volatility=0.2)
+        if self.bot.positions:
+            return df, []
+        return df, [{'action': 'BUY', 'suggested_size': 0.1, 'reason': 'test'}]
+
+def _bars(closes, lows, start='2024-01-01'):
+    index = pd.date_range(start, periods=len(closes), freq='min')
+    closes = np.asarray(closes, dtype=float)
+    return pd.DataFrame({
+        'Open': closes, 'High': closes + 0.5, 'Low': np.asarray(lows, dtype=float),
+        'Close': closes, 'Volume': 1.0
+    }, index=index)
+
+def _trader(fetcher, clock, tmp_path, db):
+    return ScriptedTrader(
+        'user-1', ['SYM'], fetcher=fetcher, bot=AdvancedTradingBot(10000), risk_engine=PreTradeRiskEngine(),
+        db=db, notifications=FakeNotifications(), clock=clock,
+        checkpoint_manager=CheckpointManager(backend='file', directory=str(tmp_path / 'checkpoints')),
+        brackets={'stop_loss': 0.05, 'take_profit': None, 'trailing_stop': None}, timeframe='1m'
+    )
+
+def test_replay_bar_visible_only_after_close(tmp_path):
+    store = MarketDataStore(str(tmp_path / 'market'))
+    bars = _bars([100, 101, 102], [99, 100, 101])
+    store.save_bars('SYM', bars)
+    clock = SimulatedClock(bars.index[1])
+    fetcher = ReplayFetcher(store, clock, timeframe='1m')
+
+    async def run():
+        # 第二根K線剛開盤，只有第一根已收盤
+        visible = await fetcher.get_historical_data('SYM', '1m')
+        assert list(visible.index) == [bars.index[0]]
+        await clock.advance_to(bars.index[1] + pd.Timedelta(minutes=1))
+        visible = await fetcher.get_historical_data('SYM', '1m')
+        assert list(visible.index) == list(bars.index[:2])
+
+    asyncio.run(run())
+    assert fetcher.event_times()[0] == bars.index[0] + pd.Timedelta(minutes=1)
+
+def test_bracket_exit_and_restore_after_restart(tmp_path):
+    store = MarketDataStore(str(tmp_path / 'market'))
+    # 第三根K線最低價跌破 5% 止損
+    bars = _bars([100, 100, 99, 98], [99.5, 99.5, 90, 97])
+    store.save_bars('SYM', bars)
+    clock = SimulatedClock(bars.index[0] + pd.Timedelta(minutes=1))
+    fetcher = ReplayFetcher(store, clock, timeframe='1m')
+    db = FakeDB()
+
+    async def run():
+        trader = _trader(fetcher, clock, tmp_path, db)
+        await trader.step()
+        assert 'SYM' in trader.bot.positions
+        assert trader.risk_engine.exposure('user-1')['open_positions'] == 1
+
+        # 重啟：新實例從檢查點恢復持倉、敞口與已處理的K線
+        await clock.advance_to(bars.index[1] + pd.Timedelta(minutes=1))
+        restarted = _trader(fetcher, clock, tmp_path, db)
+        await restarted.step()
+        assert restarted.bot.positions['SYM']['entry_bar'] == bars.index[0]
+        assert restarted.risk_engine.exposure('user-1')['open_positions'] == 1
+        assert len(db.trades) == 1
+
+        await clock.advance_to(bars.index[2] + pd.Timedelta(minutes=1))
+        await restarted.step()
+        # 止損先於當根K線的信號執行；平倉後空倉，腳本在同一根K線重新買入
+        assert [trade['action'] for trade in db.trades] == ['BUY', 'SELL', 'BUY']
+        exit_trade = db.trades[1]
+        assert exit_trade['action'] == 'SELL'
+        assert exit_trade['strategy'] == 'stop_loss'
+        assert exit_trade['price'] == 95.0
+
+    asyncio.run(run())
+
+class LiveLikeFetcher:
+    """與交易所一樣返回截至當前的全部K線，最後一根為尚未收盤的K線"""
+
+    def __init__(self, bars, clock):
+        self.bars = bars
+        self.clock = clock
+
+    async def get_historical_data(self, symbol, timeframe='1d', limit=100, start=None):
+        return self.bars[self.bars.index <= self.clock.now()]
+
+class RecordingTrader(LiveTrader):
+    def _evaluate(self, data):
+        self.seen.append((data.index[-1], float(data['Close'].iloc[-1])))
+        return data.assign(Volatility=0.2), []
+
+def test_forming_bar_is_processed_only_after_close(tmp_path):
+    bars = _bars([100, 101, 102], [99, 100, 101])
+    clock = SimulatedClock(bars.index[1] + pd.Timedelta(seconds=30))
+    fetcher = LiveLikeFetcher(bars, clock)
+    trader = RecordingTrader(
+        'user-1', ['SYM'], fetcher=fetcher, bot=AdvancedTradingBot(10000), risk_engine=PreTradeRiskEngine(),
+        db=FakeDB(), notifications=FakeNotifications(), clock=clock,
+        checkpoint_manager=CheckpointManager(backend='file', directory=str(tmp_path / 'checkpoints')),
+        timeframe='1m'
+    )
+    trader.seen = []
+
+    async def run():
+        # 第二根K線仍在形成中：只處理第一根
+        await trader.step()
+        assert trader.seen == [(bars.index[0], 100.0)]
+        # 第二根尚未收盤時收盤價已變動，仍不處理
+        bars.loc[bars.index[1], 'Close'] = 100.5
+        await clock.advance_to(bars.index[1] + pd.Timedelta(seconds=50))
+        await trader.step()
+        assert len(trader.seen) == 1
+        # 收盤後以最終收盤價處理一次
+        bars.loc[bars.index[1], 'Close'] = 101.5
+        await clock.advance_to(bars.index[2])
+        await trader.step()
+        await trader.step()
+        assert trader.seen == [(bars.index[0], 100.0), (bars.index[1], 101.5)]
+
+    asyncio.run(run())
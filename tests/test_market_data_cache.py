@@ -0,0 +1,89 @@
+"""行情緩存：增量拉取與合併、長度上限、過期判斷與降採樣"""
+import numpy as np
+import pandas as pd
+
+import market_data_cache
+from config import CONFIG
+from market_data_cache import MarketDataCache, downsample
+
+class GrowingFetcher:
+    """返回截至 self.available 根的K線；最後一根收盤價可在兩次請求之間改變（未收盤）"""
+
+    def __init__(self, n_bars=1000):
+        index = pd.date_range('2024-01-01', periods=n_bars, freq='D')
+        self.bars = pd.DataFrame({'Close': np.arange(n_bars, dtype=float)}, index=index)
+        self.available = 0
+        self.calls = []
+
+    async def get_historical_data(self, symbol, timeframe='1d', limit=100, start=None):
+        self.calls.append({'limit': limit, 'start': start})
+        visible = self.bars.iloc[:self.available]
+        if start is not None:
+            return visible[visible.index >= pd.Timestamp(start)].copy()
+        return visible.iloc[-limit:].copy()
+
+def _clock(monkeypatch, start=1000.0):
+    now = [start]
+    monkeypatch.setattr(market_data_cache.time, 'monotonic', lambda: now[0])
+    return now
+
+def test_incremental_fetch_merges_and_trims_to_lookback(monkeypatch):
+    now = _clock(monkeypatch)
+    monkeypatch.setitem(CONFIG['dashboard']['ttl'], 'stock', 60)
+    fetcher = GrowingFetcher()
+    fetcher.available = 100
+    cache = MarketDataCache(fetcher=fetcher, lookback=50)
+
+    bars = cache.get_bars('AAPL')
+    assert len(bars) == 50 and bars.index[-1] == fetcher.bars.index[99]
+    assert fetcher.calls == [{'limit': 50, 'start': None}]
+
+    # 最後一根K線的收盤價更新，並出現 30 根新K線
+    fetcher.bars.iloc[99, 0] = -1.0
+    fetcher.available = 130
+    now[0] += 61
+    bars = cache.get_bars('AAPL')
+    # 只從緩存的最後一根K線開始重取
+    assert fetcher.calls[-1]['start'] == fetcher.bars.index[99]
+    assert len(bars) == 50
+    assert bars.index.is_unique and bars.index.is_monotonic_increasing
+    assert bars.index[-1] == fetcher.bars.index[129]
+    assert bars.loc[fetcher.bars.index[99], 'Close'] == -1.0
+
+    # 長時間運行：多次增量刷新後長度仍不超過 lookback
+    for _ in range(20):
+        fetcher.available += 10
+        now[0] += 61
+        assert len(cache.get_bars('AAPL')) == 50
+
+def test_fresh_symbols_are_served_without_requests(monkeypatch):
+    now = _clock(monkeypatch)
+    monkeypatch.setitem(CONFIG['dashboard']['ttl'], 'stock', 60)
+    monkeypatch.setitem(CONFIG['dashboard']['ttl'], 'crypto', 10)
+    fetcher = GrowingFetcher()
+    fetcher.available = 20
+    cache = MarketDataCache(fetcher=fetcher, lookback=50)
+
+    cache.get_many(['AAPL', 'BTC/USDT'])
+    assert len(fetcher.calls) == 2
+    now[0] += 30
+    # 加密貨幣 TTL 較短，只有它過期
+    assert cache.is_fresh('AAPL') and not cache.is_fresh('BTC/USDT')
+    frames = cache.get_many(['AAPL', 'BTC/USDT'])
+    assert len(fetcher.calls) == 3 and set(frames) == {'AAPL', 'BTC/USDT'}
+
+def test_downsample_keeps_extremes_and_endpoints():
+    rng = np.random.default_rng(0)
+    values = rng.normal(size=10_000).cumsum()
+    values[1234], values[8765] = 1000.0, -1000.0
+    df = pd.DataFrame({'Close': values, 'Volume': np.arange(10_000)},
+                      index=pd.date_range('2020-01-01', periods=10_000, freq='min'))
+    sampled = downsample(df, 800)
+    assert len(sampled) <= 802
+    assert sampled.index.is_monotonic_increasing
+    assert sampled.index[0] == df.index[0] and sampled.index[-1] == df.index[-1]
+    assert sampled['Close'].max() == 1000.0 and sampled['Close'].min() == -1000.0
+    # 其他列取同一組時間點
+    pd.testing.assert_frame_equal(sampled, df.loc[sampled.index])
+    # 點數不超過上限時原樣返回
+    pd.testing.assert_frame_equal(downsample(df.iloc[:100], 800), df.iloc[:100])
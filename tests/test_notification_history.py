@@ -0,0 +1,80 @@
+"""通知歷史：每用戶環形上限、超出用戶數時淘汰最久未活動的用戶、保留期過期與清除"""
+import pytest
+
+import notification_history
+from notification_history import NotificationHistory
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1_000_000.0]
+    monkeypatch.setattr(notification_history.time, 'time', lambda: now[0])
+    return now
+
+def _record(user_id, i):
+    return {'user_id': user_id, 'message': f'message {i}'}
+
+def _messages(history, user_id, limit=50):
+    return [record['message'] for record in history.get(user_id, limit)]
+
+def test_ring_buffer_keeps_latest_per_user(clock):
+    history = NotificationHistory(max_per_user=3)
+    for i in range(5):
+        history.append(_record('alice', i))
+    history.append(_record('bob', 0))
+
+    assert _messages(history, 'alice') == ['message 2', 'message 3', 'message 4']
+    assert _messages(history, 'alice', limit=2) == ['message 3', 'message 4']
+    assert _messages(history, 'bob') == ['message 0']
+    assert len(history) == 4
+    assert history.get('nobody') == []
+
+def test_evicts_longest_idle_user_at_max_users(clock):
+    history = NotificationHistory(max_users=2)
+    history.append(_record('alice', 0))
+    history.append(_record('bob', 0))
+    # alice 再次活動，bob 成為最久未活動的用戶
+    history.append(_record('alice', 1))
+    history.append(_record('carol', 0))
+
+    assert history.get('bob') == []
+    assert _messages(history, 'alice') == ['message 0', 'message 1']
+    assert _messages(history, 'carol') == ['message 0']
+    assert len(history._buffers) == 2
+
+def test_retention_expires_old_records(clock):
+    history = NotificationHistory(retention_seconds=60)
+    history.append(_record('alice', 0))
+    clock[0] += 30
+    history.append(_record('alice', 1))
+    clock[0] += 31
+    # 讀取時移除超過保留期的記錄
+    assert _messages(history, 'alice') == ['message 1']
+    assert len(history) == 1
+    clock[0] += 30
+    assert history.get('alice') == []
+
+    # 追加時同樣移除
+    history.append(_record('bob', 0))
+    clock[0] += 61
+    history.append(_record('bob', 1))
+    assert _messages(history, 'bob') == ['message 1']
+
+def test_without_retention_nothing_expires(clock):
+    history = NotificationHistory()
+    history.append(_record('alice', 0))
+    clock[0] += 10 * 365 * 24 * 3600
+    assert _messages(history, 'alice') == ['message 0']
+
+def test_clear_removes_only_that_user(clock):
+    history = NotificationHistory()
+    history.append(_record('alice', 0))
+    history.append(_record('bob', 0))
+    history.clear('alice')
+    history.clear('nobody')
+
+    assert history.get('alice') == []
+    assert _messages(history, 'bob') == ['message 0']
+    assert len(history) == 1
+    # 清除後重新記錄
+    history.append(_record('alice', 1))
+    assert _messages(history, 'alice') == ['message 1']
@@ -0,0 +1,190 @@
+"""NotificationSystem 對本地假 Telegram / LINE 服務的限流、重試、死信與通知歷史測試"""
+import asyncio
+import time
+
+from aiohttp import web
+
+from config import CONFIG
+from notification_system import NotificationSystem
+
+class FakeDeadLetters:
+    def __init__(self):
+        self.saved = []
+
+    async def save_dead_letter(self, record):
+        self.saved.append(record)
+
+class FakeProvider:
+    """假 Telegram / LINE 服務：按收件人（chat_id 或 to）返回預設的狀態碼序列，之後一律 200，
+    並記錄每次請求的時間與內容"""
+
+    def __init__(self, responses):
+        self.responses = {chat: list(codes) for chat, codes in responses.items()}
+        self.requests = []
+
+    async def handle(self, request):
+        body = await request.json()
+        chat = body.get('chat_id', body.get('to'))
+        self.requests.append((chat, time.monotonic(), body))
+        codes = self.responses.get(chat)
+        status, retry_after = codes.pop(0) if codes else (200, None)
+        headers = {'Retry-After': str(retry_after)} if retry_after is not None else {}
+        return web.json_response({'ok': status == 200}, status=status, headers=headers)
+
+    def times(self, chat):
+        return [at for requested, at, _ in self.requests if requested == chat]
+
+    def bodies(self, chat):
+        return [body for requested, _, body in self.requests if requested == chat]
+
+def _message(chat, priority='urgent'):
+    return {'title': 't', 'content': chat, 'priority': priority, 'telegram_chat_id': chat, 'line_user_id': chat}
+
+async def _run(monkeypatch, responses, messages, num_workers=1, retry=None, channels=('telegram',),
+               coalesce=None):
+    """messages 為收件人字串（緊急通知）或完整訊息；返回 (假服務, 已停止的 NotificationSystem, 開始時間)"""
+    fake = FakeProvider(responses)
+    app = web.Application()
+    app.router.add_post('/{path:.*}', fake.handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    await site.start()
+    port = site._server.sockets[0].getsockname()[1]
+    monkeypatch.setitem(CONFIG['telegram'], 'api_base', f'http://127.0.0.1:{port}')
+    monkeypatch.setitem(CONFIG['line'], 'api_base', f'http://127.0.0.1:{port}')
+    monkeypatch.setitem(CONFIG['notifications'], 'retry',
+                        {'max_retries': 3, 'base_delay': 0.01, 'max_delay': 0.3, **(retry or {})})
+    if coalesce is not None:
+        monkeypatch.setitem(CONFIG['notifications'], 'coalesce', coalesce)
+
+    notifications = NotificationSystem(num_workers=num_workers, db=FakeDeadLetters())
+    try:
+        start = time.monotonic()
+        for message in messages:
+            if isinstance(message, str):
+                message = _message(message)
+            await notifications.send_notification('user', message, list(channels))
+        await notifications.flush()
+        return fake, notifications, start
+    finally:
+        await notifications.stop()
+        await runner.cleanup()
+
+def test_retry_after_is_honoured_without_extra_token_wait(monkeypatch):
+    fake, notifications, _ = asyncio.run(_run(monkeypatch, {'a': [(429, 0.2)]}, ['a']))
+    first, second = fake.times('a')
+    # 收件人速率為 1/秒，但重試只等待 Retry-After，不再額外等待一個令牌
+    assert 0.18 <= second - first < 0.5
+    assert notifications.db.saved == []
+
+def test_retry_after_is_capped_by_max_delay(monkeypatch):
+    fake, _, _ = asyncio.run(_run(monkeypatch, {'a': [(429, 60)]}, ['a']))
+    first, second = fake.times('a')
+    assert second - first < 0.6
+
+def test_throttled_chat_does_not_stall_other_chats(monkeypatch):
+    # 只有一個工作者：被限流的 chat 等待期間，其他 chat 仍應立即送達
+    fake, _, start = asyncio.run(_run(monkeypatch, {'slow': [(429, 0.3)]}, ['slow', 'b', 'c']))
+    assert fake.times('b')[0] - start < 0.2
+    assert fake.times('c')[0] - start < 0.2
+    assert len(fake.times('slow')) == 2
+
+def test_permanent_error_is_dead_lettered_without_retry(monkeypatch):
+    fake, notifications, _ = asyncio.run(_run(monkeypatch, {'a': [(400, None)]}, ['a']))
+    assert len(fake.times('a')) == 1
+    assert [(d['channel'], d['attempts']) for d in notifications.db.saved] == [('telegram', 1)]
+
+def test_retries_exhausted_go_to_dead_letters(monkeypatch):
+    fake, notifications, _ = asyncio.run(_run(monkeypatch, {'a': [(500, None)] * 10}, ['a']))
+    assert len(fake.times('a')) == 4
+    assert [d['attempts'] for d in notifications.db.saved] == [4]
+
+def test_history_records_each_channel_once_when_it_finishes(monkeypatch):
+    # LINE 第一次 500 後重試成功：Telegram 的成功不應記錄為 partial_failure，重試也不重複記錄 Telegram
+    message = {**_message('tg'), 'line_user_id': 'ln'}
+    fake, notifications, _ = asyncio.run(_run(
+        monkeypatch, {'ln': [(500, None)]}, [message], channels=('telegram', 'line')
+    ))
+    assert len(fake.times('ln')) == 2
+    history = notifications.notification_history.get('user')
+    assert [(record['channels'], record['status']) for record in history] == [
+        (['telegram'], 'success'), (['line'], 'success')
+    ]
+    assert 'attempt' not in history[1]
+
+def test_history_records_permanent_failure(monkeypatch):
+    _, notifications, _ = asyncio.run(_run(monkeypatch, {'a': [(400, None)]}, ['a']))
+    history = notifications.notification_history.get('user')
+    assert [(record['channels'], record['status']) for record in history] == [(['telegram'], 'partial_failure')]
+
+COALESCE = {'enabled': True, 'window': 10, 'max_batch': 50, 'bypass_priorities': ['urgent']}
+
+def _signal(symbol, action='BUY', priority='normal'):
+    return {'symbol': symbol, 'action': action, 'title': f'{symbol} {action}', 'content': f'{action} {symbol}',
+            'priority': priority, 'telegram_chat_id': 'tg', 'line_user_id': 'ln'}
+
+def test_duplicate_signals_are_deduplicated_into_a_telegram_digest(monkeypatch):
+    messages = [_signal('AAPL'), _signal('AAPL'), _signal('TSLA', 'SELL')]
+    fake, _, _ = asyncio.run(_run(monkeypatch, {}, messages, coalesce=COALESCE))
+    bodies = fake.bodies('tg')
+    assert len(bodies) == 1
+    text = bodies[0]['text']
+    assert '交易提醒摘要 (3 則)' in text
+    assert '```' in text
+    rows = [line.split() for line in text.split('```')[1].strip().splitlines()[1:]]
+    assert [row[:3] for row in rows] == [['AAPL', 'BUY', '2'], ['TSLA', 'SELL', '1']]
+
+def test_single_coalesced_message_is_sent_unchanged(monkeypatch):
+    fake, _, _ = asyncio.run(_run(monkeypatch, {}, [_signal('AAPL')], coalesce=COALESCE))
+    [body] = fake.bodies('tg')
+    assert '摘要' not in body['text'] and 'BUY AAPL' in body['text']
+
+def test_line_digest_is_a_carousel_capped_at_twelve_bubbles(monkeypatch):
+    messages = [_signal(f'SYM{i}') for i in range(15)] + [_signal('SYM0')]
+    fake, _, _ = asyncio.run(_run(monkeypatch, {}, messages, channels=('line',), coalesce=COALESCE))
+    [body] = fake.bodies('ln')
+    contents = body['messages'][0]['contents']
+    assert contents['type'] == 'carousel'
+    bubbles = contents['contents']
+    assert len(bubbles) == 12
+    titles = [bubble['body']['contents'][0]['text'] for bubble in bubbles]
+    assert titles[0] == 'SYM0 BUY (x2)'
+    assert titles[-1] == '其他 4 則'
+
+def test_urgent_priority_bypasses_coalescing(monkeypatch):
+    messages = [_signal('AAPL', priority='urgent'), _signal('TSLA', priority='urgent'),
+                _signal('MSFT'), _signal('NVDA')]
+    fake, _, _ = asyncio.run(_run(monkeypatch, {}, messages, coalesce=COALESCE))
+    texts = [body['text'] for body in fake.bodies('tg')]
+    assert len(texts) == 3
+    assert 'BUY AAPL' in texts[0] and 'BUY TSLA' in texts[1]
+    assert '交易提醒摘要 (2 則)' in texts[2]
+
+def test_stop_without_drain_cancels_coalesce_timers(monkeypatch):
+    monkeypatch.setitem(CONFIG['notifications'], 'coalesce', COALESCE)
+
+    async def run():
+        notifications = NotificationSystem(num_workers=1, db=FakeDeadLetters())
+        await notifications.send_notification('user', _signal('AAPL'), ['telegram', 'line'])
+        timers = list(notifications._coalesce_timers.values())
+        assert len(timers) == 2
+        await notifications.stop(drain=False)
+        assert all(timer.cancelled() for timer in timers)
+        assert notifications._coalesce_buffers == {} and notifications.notification_queue.empty()
+        assert [task for task in asyncio.all_tasks() if task is not asyncio.current_task()] == []
+
+    asyncio.run(run())
+
+def test_smtp_error_classification():
+    import smtplib
+    transient = NotificationSystem._is_transient_smtp_error
+    assert transient(smtplib.SMTPServerDisconnected('idle timeout'))
+    assert transient(smtplib.SMTPResponseException(421, b'try later'))
+    assert transient(smtplib.SMTPRecipientsRefused({'a@x': (450, b'mailbox busy')}))
+    assert transient(ConnectionRefusedError())
+    assert transient(TimeoutError())
+    assert not transient(smtplib.SMTPRecipientsRefused({'a@x': (550, b'no such user'), 'b@x': (450, b'busy')}))
+    assert not transient(smtplib.SMTPResponseException(554, b'rejected'))
+    assert not transient(smtplib.SMTPNotSupportedError('no STARTTLS'))
+    assert not transient(smtplib.SMTPAuthenticationError(535, b'bad credentials'))
@@ -0,0 +1,77 @@
+"""向量化風險分析與 pandas 參考實現一致"""
+import numpy as np
+import pandas as pd
+
+import risk_analytics
+from seo_optimizer import AdvancedTradingBot
+
+def _prices(n=600, n_assets=3, seed=7):
+    rng = np.random.default_rng(seed)
+    returns = rng.normal(0.0003, 0.02, size=(n, n_assets))
+    # 中段加入一次大跌，使最大回撤落在早於最近252根的高點
+    returns[200:260] -= 0.01
+    return pd.DataFrame(100 * np.cumprod(1 + returns, axis=0),
+                        index=pd.date_range('2020-01-01', periods=n, freq='D'),
+                        columns=[f'A{i}' for i in range(n_assets)])
+
+def test_rolling_volatility_and_sharpe_match_pandas():
+    returns = _prices().pct_change()
+    expected_vol = returns.rolling(20).std() * np.sqrt(252)
+    pd.testing.assert_frame_equal(risk_analytics.rolling_volatility(returns, 20), expected_vol, atol=1e-10)
+
+    excess = returns - 0.02 / 252
+    expected_sharpe = np.sqrt(252) * excess.rolling(60).mean() / excess.rolling(60).std()
+    pd.testing.assert_frame_equal(risk_analytics.rolling_sharpe(returns, 60), expected_sharpe, atol=1e-8)
+
+def test_rolling_historical_var_matches_pandas():
+    returns = _prices().pct_change()
+    window, k = 100, 5
+    var, cvar = risk_analytics.rolling_historical_var(returns, window, confidence=0.95)
+    expected_var = returns.rolling(window).apply(lambda w: -np.sort(w)[:k].max(), raw=True)
+    expected_cvar = returns.rolling(window).apply(lambda w: -np.sort(w)[:k].mean(), raw=True)
+    pd.testing.assert_frame_equal(var, expected_var, atol=1e-12)
+    pd.testing.assert_frame_equal(cvar, expected_cvar, atol=1e-12)
+
+def test_rolling_risk_state_snapshot_matches_pandas():
+    prices = _prices()
+    window = 252
+    state = risk_analytics.RollingRiskState(prices.shape[1], window=window)
+    for row in prices.to_numpy():
+        state.update(row)
+    snapshot = state.snapshot()
+
+    recent = prices.pct_change().iloc[-window:]
+    np.testing.assert_allclose(snapshot['volatility'], recent.std() * np.sqrt(252), rtol=1e-8)
+    excess = recent - 0.02 / 252
+    np.testing.assert_allclose(snapshot['sharpe_ratio'], np.sqrt(252) * excess.mean() / excess.std(), rtol=1e-6)
+    k = int(np.floor(0.05 * window))
+    np.testing.assert_allclose(snapshot['historical_var'], -np.sort(recent.to_numpy(), axis=0)[k - 1])
+    # 回撤從第一筆價格開始累計
+    peak = prices.cummax()
+    np.testing.assert_allclose(snapshot['max_drawdown'], (prices / peak - 1).min(), rtol=1e-10)
+    np.testing.assert_allclose(snapshot['drawdown'], (prices / peak - 1).iloc[-1], rtol=1e-10)
+
+def test_rolling_max_drawdown_matches_pandas():
+    prices = _prices()
+    rolling_max = prices.rolling(252, min_periods=1).max()
+    expected = (prices / rolling_max - 1).rolling(252, min_periods=1).min()
+    pd.testing.assert_frame_equal(risk_analytics.rolling_max_drawdown(prices), expected, atol=1e-12)
+
+def test_calculate_risk_metrics_matches_baseline_definition():
+    df = _prices(n_assets=1).rename(columns={'A0': 'Close'})
+    metrics = AdvancedTradingBot(10000).calculate_risk_metrics(df)
+
+    returns = df['Close'].pct_change()
+    excess = returns - 0.02 / 252
+    rolling_max = df['Close'].rolling(252, min_periods=1).max()
+    max_drawdown = (df['Close'] / rolling_max - 1).rolling(252, min_periods=1).min().iloc[-1]
+    assert np.isclose(metrics['volatility'], returns.rolling(20).std().iloc[-1] * np.sqrt(252))
+    assert np.isclose(metrics['sharpe_ratio'], np.sqrt(252) * excess.mean() / excess.std())
+    assert np.isclose(metrics['max_drawdown'], max_drawdown)
+    # 最近252根之前的高點仍計入回撤
+    recent_only = (df['Close'].iloc[-252:] / df['Close'].iloc[-252:].cummax() - 1).min()
+    assert metrics['max_drawdown'] < recent_only
+
+def test_calculate_risk_metrics_short_frame_is_nan():
+    metrics = AdvancedTradingBot(10000).calculate_risk_metrics(pd.DataFrame({'Close': [100.0]}))
+    assert all(np.isnan(value) for value in metrics.values())
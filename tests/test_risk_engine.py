@@ -0,0 +1,123 @@
+"""下單前風控：各項限額的接受/拒絕，成交後增量聚合與已實現盈虧在部分平倉後保持一致"""
+from datetime import date, timedelta
+
+import numpy as np
+import pytest
+
+from risk_engine import PreTradeRiskEngine, asset_class
+
+NO_LIMITS = {
+    'max_symbol_notional': None,
+    'max_asset_class_notional': None,
+    'max_gross_notional': None,
+    'max_open_positions': None,
+    'max_daily_loss': None
+}
+
+def _engine(**user_limits):
+    return PreTradeRiskEngine(user_limits={**NO_LIMITS, **user_limits}, global_limits={'max_gross_notional': None})
+
+@pytest.mark.parametrize('limits, fills, order, reason', [
+    # 單一標的敞口：已有 8000，再買 3000 超過 10000
+    ({'max_symbol_notional': 10000}, [('AAPL', 'BUY', 80, 100)], ('AAPL', 'BUY', 30, 100), 'user_symbol_notional'),
+    # 資產類別敞口：股票合計超過 15000
+    ({'max_asset_class_notional': {'stock': 15000}}, [('AAPL', 'BUY', 100, 100)],
+     ('MSFT', 'BUY', 60, 100), 'user_asset_class_notional'),
+    ({'max_gross_notional': 12000}, [('AAPL', 'BUY', 100, 100)], ('BTC/USDT', 'BUY', 1, 3000), 'user_gross_notional'),
+    ({'max_open_positions': 1}, [('AAPL', 'BUY', 1, 100)], ('MSFT', 'BUY', 1, 100), 'max_open_positions'),
+    # 當日已實現虧損 1000 達到上限
+    ({'max_daily_loss': 1000}, [('AAPL', 'BUY', 100, 100), ('AAPL', 'SELL', 100, 90)],
+     ('MSFT', 'BUY', 1, 100), 'daily_loss_limit'),
+    # 止損距離 5% 上的風險 600 超過 10000 × 5%
+    ({'equity': 10000, 'risk_per_trade': 0.05}, [], ('AAPL', 'BUY', 120, 100), 'risk_per_trade'),
+])
+def test_check_order_rejects_each_limit(limits, fills, order, reason):
+    engine = _engine(**limits)
+    for symbol, side, quantity, price in fills:
+        engine.on_fill('user-1', symbol, side, quantity, price)
+    symbol, side, quantity, price = order
+    assert engine.check_order('user-1', symbol, side, quantity, price) == (False, reason)
+    # 縮小到限額以內即接受
+    assert engine.check_order('user-1', symbol, side, quantity / 100, price) == (
+        (False, reason) if reason in ('max_open_positions', 'daily_loss_limit') else (True, None)
+    )
+    # 其他用戶不受影響
+    assert engine.check_order('user-2', symbol, side, quantity / 100, price) == (True, None)
+
+def test_global_limits_apply_across_users():
+    engine = PreTradeRiskEngine(user_limits=NO_LIMITS, global_limits={'max_symbol_notional': 15000})
+    engine.on_fill('user-1', 'AAPL', 'BUY', 100, 100)
+    assert engine.check_order('user-2', 'AAPL', 'BUY', 60, 100) == (False, 'global_symbol_notional')
+    assert engine.check_order('user-2', 'AAPL', 'BUY', 40, 100) == (True, None)
+    assert engine.check_order('user-2', 'MSFT', 'BUY', 60, 100) == (True, None)
+
+def test_reducing_orders_are_always_accepted():
+    engine = _engine(max_symbol_notional=5000, max_daily_loss=100)
+    engine.on_fill('user-1', 'AAPL', 'BUY', 100, 100)
+    engine.on_fill('user-1', 'AAPL', 'SELL', 10, 50)
+    assert engine.exposure('user-1')['daily_loss'] == 500
+    # 已超出敞口與當日虧損限額，減倉仍接受，反向開倉超出部分則拒絕
+    assert engine.check_order('user-1', 'AAPL', 'SELL', 50, 100) == (True, None)
+    assert engine.check_order('user-1', 'AAPL', 'BUY', 1, 100) == (False, 'daily_loss_limit')
+    assert engine.check_order('user-1', 'AAPL', 'BUY', 0, 100) == (False, 'invalid_order')
+
+def test_on_fill_realized_pnl_through_partial_closes_and_reversal():
+    engine = _engine()
+    assert engine.on_fill('user-1', 'AAPL', 'BUY', 10, 100) == 0.0
+    assert engine.on_fill('user-1', 'AAPL', 'BUY', 10, 110) == 0.0
+    assert engine.positions[('user-1', 'AAPL')] == [20, 105.0]
+    # 部分平倉按均價計盈虧，剩餘持倉均價不變
+    assert engine.on_fill('user-1', 'AAPL', 'SELL', 5, 120) == 75.0
+    assert engine.positions[('user-1', 'AAPL')] == [15, 105.0]
+    assert engine.exposure('user-1')['gross_notional'] == 1575.0
+    # 反向：平掉 15 並以成交價開空 5
+    assert engine.on_fill('user-1', 'AAPL', 'SELL', 20, 90) == -225.0
+    assert engine.positions[('user-1', 'AAPL')] == [-5, 90.0]
+    assert engine.exposure('user-1')['gross_notional'] == 450.0
+    assert engine.on_fill('user-1', 'AAPL', 'BUY', 5, 80) == 50.0
+
+    exposure = engine.exposure('user-1')
+    assert ('user-1', 'AAPL') not in engine.positions
+    assert exposure['open_positions'] == 0
+    assert exposure['gross_notional'] == pytest.approx(0.0, abs=1e-9)
+    assert exposure['realized_pnl'] == -100.0
+    assert exposure['daily_loss'] == 100.0
+
+def test_daily_loss_resets_on_a_new_day():
+    engine = _engine(max_daily_loss=50)
+    engine.daily_pnl['user-1'] = (date.today() - timedelta(days=1), -1000.0)
+    assert engine.exposure('user-1')['daily_loss'] == 0.0
+    assert engine.check_order('user-1', 'AAPL', 'BUY', 1, 100) == (True, None)
+
+def test_incremental_aggregates_match_recomputation():
+    rng = np.random.default_rng(11)
+    engine = _engine()
+    users = ['user-1', 'user-2', 'user-3']
+    symbols = ['AAPL', 'MSFT', 'BTC/USDT', 'ES=F']
+    realized = {user: 0.0 for user in users}
+    for _ in range(2_000):
+        user, symbol = rng.choice(users), rng.choice(symbols)
+        side = rng.choice(['BUY', 'SELL'])
+        realized[user] += engine.on_fill(user, symbol, side, float(rng.integers(1, 20)), float(rng.uniform(50, 150)))
+
+    # 以持倉表從頭重算全部聚合值
+    notional = {key: abs(qty) * price for key, (qty, price) in engine.positions.items()}
+    assert engine.user_symbol_notional == pytest.approx(notional)
+    for user in users:
+        mine = {key: value for key, value in notional.items() if key[0] == user}
+        exposure = engine.exposure(user)
+        assert exposure['gross_notional'] == pytest.approx(sum(mine.values()))
+        assert exposure['open_positions'] == len(mine)
+        assert exposure['realized_pnl'] == pytest.approx(realized[user])
+        for cls in ('stock', 'crypto', 'futures'):
+            expected = sum(value for (_, symbol), value in mine.items() if asset_class(symbol) == cls)
+            assert exposure['asset_class_notional'].get(cls, 0.0) == pytest.approx(expected, abs=1e-6)
+    for symbol in symbols:
+        expected = sum(value for (_, s), value in notional.items() if s == symbol)
+        assert engine.symbol_notional.get(symbol, 0.0) == pytest.approx(expected, abs=1e-6)
+    assert engine.gross_notional == pytest.approx(sum(notional.values()))
+
+    # 檢查點恢復後聚合值一致
+    restored = PreTradeRiskEngine(user_limits=NO_LIMITS)
+    restored.set_state(engine.get_state())
+    assert restored.exposure('user-1') == engine.exposure('user-1')
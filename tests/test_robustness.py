@@ -0,0 +1,16 @@
+"""穩健性模擬的可重現性測試"""
+import numpy as np
+
+import robustness
+
+def test_same_seed_is_independent_of_worker_count(monkeypatch):
+    monkeypatch.setattr(robustness, '_PARALLEL_THRESHOLD', 0)
+    returns = np.random.default_rng(0).normal(0, 0.01, 250)
+    runs = [
+        robustness.simulate(returns, 'block_bootstrap', 2500, turnover=np.abs(returns), slippage=0.001,
+                            seed=1, workers=workers, return_samples=True)
+        for workers in (1, 2, 3)
+    ]
+    for run in runs[1:]:
+        for key, values in runs[0]['samples'].items():
+            np.testing.assert_array_equal(values, run['samples'][key])
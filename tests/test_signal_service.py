@@ -0,0 +1,78 @@
+"""信號服務：背景重訓不阻塞請求"""
+import asyncio
+import threading
+import time
+
+import pandas as pd
+from sklearn.ensemble import RandomForestClassifier
+
+from benchmarks.synthetic import SyntheticFetcher
+from market_data_cache import MarketDataCache
+from market_replay import SimulatedClock
+from signal_service import SignalService
+
+class GatedForest(RandomForestClassifier):
+    """fit 會等待 release 事件，模擬耗時的重訓"""
+    release = threading.Event()
+
+    def fit(self, X, y, sample_weight=None):
+        GatedForest.release.wait(10)
+        return super().fit(X, y, sample_weight)
+
+def test_requests_are_not_blocked_by_retraining():
+    async def run():
+        service = SignalService(MarketDataCache(fetcher=SyntheticFetcher()))
+        service.bot.ml_model = GatedForest(n_estimators=10)
+        try:
+            start = time.perf_counter()
+            first = await service.get_signals(['SYM0000', 'SYM0001'])
+            waited = time.perf_counter() - start
+            # 模型尚未訓練完成：已返回規則信號，預測為空
+            assert first['SYM0000']['prediction']['probability'] is None
+            assert waited < 5
+
+            GatedForest.release.set()
+            await service.wait_for_training()
+            scored = await service.get_signals(['SYM0000'])
+            assert scored['SYM0000']['prediction']['probability'] is not None
+        finally:
+            GatedForest.release.set()
+            await service.stop()
+
+    asyncio.run(run())
+
+def test_cached_responses_expire_at_bar_close_and_on_model_swap():
+    fetcher = SyntheticFetcher()
+
+    async def run():
+        last_bar = (await fetcher.get_historical_data('SYM0000')).index[-1]
+        clock = SimulatedClock(last_bar + pd.Timedelta(hours=12))
+        market_cache = MarketDataCache(fetcher=fetcher)
+        service = SignalService(market_cache, clock=clock)
+        service.bot.ml_model = RandomForestClassifier(n_estimators=5)
+        try:
+            await service.get_signals(['SYM0000'])
+            # 首個模型就緒後模型版本改變，舊回應失效
+            await service.wait_for_training()
+            assert service.model_version == 1
+            await service.get_signals(['SYM0000'])
+            assert service.cache_hits == 0
+
+            # K線收盤前即使行情緩存過期也命中緩存
+            market_cache._fetched_at.clear()
+            await service.get_signals(['SYM0000'])
+            assert service.cache_hits == 1
+
+            # 收盤後行情緩存已過期：重取並重新評分，之後在緩存新鮮期內命中
+            await clock.advance_to(last_bar + pd.Timedelta(days=1))
+            await service.get_signals(['SYM0000'])
+            assert service.cache_hits == 1
+            await service.get_signals(['SYM0000'])
+            assert service.cache_hits == 2
+            market_cache._fetched_at.clear()
+            await service.get_signals(['SYM0000'])
+            assert service.cache_hits == 2
+        finally:
+            await service.stop()
+
+    asyncio.run(run())